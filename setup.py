@@ -88,6 +88,9 @@ if __name__ == "__main__":
             'console_scripts': [
                 'veles=veles.__main__:__run__',
                 'compare_snapshots=veles.scripts.compare_snapshots:main',
+                'veles_image_cache=veles.scripts.image_cache:main',
+                'veles_convert_minibatches='
+                'veles.scripts.convert_minibatches:main',
                 'bboxer=veles.scripts.bboxer:main',
                 'generate_veles_frontend=veles.scripts.generate_frontend:main',
                 'veles_graphics_client=veles.graphics_client:main']
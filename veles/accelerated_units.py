@@ -47,18 +47,17 @@ except (ImportError, AttributeError):
 import numpy
 import os
 import re
-from six import BytesIO, add_metaclass, PY3
-import tarfile
+from six import add_metaclass
 from tempfile import NamedTemporaryFile
 import time
 from zope.interface import implementer, Interface
 
 from veles.compat import from_none
 from veles.config import root
+import veles.kernel_cache as kernel_cache
 from veles.memory import Array, roundup
 import veles.opencl_types as opencl_types
 from veles.backends import Device, OpenCLDevice, CUDADevice, NumpyDevice
-from veles.pickle2 import pickle, best_protocol
 from veles.timeit2 import timeit
 from veles.units import Unit, IUnit, UnitCommandLineArgumentsRegistry
 from veles.workflow import Workflow
@@ -308,19 +307,39 @@ class AcceleratedUnit(Unit):
         return self._backend_build_program_(
             defines, cache_file_name, dtype, kwargs)
 
-    def _load_binary(self, defines, cache_file_name, dtype, engine, suffix,
-                     cache_is_valid, template_kwargs):
-        cache_file_name = "%s.%s.%d" % (cache_file_name, suffix, (2, 3)[PY3])
-        if not os.path.isabs(cache_file_name):
-            cache_file_name = os.path.join(root.common.dirs.cache,
-                                           cache_file_name)
-        cache_file_name = "%s.cache" % cache_file_name
-        if self.cache and os.path.exists(cache_file_name):
-            return self._load_from_cache(
-                cache_file_name, defines, dtype, engine, suffix,
-                cache_is_valid, template_kwargs)
-        else:
-            return None, defines
+    def _load_binary(self, defines, dtype, engine, suffix, device_id,
+                     template_kwargs):
+        """Generates the program source and looks up the binaries built from
+        it in the kernel cache (see :class:`veles.kernel_cache.KernelCache`).
+
+        Returns:
+            (binaries or None, source, defines, cache key or None).
+        """
+        source, my_defines = self._generate_source(
+            defines, self._get_include_dirs(engine), dtype, suffix,
+            template_kwargs)
+        if not self.cache:
+            return None, source, my_defines, None
+        cache = kernel_cache.get()
+        try:
+            key = cache.key(source, [
+                cache.read_file(dep)[0]
+                for dep in set(self._scan_include_dependencies(suffix))],
+                device_id, my_defines)
+        except Exception as e:
+            self.warning("Failed to calculate the cache key: %s", e)
+            return None, source, my_defines, None
+        entry = cache.get(key)
+        if entry is None:
+            return None, source, my_defines, key
+        bins = entry.get("binaries")
+        if entry.get("device") != device_id or (
+                not isinstance(bins, bytes) and (
+                    not isinstance(bins, list) or len(bins) == 0 or
+                    not all(isinstance(b, bytes) for b in bins))):
+            self.warning("Cached binaries have an invalid format")
+            return None, source, my_defines, key
+        return bins, source, my_defines, key
 
     def ocl_build_program(self, defines, cache_file_name, dtype,
                           template_kwargs):
@@ -328,23 +347,16 @@ class AcceleratedUnit(Unit):
 
         `program_` will be initialized to the resulting program object.
         """
-
-        def cache_is_valid(cache):
-            dev = self.device.queue_.device
-            return any((dev.name, dev.platform.name, dev.driver_version) == did
-                       for did in cache["devices"])
-
-        binaries, my_defines = self._load_binary(
-            defines, cache_file_name, dtype, OCL, OCLS, cache_is_valid,
-            template_kwargs)
+        dev = self.device.queue_.device
+        device_id = dev.name, dev.platform.name, dev.driver_version
+        binaries, source, my_defines, key = self._load_binary(
+            defines, dtype, OCL, OCLS, device_id, template_kwargs)
         if binaries is not None:
             self.program_ = self.device.queue_.context.create_program(
                 binaries, binary=True)
             self._log_about_cache(cache_file_name, OCL)
             return my_defines
         include_dirs = self._get_include_dirs(OCL)
-        source, my_defines = self._generate_source(
-            defines, include_dirs, dtype, OCLS, template_kwargs)
         show_logs = self.logger.isEnabledFor(logging.DEBUG)
         if show_logs:
             self.debug("%s: source code\n%s\n%s", cache_file_name, "-" * 80,
@@ -367,12 +379,8 @@ class AcceleratedUnit(Unit):
                 if not s:
                     continue
                 self.debug("Non-empty OpenCL build log encountered: %s", s)
-        self._save_to_cache(
-            cache_file_name, OCLS, self.program_.source,
-            self.program_.binaries, {
-                "devices": [(d.name, d.platform.name, d.driver_version)
-                            for d in self.program_.devices]
-            })
+        self._save_to_cache(key, "%s.%s" % (cache_file_name, OCLS),
+                            self.program_.binaries, device_id)
         return my_defines
 
     def cuda_build_program(self, defines, cache_file_name, dtype,
@@ -381,20 +389,14 @@ class AcceleratedUnit(Unit):
 
         `program_` will be initialized to the resulting program object.
         """
-
-        def cache_is_valid(cache):
-            return self.device.context.device.name == cache["device"]
-
-        binaries, my_defines = self._load_binary(
-            defines, cache_file_name, dtype, CUDA, CUDAS, cache_is_valid,
-            template_kwargs)
+        device_id = self.device.context.device.name
+        binaries, source, my_defines, key = self._load_binary(
+            defines, dtype, CUDA, CUDAS, device_id, template_kwargs)
         if binaries is not None:
             self.program_ = self.device.context.create_module(ptx=binaries)
             self._log_about_cache(cache_file_name, CUDA)
             return my_defines
         include_dirs = self._get_include_dirs(CUDA)
-        source, my_defines = self._generate_source(
-            defines, include_dirs, dtype, CUDAS, template_kwargs)
         show_logs = self.logger.isEnabledFor(logging.DEBUG)
         if show_logs:
             self.debug("%s: source code\n%s\n%s", cache_file_name, "-" * 80,
@@ -413,14 +415,18 @@ class AcceleratedUnit(Unit):
         if show_logs and len(self.program_.stderr):
             self.debug("Non-empty CUDA build log encountered: %s",
                        self.program_.stderr)
-        self._save_to_cache(cache_file_name, CUDAS, source.encode("utf-8"),
-                            self.program_.ptx,
-                            {"device": self.device.context.device.name})
+        self._save_to_cache(key, "%s.%s" % (cache_file_name, CUDAS),
+                            self.program_.ptx, device_id)
         return my_defines
 
     def _log_about_cache(self, cache_name, engine):
         self.debug('Used cached %s for engine "%s"', cache_name, engine)
 
+    def _save_to_cache(self, key, name, program_binaries, device_id):
+        if key is not None:
+            kernel_cache.get().put(key, {
+                "binaries": program_binaries, "device": device_id}, name)
+
     def ocl_get_kernel(self, name):
         return self.program_.get_kernel(name)
 
@@ -586,8 +592,7 @@ class AcceleratedUnit(Unit):
         while len(pending):
             current = pending.pop(0)
             try:
-                with open(current, "rb") as fr:
-                    contents = fr.read()
+                contents = kernel_cache.get().read_file(current)[1]
             except:
                 self.exception("Failed to read %s", current)
                 raise
@@ -602,76 +607,6 @@ class AcceleratedUnit(Unit):
                 res.append(full)
         return res
 
-    def _load_from_cache(self, cache_file_name, defines, dtype, engine, suffix,
-                         cache_is_valid, template_kwargs):
-        include_dirs = self._get_include_dirs(engine)
-        try:
-            with tarfile.open(cache_file_name, "r:gz") as tar:
-                cached_source = tar.extractfile("source." + suffix).read()
-                src, my_defines = self._generate_source(
-                    defines, include_dirs, dtype, suffix, template_kwargs)
-                real_source = src.encode("utf-8")
-                if cached_source != real_source:
-                    return None, None
-                for dep in set(self._scan_include_dependencies(suffix)):
-                    cached_source = tar.extractfile(
-                        os.path.basename(dep)).read()
-                    with open(dep, "rb") as fr:
-                        real_source = fr.read()
-                    if cached_source != real_source:
-                        return None, None
-                cache = pickle.loads(tar.extractfile(
-                    "binaries.%d.pickle" % best_protocol).read())
-                if not cache_is_valid(cache):
-                    return None, None
-                bins = cache["binaries"]
-                if not isinstance(bins, bytes) and (
-                        not isinstance(bins, list) or len(bins) == 0 or
-                        not all(isinstance(b, bytes) for b in bins)):
-                    self.warning("Cached binaries have an invalid format")
-                    return None, None
-                return bins, my_defines
-        except Exception as e:
-            self.debug("Failed to load %s: %s", cache_file_name, e)
-            return None, None
-
-    def _save_to_cache(self, cache_file_name, suffix, program_source,
-                       program_binaries, device_id_dict):
-        naked_suffix = suffix
-        suffix = "." + suffix
-        cache_file_name = cache_file_name + suffix + (".3" if PY3 else ".2")
-        if not os.path.isabs(cache_file_name):
-            cache_file_name = os.path.join(root.common.dirs.cache,
-                                           cache_file_name)
-        try:
-            with tarfile.open("%s.cache" % cache_file_name, "w:gz") as tar:
-                source_io = BytesIO()
-                source_io.write(program_source)
-                ti = tarfile.TarInfo("source" + suffix)
-                ti.size = source_io.tell()
-                ti.mode = int("666", 8)
-                source_io.seek(0)
-                tar.addfile(ti, fileobj=source_io)
-                for dep in set(self._scan_include_dependencies(naked_suffix)):
-                    ti = tarfile.TarInfo(os.path.basename(dep))
-                    ti.size = os.path.getsize(dep)
-                    ti.mode = int("666", 8)
-                    with open(dep, "rb") as fr:
-                        tar.addfile(ti, fileobj=fr)
-                binaries_io = BytesIO()
-                pickler = pickle.Pickler(binaries_io, protocol=best_protocol)
-                binaries = {"binaries": program_binaries}
-                binaries.update(device_id_dict)
-                pickler.dump(binaries)
-                ti = tarfile.TarInfo("binaries.%d.pickle" % best_protocol)
-                ti.size = binaries_io.tell()
-                ti.mode = int("666", 8)
-                binaries_io.seek(0)
-                tar.addfile(ti, fileobj=binaries_io)
-        except:
-            self.exception("Failed to save the cache file %s:",
-                           cache_file_name)
-
     def _with_backend_init(self, fn):
         def wrapped_backend_init(device, **kwargs):
             result = fn(device, **kwargs)
@@ -860,6 +795,8 @@ class AcceleratedWorkflow(Workflow):
     def initialize(self, device, **kwargs):
         super(AcceleratedWorkflow, self).initialize(device=device, **kwargs)
         self.device = device
+        if self.is_main:
+            kernel_cache.get().print_stats()
 
     def filter_unit_graph_attrs(self, val):
         return (not isinstance(val, Device) and
@@ -35,6 +35,7 @@ under the License.
 """
 
 import argparse
+from collections import deque
 from copy import copy
 import datetime
 import json
@@ -53,7 +54,8 @@ from veles.config import root
 import veles.error as error
 import veles.external.fysom as fysom
 from veles.external.prettytable import PrettyTable
-from veles.txzmq import ZmqConnection, ZmqEndpoint, SharedIO
+from veles.txzmq import ZmqConnection, ZmqEndpoint, SharedIOChannel, \
+    AdaptiveCompression
 from veles.network_common import NetworkAgent, StringLineReceiver, IDLogger
 from veles.prng import get as get_rg
 from veles.thread_pool import errback
@@ -67,21 +69,26 @@ class ZmqDealer(ZmqConnection):
         'job':
         lambda self, message: self.host.job_received(message),
         'update':
-        lambda self, message: self.host.update_result_received(message),
+        lambda self, message: self.update_result_received(message),
         'error':
         lambda self, message: self.host.disconnect(message)
     }
 
-    RESERVE_SHMEM_SIZE = 0.05
-
-    def __init__(self, nid, host, endpoint):
+    def __init__(self, nid, host, endpoint, use_shmem=False):
         super(ZmqDealer, self).__init__((endpoint,))
         self.id = nid.encode('charmap')
         self.host = host
         self.is_ipc = endpoint.address.startswith('ipc://')
-        self.shmem = None
+        # the master tells whether it reads the updates from shared memory
+        self.shmem = SharedIOChannel("veles-update-" + nid) \
+            if use_shmem and self.is_ipc else None
+        # the number of the updates which the master has not confirmed yet
+        self._updates_in_flight = 0
         self.pickles_compression = root.common.engine.network_compression \
             if not self.is_ipc else None
+        self.pickles_out_of_band = root.common.engine.network_out_of_band
+        self.compression = AdaptiveCompression(logger=self.logger) \
+            if self.pickles_compression == "adaptive" else None
         self._request_timings = {}
         self._command = None
         self._command_str = None
@@ -137,28 +144,39 @@ class ZmqDealer(ZmqConnection):
 
     def request(self, command, message=b''):
         self.event("ZeroMQ", "begin", dir="send", command=command, height=0.5)
-        if self.shmem is not None and command == 'update':
-            self.shmem.seek(0)
+        shmem = self.shmem if command == 'update' else None
+        if shmem is not None and self._updates_in_flight > 0:
+            # A prefetched job has finished before the master confirmed the
+            # previous update. The master may not have read that update
+            # from the segment yet, so this one goes through the socket.
+            shmem = None
+        io = shmem.acquire() if shmem is not None else None
+        io_overflow = False
         try:
             pickles_size, delta = timeit(
                 self.send,
                 self.id, command.encode('charmap'), message,
-                io=self.shmem,
-                pickles_compression=self.pickles_compression)
+                io=io, pickles_compression=self.compression or
+                self.pickles_compression,
+                out_of_band=self.pickles_out_of_band)
             if command not in self._request_timings:
                 self._request_timings[command] = (0.0, 0)
             self._request_timings[command] = (
                 self._request_timings[command][0] + delta,
                 self._request_timings[command][1] + 1)
-        except ZmqConnection.IOOverflow:
-            self.shmem = None
-            return
-        if self.is_ipc and command == 'update' and self.shmem is None:
-            self.shmem = SharedIO(
-                "veles-update-" + self.id.decode('charmap'),
-                int(pickles_size * (1.0 + ZmqDealer.RESERVE_SHMEM_SIZE)))
+        except ZmqConnection.IOOverflow as e:
+            pickles_size = e.size
+            io_overflow = True
+        if shmem is not None:
+            shmem.commit(pickles_size, io_overflow)
+        if command == 'update':
+            self._updates_in_flight += 1
         self.event("ZeroMQ", "end", dir="send", command=command, height=0.5)
 
+    def update_result_received(self, result):
+        self._updates_in_flight -= 1
+        self.host.update_result_received(result)
+
 
 class VelesProtocol(StringLineReceiver, IDLogger):
     """A communication controller from client to server.
@@ -184,10 +202,18 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             {'name': 'send_id', 'src': 'INIT', 'dst': 'WAIT'},
             {'name': 'request_job', 'src': ['WAIT', 'POSTPONED'],
                                     'dst': 'GETTING_JOB'},
-            {'name': 'obtain_job', 'src': 'GETTING_JOB', 'dst': 'BUSY'},
+            {'name': 'request_job', 'src': 'BUSY', 'dst': 'PREFETCHING'},
+            {'name': 'obtain_job', 'src': ['GETTING_JOB', 'PREFETCHING'],
+                                   'dst': 'BUSY'},
             {'name': 'refuse_job', 'src': 'GETTING_JOB', 'dst': 'END'},
+            # finish the running and the queued jobs before ending
+            {'name': 'refuse_job', 'src': 'PREFETCHING', 'dst': 'DRAINING'},
             {'name': 'postpone_job', 'src': 'GETTING_JOB', 'dst': 'POSTPONED'},
+            {'name': 'postpone_job', 'src': 'PREFETCHING', 'dst': 'BUSY'},
             {'name': 'complete_job', 'src': 'BUSY', 'dst': 'WAIT'},
+            {'name': 'complete_job', 'src': 'PREFETCHING',
+                                     'dst': 'GETTING_JOB'},
+            {'name': 'complete_job', 'src': 'DRAINING', 'dst': 'END'},
         ],
         'callbacks': {
             'onchangestate': onFSMStateChanged
@@ -208,6 +234,7 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self._last_update = None
         self.state = host.state
         self._current_deferred = None
+        self._jobs = deque()
         self._power_upload_time = 0
         self._power_upload_threshold = 60
         self.rand = get_rg()
@@ -264,7 +291,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 self.request_id()
                 return
             self.host.zmq_connection = self.zmq_connection = ZmqDealer(
-                cid, self, ZmqEndpoint("connect", endpoint))
+                cid, self, ZmqEndpoint("connect", endpoint),
+                use_shmem=msg.get("shmem", False))
             self.info("Connected to ZeroMQ endpoint %s", endpoint)
             data = msg.get('data')
             if data is not None:
@@ -280,25 +308,41 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             # False, None or empty string mean job refusal
             self.info("Job was refused")
             self.state.refuse_job()
+            if self.state.current == "DRAINING":
+                self.info("Finishing the running job and %d queued ones",
+                          len(self._jobs))
+                return
         elif job == b"NEED_UPDATE":
             self.debug("Master returned NEED_UPDATE, will repeat the job "
                        "request in update_result_received()")
             self.state.postpone_job()
         else:
+            busy = self.state.current == "PREFETCHING"
             try:
                 self.state.obtain_job()
             except fysom.FysomError as e:
                 self.warning("Job was received too late or too early: %s", e)
                 return
-        update = self._last_update
-        if self.host.async and update is not None:
-            self.request_update()
-        if job == b"NEED_UPDATE":
+            if busy:
+                self._jobs.append(job)
+                self.debug("Prefetched the job, %d are queued now",
+                           len(self._jobs))
+                self.prefetch_job()
+                return
+        if job and job != b"NEED_UPDATE":
+            self.start_job(job)
             return
+        if self.host.async and self._last_update is not None:
+            self.request_update()
         if not job:
             # No jobs are available => terminate itself
             self.host.launcher.stop()
-            return
+
+    def start_job(self, job):
+        self.host.stop_idling()
+        update = self._last_update
+        if self.host.async and update is not None:
+            self.request_update()
         try:
             if self.host.death_probability > 0 and \
                     self.rand.random() < self.host.death_probability:
@@ -316,6 +360,16 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                                self.job_finished)
         except:
             errback(Failure())
+            return
+        self.prefetch_job()
+
+    def prefetch_job(self):
+        """Requests the next job while the current one is being executed if
+        there are less than :attr:`Client.prefetch` jobs queued.
+        """
+        if self.state.current == "BUSY" and \
+                len(self._jobs) < self.host.prefetch:
+            self.request_job()
 
     def _set_deferred(self, f, *args, **kwargs):
         self._current_deferred = threads.deferToThreadPool(
@@ -331,11 +385,24 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         return self._current_deferred
 
     def job_finished(self, update):
-        if self.state.current != "BUSY":
+        if self.state.current not in ("BUSY", "PREFETCHING", "DRAINING"):
             self.error("job_finished: invalid state %s", self.state.current)
             return
         self._last_update = update
+        if self._jobs:
+            # prefetching implies the asynchronous mode
+            self.start_job(self._jobs.popleft())
+            return
+        if self.state.current == "DRAINING":
+            # update_result_received() stops the launcher
+            self.state.complete_job()
+            self.request_update()
+            return
+        self.host.start_idling()
         self.state.complete_job()
+        if self.state.current == "GETTING_JOB":
+            # the prefetch request is still in flight
+            return
         if self.host.async:
             self.request_job()
         else:
@@ -365,6 +432,7 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 'checksum': self.host.workflow.checksum,
                 'mid': self.host.mid,
                 'pid': self.host.pid,
+                'prefetch': self.host.prefetch,
                 "backend": self.host.workflow.device.backend_name,
                 "device": self.host.workflow.device.id,
                 "argv": sys.argv,
@@ -384,6 +452,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self.state.request_id()
 
     def request_job(self):
+        if self.state.current != "BUSY":
+            self.host.start_idling()
         self.state.request_job()
         self.zmq_connection.request("job")
 
@@ -413,8 +483,13 @@ class Client(NetworkAgent, ReconnectingClientFactory):
         super(Client, self).__init__(configuration, workflow)
         parser = Client.init_parser()
         args, _ = parser.parse_known_args(self.argv)
-        self._async = args.async_slave
+        self._prefetch = args.slave_prefetch
+        # the prefetched jobs are always executed asynchronously
+        self._async = args.async_slave or self._prefetch > 0
         self._death_probability = args.slave_death_probability
+        self._idle_time = 0.0
+        self._idle_since = None
+        self._start_time = None
         self._initial_data = None
         self.id = None
         self.state = fysom.Fysom(VelesProtocol.FSM_DESCRIPTION, self)
@@ -435,6 +510,12 @@ class Client(NetworkAgent, ReconnectingClientFactory):
                             help="Activate asynchronous master-slave protocol "
                             "(influences slaves only).", action='store_true') \
             .mode = ("master", "slave")
+        parser.add_argument("--slave-prefetch", type=int,
+                            default=kwargs.get("prefetch", 0),
+                            help="The number of jobs which each slave keeps "
+                            "queued while executing the current one. "
+                            "Implies --async-slave.") \
+            .mode = ("slave",)
         parser.add_argument("--slave-death-probability", type=float,
                             default=0.0,
                             help="Each slave will die with the probability "
@@ -450,10 +531,34 @@ class Client(NetworkAgent, ReconnectingClientFactory):
     def async(self):
         return self._async
 
+    @property
+    def prefetch(self):
+        return self._prefetch
+
     @property
     def death_probability(self):
         return self._death_probability
 
+    @property
+    def idle_time(self):
+        """The total time spent waiting for jobs, in seconds.
+        """
+        if self._idle_since is None:
+            return self._idle_time
+        return self._idle_time + time.time() - self._idle_since
+
+    def start_idling(self):
+        now = time.time()
+        if self._start_time is None:
+            self._start_time = now
+        if self._idle_since is None:
+            self._idle_since = now
+
+    def stop_idling(self):
+        if self._idle_since is not None:
+            self._idle_time += time.time() - self._idle_since
+            self._idle_since = None
+
     def initialize(self):
         super(Client, self).initialize()
         self._initial_data = self.workflow.generate_initial_data_for_master()
@@ -476,6 +581,17 @@ class Client(NetworkAgent, ReconnectingClientFactory):
         except KeyError:
             pass
         self.info("Timings:\n%s", table)
+        if self._start_time is not None:
+            idle_time = self.idle_time
+            self.info("Idle time: %s (%.1f%%), prefetch depth %d",
+                      datetime.timedelta(seconds=idle_time),
+                      idle_time * 100 / max(time.time() - self._start_time,
+                                            1e-6),
+                      self.prefetch)
+        compression = self.zmq_connection.compression
+        if compression is not None:
+            self.info("Compression of updates: %s, ratio %.2f",
+                      compression.codec or "none", compression.ratio)
 
     def startedConnecting(self, connector):
         self.info('Connecting to %s:%s...', self.address, self.port)
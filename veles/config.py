@@ -199,6 +199,11 @@ root.common.update({
         "misprints": False,
         "undefined_configs": False,
         "run": False,
+        # Record the calls of the unit methods and the events to the Chrome
+        # trace / Perfetto timeline (see veles/tracing.py)
+        "timeline": False,
+        "timeline_file": os.path.join(__home__, "timeline.%d.json"),  # pid
+        "timeline_buffer_size": 1 << 16,  # events per thread
     },
     "warnings": {
         "numba": True
@@ -260,9 +265,52 @@ root.common.update({
         # Disable Numba JIT while debugging or on alternative interpreters
         "disable_numba": (sys.gettrace() is not None or
                           platform.python_implementation() != "CPython"),
+        # None, "snappy", "gzip", "xz" or "adaptive" (chosen for each link)
         "network_compression": (None if  # snappy is slow on CPython
                                 platform.python_implementation() == "CPython"
                                 else "snappy"),
+        # Send big numpy arrays as separate ZeroMQ frames instead of pickling
+        # them, the receiver uses those frames without copying
+        "network_out_of_band": False,
+        # Lossy encoding of the float arrays in the slave updates:
+        # None, "fp16", "topk" or "int8" (see veles/update_codecs.py)
+        "update_codec": None,
+        "update_codec_min_size": 1 << 12,
+        "update_topk_ratio": 0.01,
+        # Seconds to gather the slave updates into a single batch before
+        # applying them (None disables the batching)
+        "update_aggregation_window": None,
+        # Hand out the minibatches which are late at the end of each class to
+        # the idle slaves once more and accept the first result
+        "speculative_execution": False,
+        # Seconds between the retries of the job requests which wait for the
+        # end of the class, so that the late minibatches are served
+        # speculatively (only with speculative_execution)
+        "job_requests_retry_interval": 1.0,
+        # Serve smaller minibatches to the slower slaves, in proportion to
+        # their measured throughput (or reported computing power)
+        "weighted_minibatches": False,
+        # Pickle the workflow in memory and compress and write the snapshots
+        # in the background instead of on the control flow thread
+        "async_snapshots": False,
+        # The maximal number of the snapshots which are written at once
+        "snapshots_in_flight": 1,
+        # Write the snapshots as directories with the big arrays in separate
+        # .npy files which are memory mapped on restore
+        "snapshot_separate_arrays": False,
+        "snapshot_segment_min_size": 1 << 16,
+        # Precompute the control flow of each workflow in initialize() (see
+        # Workflow.compile_plan())
+        "compiled_plan": False,
+        # Initialize the independent units (and build their programs) on the
+        # thread pool (see Workflow.initialization_dependencies())
+        "concurrent_initialize": False,
+        # The compiled programs, by the hash of their sources, includes,
+        # device and defines (see veles/kernel_cache.py)
+        "kernel_cache": {
+            "dir": os.path.join(__home__, "cache", "kernels"),
+            "max_size": 256 << 20,  # bytes
+        },
         "source_dirs": (os.environ.get("VELES_ENGINE_DIRS", "").split(":") +
                         ["/usr/share/veles"]),
         "device_dirs": ["/usr/share/veles/devices",
@@ -281,12 +329,29 @@ root.common.update({
         "disable": {
             "plotting": True
         },
+        # "subprocess" launches a new process per chromosome, "pool" reuses
+        # long-lived processes which keep the data and the device
+        "evaluation": "subprocess",
+        # the number of chromosomes to evaluate at once in standalone mode,
+        # 0 means cpu_count() // threads_per_job
+        "jobs": 1,
+        "threads_per_job": 1,
     },
     "ensemble": {
         "disable": {
             "plotting": True
         },
     },
+    "loader": {
+        # Fill the next minibatch on a background thread while the workflow
+        # processes the current one (standalone mode only)
+        "prefetch_minibatch": False,
+        "image_cache": {
+            "dir": os.path.join(__home__, "cache", "images"),
+            "max_size": 16 << 30,  # bytes
+            "flush_interval": 10,  # seconds
+        },
+    },
     "evaluation_transform": lambda v, t: v
 })
 
@@ -36,6 +36,7 @@ under the License.
 """
 
 import functools
+import numpy
 import six
 import threading
 from zope.interface import Interface, Attribute, implementer
@@ -133,8 +134,49 @@ class Pickleable(logger.Logger):
             self._pickle_lock_.release()
 
 
+def sum_updates(updates):
+    """Adds up the updates of the same structure: numpy arrays and numbers
+    are summed, lists, tuples and dicts are merged item by item, None-s are
+    skipped and all the other values must be equal.
+    """
+    updates = [u for u in updates if u is not None]
+    if len(updates) == 0:
+        return None
+    first = updates[0]
+    if len(updates) == 1:
+        return first
+    if isinstance(first, numpy.ndarray):
+        merged = first.copy()
+        for update in updates[1:]:
+            numpy.add(merged, update, out=merged)
+        return merged
+    if isinstance(first, (list, tuple)):
+        items = [sum_updates(u[i] for u in updates)
+                 for i in range(len(first))]
+        if isinstance(first, list):
+            return items
+        return type(first)(*items) if hasattr(first, "_fields") \
+            else tuple(items)
+    if isinstance(first, dict):
+        return {key: sum_updates(u.get(key) for u in updates)
+                for key in first}
+    if isinstance(first, (bool, six.string_types, bytes)):
+        if any(u != first for u in updates[1:]):
+            raise ValueError("Updates differ in %r" % first)
+        return first
+    if isinstance(first, (six.integer_types, float, numpy.number)):
+        return sum(updates[1:], first)
+    if any(u != first for u in updates[1:]):
+        raise ValueError("Updates differ in %r" % first)
+    return first
+
+
 class Distributable(Pickleable):
     DEADLOCK_TIME = 4
+    # Set to True if the order in which apply_data_from_slave() is called
+    # does not matter, so that the master is allowed to combine simultaneous
+    # updates with merge_data_from_slaves() and apply them at once.
+    updates_commute = False
 
     def _data_threadsafe(self, fn, name):
         def wrapped_data_threadsafe(*args, **kwargs):
@@ -163,6 +205,9 @@ class Distributable(Pickleable):
             kwargs.get("apply_data_from_slave_threadsafe", False)
         super(Distributable, self).__init__(**kwargs)
         self.negotiates_on_connect = False
+        # Set to False if the update must not be encoded by
+        # root.common.engine.update_codec
+        self.lossy_updates = kwargs.get("lossy_updates", True)
         if self._generate_data_for_slave_threadsafe:
             self.add_method_to_storage("generate_data_for_slave")
         if self._apply_data_from_slave_threadsafe:
@@ -199,6 +244,20 @@ class Distributable(Pickleable):
             self.debug("%s has NO data for slave", self.name)
             self._data_event_.clear()
 
+    def merge_data_from_slaves(self, updates):
+        """Combines the updates from several slaves into one which is
+        passed to apply_data_from_slave() with slave=None. Only called if
+        updates_commute is True.
+        """
+        return sum_updates(updates)
+
+    def drops_update_from(self, slave):
+        """Returns True if the next update from the slave duplicates the one
+        which was already applied, so that the workflow must ignore it as a
+        whole. Called by the master before apply_data_from_slave().
+        """
+        return False
+
     def wait_for_data_for_slave(self):
         if not self._data_event_.wait(Distributable.DEADLOCK_TIME):
             self.error("Deadlock in %s: wait_for_data_for_slave", self.name)
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Long-lived worker processes which evaluate chromosomes without restarting
+the interpreter, reloading the data and reinitializing the device each time.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from copy import copy, deepcopy
+from functools import partial
+import gc
+from hashlib import sha1
+from importlib import import_module
+import io
+import json
+import multiprocessing
+import os
+import traceback
+import types
+
+import numpy
+import six
+from six.moves import queue
+
+from veles import prng
+from veles.backends import Device
+from veles.config import root, Config
+from veles.dummy import DummyLauncher
+from veles.loader import Loader
+from veles.logger import Logger
+import veles.memory as memory
+from veles.mutable import Bool
+from veles.thread_pool import ThreadPool
+from veles.units import Unit
+from veles.workflow import Workflow
+
+#: Marks the configuration settings which did not exist before an evaluation
+MISSING = object()
+
+
+def override_config(node, tree, undo):
+    """Merges the configuration tree into the node and appends the
+    previous values to undo, so that :func:`restore_config` can put them
+    back.
+    """
+    if isinstance(tree, Config):
+        tree = tree.__content__
+    for key, value in tree.items():
+        if isinstance(value, Config):
+            value = value.__content__
+        elif not isinstance(value, dict) or value.get("dict", False):
+            if isinstance(value, dict):
+                value = {k: v for k, v in value.items() if k != "dict"}
+            undo.append((node, key, node.__dict__.get(key, MISSING)))
+            setattr(node, key, value)
+            continue
+        if not isinstance(node.__dict__.get(key), Config):
+            undo.append((node, key, node.__dict__.get(key, MISSING)))
+            setattr(node, key, Config("%s.%s" % (node.__path__, key)))
+        override_config(getattr(node, key), value, undo)
+
+
+def restore_config(undo):
+    for node, key, value in reversed(undo):
+        if value is MISSING:
+            delattr(node, key)
+        else:
+            setattr(node, key, value)
+    del undo[:]
+
+
+class LoadedDataCache(Logger):
+    """Keeps the data loaded by the loaders of the previous workflow
+    instances, so that an identical loader in the next instance does not
+    call load_data() again. Loaders are identical if they have the same
+    class and name and equal attributes before load_data(), except the
+    transient ones. Loaders with attributes which cannot be compared
+    (e.g., open files) or which keep anything but plain data after
+    load_data() are not cached. The attributes which load_data() changes
+    are copied, so that the in-place normalization does not spoil the
+    stored originals.
+    """
+    # load_data() results which can be reused by the next workflow instance
+    DATA_TYPES = (numpy.ndarray, list, tuple, dict, set, bool, float,
+                  numpy.generic, type(None)) + six.string_types + \
+        six.integer_types
+
+    def __init__(self, **kwargs):
+        super(LoadedDataCache, self).__init__(**kwargs)
+        self._data = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def attach(self, workflow):
+        """Intercepts load_data() of all the loaders in the workflow.
+        Call :meth:`detach` after the workflow is initialized.
+        """
+        for loader in self._loaders(workflow):
+            loader.load_data = partial(self._load, loader, loader.load_data)
+
+    def detach(self, workflow):
+        for loader in self._loaders(workflow):
+            loader.__dict__.pop("load_data", None)
+
+    def _loaders(self, workflow):
+        for unit in workflow:
+            if isinstance(unit, Loader):
+                yield unit
+            elif isinstance(unit, Workflow):
+                for loader in self._loaders(unit):
+                    yield loader
+
+    def _load(self, loader, load_data):
+        try:
+            key = type(loader).__module__, type(loader).__name__, \
+                loader.name, self._freeze(self._persistent(loader), set())
+        except TypeError as e:
+            self.debug("Will not reuse the data of %s: %s", loader, e)
+            load_data()
+            return
+        data = self._data.get(key)
+        if data is not None:
+            loader.info("Reusing the data loaded by the previous workflow")
+            for name, (is_array, value) in data.items():
+                if is_array:
+                    getattr(loader, name).mem = self._copy(value)
+                else:
+                    setattr(loader, name, self._copy(value))
+            return
+        before = {name: self._signature(value)
+                  for name, value in loader.__dict__.items()}
+        load_data()
+        data = {}
+        for name, value in loader.__dict__.items():
+            if name in before and \
+                    before[name][0] == self._signature(value)[0]:
+                continue
+            if isinstance(value, memory.Array):
+                data[name] = True, self._copy(value.mem)
+            elif isinstance(value, LoadedDataCache.DATA_TYPES):
+                data[name] = False, self._copy(value)
+            else:
+                self.debug("Will not reuse the data of %s since %s is %s",
+                           loader, name, type(value))
+                return
+        self._data[key] = data
+
+    @staticmethod
+    def _copy(value):
+        # memory maps are read only and must stay on disk
+        return value if isinstance(value, numpy.memmap) else deepcopy(value)
+
+    @staticmethod
+    def _signature(value):
+        """Returns the tuple of the value identity and the references to
+        keep it alive (otherwise ids may be reused).
+        """
+        if isinstance(value, memory.Array):
+            return ("array", id(value), id(value.mem)), (value, value.mem)
+        if isinstance(value, list):
+            return ("list",) + tuple(map(id, value)), copy(value)
+        if isinstance(value, dict):
+            return ("dict",) + tuple((k, id(v)) for k, v in sorted(
+                value.items(), key=lambda p: str(p[0]))), copy(value)
+        return id(value), value
+
+    @staticmethod
+    def _persistent(obj):
+        return {k: v for k, v in obj.__dict__.items()
+                if not k.endswith("_") and k != "_id"}
+
+    @staticmethod
+    def _freeze(value, stack):
+        """Converts the value to the hashable key. Raises TypeError if it
+        cannot be compared by contents.
+        """
+        freeze = LoadedDataCache._freeze
+        if value is None or isinstance(
+                value, (bool, float, complex) + six.string_types +
+                six.integer_types + (six.binary_type,)):
+            return value
+        if isinstance(value, Unit):
+            # Units are compared by their own keys
+            return "unit", type(value).__name__, value.name
+        if isinstance(value, Bool):
+            return bool(value)
+        if isinstance(value, (type, types.FunctionType, types.MethodType,
+                              types.BuiltinFunctionType)):
+            return "code", getattr(value, "__module__", None), getattr(
+                value, "__qualname__", value.__name__)
+        if isinstance(value, numpy.generic):
+            return value.dtype.str, value.item()
+        if isinstance(value, numpy.ndarray):
+            return value.dtype.str, value.shape, sha1(
+                numpy.ascontiguousarray(value).view(numpy.uint8)).hexdigest()
+        if id(value) in stack:
+            raise TypeError("%s refers to itself" % type(value))
+        stack.add(id(value))
+        try:
+            if isinstance(value, memory.Array):
+                return "array", freeze(value.mem, stack)
+            if isinstance(value, (list, tuple)):
+                return type(value).__name__, tuple(
+                    freeze(v, stack) for v in value)
+            if isinstance(value, (set, frozenset)):
+                return "set", tuple(sorted(
+                    (freeze(v, stack) for v in value), key=repr))
+            if isinstance(value, dict):
+                return "dict", tuple(sorted(
+                    ((freeze(k, stack), freeze(v, stack))
+                     for k, v in value.items()), key=repr))
+            if isinstance(value, io.IOBase) or not hasattr(value, "__dict__"):
+                raise TypeError("%s is not comparable" % type(value))
+            return type(value).__name__, freeze(
+                LoadedDataCache._persistent(value), stack)
+        finally:
+            stack.remove(id(value))
+
+
+class EvaluationLauncher(DummyLauncher):
+    """Replaces :class:`veles.launcher.Launcher` inside evaluation workers.
+    The device is created once and reused by every workflow.
+    """
+    def __init__(self, main, log_id):
+        super(EvaluationLauncher, self).__init__()
+        self._main = main
+        self._log_id = log_id
+        self._device = None
+
+    @property
+    def is_main(self):
+        return False
+
+    @property
+    def log_id(self):
+        return self._log_id
+
+    @property
+    def workflow_file(self):
+        return self._main.workflow_file
+
+    @property
+    def config_file(self):
+        return self._main.config_file
+
+    @property
+    def seeds(self):
+        return self._main.seeds
+
+    @property
+    def device(self):
+        if self._device is None:
+            self._device = Device()
+        return self._device
+
+    def add_ref(self, workflow):
+        super(EvaluationLauncher, self).add_ref(workflow)
+        workflow.plotters_are_enabled = False
+
+    def device_thread_pool_detach(self):
+        if self._device is not None and \
+                self._device.is_attached(self.workflow.thread_pool):
+            self._device.thread_pool_detach(self.workflow.thread_pool)
+
+
+def create_worker_class():
+    # veles.__main__ cannot be imported at the module level (R0401)
+    Main = import_module("veles.__main__").Main
+
+    class EvaluationWorker(Main):
+        """Loads the model once and then runs it with each received
+        configuration in the same process.
+        """
+        def __init__(self, argv, seeds, log_id):
+            super(EvaluationWorker, self).__init__()
+            Main.setup_argv(False, True, *argv)
+            self.seeds = seeds
+            self.launcher = EvaluationLauncher(self, log_id)
+            self.results = None
+            self._model = None
+            self._loaded_data = LoadedDataCache()
+
+        def prepare(self):
+            args = Main.init_parser().parse_args(self.argv)
+            self._apply_args(args)
+            self.setup_logging(args.verbosity)
+            ThreadPool.reset()
+            self._model = self._load_model(self.workflow_file)
+            self._apply_config(self.config_file)
+            self._override_config(args.config_list)
+
+        def evaluate(self, config):
+            """Runs the model with the configuration applied on top of the
+            one loaded in :meth:`prepare`, which is restored afterwards.
+            """
+            undo = []
+            try:
+                override_config(root, config, undo)
+                return self._evaluate()
+            finally:
+                restore_config(undo)
+
+        def _evaluate(self):
+            for index, seed in enumerate(self.seeds):
+                if seed is not None:
+                    prng.get(index + 1).seed(seed, dtype=seed.dtype)
+            self.results = None
+            try:
+                self._run_core(self._model)
+            finally:
+                self.workflow = None
+                gc.collect()
+            return self.results
+
+        def _load(self, Workflow, **kwargs):
+            self.load_called = True
+            self.workflow = self._load_workflow(self.snapshot_file_name)
+            snapshot = self.workflow is not None
+            if not snapshot:
+                self.workflow = Workflow(self.launcher, **kwargs)
+            else:
+                self.workflow.workflow = self.launcher
+            return self.workflow, snapshot
+
+        def _main(self, **kwargs):
+            self.main_called = True
+            try:
+                self._loaded_data.attach(self.workflow)
+                try:
+                    self.workflow.initialize(device=self.launcher.device,
+                                             **kwargs)
+                finally:
+                    self._loaded_data.detach(self.workflow)
+                self.workflow.run()
+            finally:
+                self.launcher.device_thread_pool_detach()
+            # The same conversion as if the results were read from
+            # --result-file
+            self.results = json.loads(json.dumps(
+                self.workflow.gather_results(),
+                cls=self.workflow.json_encoder))
+
+    return EvaluationWorker
+
+
+def serve(connection, argv, seeds, log_id, environment):
+    """Worker process entry point. Replies ("ready", None) after the model
+    is loaded, then ("result", dict) or ("error", str) to each configuration
+    until None is received.
+    """
+    os.environ.update(environment)
+    try:
+        worker = create_worker_class()(argv, seeds, log_id)
+        worker.prepare()
+    except BaseException:
+        connection.send(("error", traceback.format_exc()))
+        return
+    connection.send(("ready", None))
+    try:
+        while True:
+            config = connection.recv()
+            if config is None:
+                break
+            try:
+                connection.send(("result", worker.evaluate(config)))
+            except BaseException:
+                connection.send(("error", traceback.format_exc()))
+    except EOFError:
+        pass
+    finally:
+        ThreadPool.shutdown_pools()
+
+
+class EvaluationWorkerProcess(object):
+    def __init__(self, context, argv, seeds, log_id, environment):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=serve, name="veles-evaluation-worker",
+            args=(child_connection, argv, seeds, log_id, environment))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def request(self, config):
+        self.connection.send(config)
+        return self.connection.recv()
+
+    def stop(self, timeout=5):
+        try:
+            self.connection.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+
+class EvaluationPool(Logger):
+    """Keeps long-lived processes which evaluate configurations of the same
+    model. Each worker imports the model, creates the device and loads the
+    data only once; afterwards each evaluation costs a fresh workflow
+    instance. The workers are started with "forkserver" where it is
+    available, so that they do not inherit the reactor threads.
+
+    Arguments:
+        argv: veles command line of the model to evaluate (without the
+              master/slave options).
+        seeds: the random generator seeds to apply before each evaluation.
+        log_id: the log identifier to report in the results.
+        size: the number of worker processes.
+        environment: the variables to add to the workers' os.environ.
+    """
+    def __init__(self, argv, seeds, log_id, size=1, environment=None,
+                 **kwargs):
+        super(EvaluationPool, self).__init__(**kwargs)
+        self.argv = list(argv)
+        self.seeds = seeds
+        self.log_id = log_id
+        self.size = size
+        self.environment = environment or {}
+        try:
+            self._context = multiprocessing.get_context("forkserver")
+        except (AttributeError, ValueError):
+            self._context = multiprocessing
+        self._workers = []
+        self._idle = queue.Queue()
+
+    def start(self):
+        """Starts the workers and waits until they load the model.
+        Raises RuntimeError if any of them fails.
+        """
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def evaluate(self, config):
+        """Runs the model with the specified configuration on the first free
+        worker.
+
+        Returns:
+            The dictionary with the workflow results or None if the
+            evaluation failed. Raises RuntimeError if all the workers died
+            and could not be restarted.
+        """
+        if not self._workers:
+            raise RuntimeError("There are no evaluation workers left")
+        worker = self._idle.get()
+        try:
+            status, payload = worker.request(config)
+        except (EOFError, IOError, OSError) as e:
+            self.error("Evaluation worker %d died: %s", worker.pid, e)
+            self._replace(worker)
+            return None
+        self._idle.put(worker)
+        if status != "result":
+            self.error("Evaluation worker %d failed:\n%s", worker.pid,
+                       payload)
+            return None
+        return payload
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+        del self._workers[:]
+        self._idle = queue.Queue()
+
+    def _replace(self, worker):
+        self._workers.remove(worker)
+        worker.stop(0)
+        try:
+            self._idle.put(self._spawn())
+        except RuntimeError as e:
+            self.error("%s", e)
+
+    def _spawn(self):
+        worker = EvaluationWorkerProcess(
+            self._context, self.argv, self.seeds, self.log_id,
+            self.environment)
+        try:
+            status, payload = worker.connection.recv()
+        except EOFError:
+            worker.process.join()
+            status, payload = "error", "exited with code %s" % (
+                worker.process.exitcode,)
+        if status != "ready":
+            worker.stop(0)
+            raise RuntimeError("Evaluation worker %d failed to start:\n%s" %
+                               (worker.pid, payload))
+        self.debug("Started evaluation worker %d", worker.pid)
+        self._workers.append(worker)
+        return worker
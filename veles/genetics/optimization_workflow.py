@@ -33,15 +33,19 @@ under the License.
 
 ███████████████████████████████████████████████████████████████████████████████
 """
+import argparse
 from collections import defaultdict
 
 import copy
 import json
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
 from six import add_metaclass
 import sys
 import subprocess
 from tempfile import NamedTemporaryFile
+import threading
 from zope.interface import implementer
 from veles import prng, __root__
 from veles.compat import from_none
@@ -49,6 +53,7 @@ from veles.compat import from_none
 from veles.accelerated_units import AcceleratedWorkflow
 from veles.config import root, fix_contents
 from veles.distributable import IDistributable
+from veles.genetics.evaluation_pool import EvaluationPool
 from veles.genetics.config import process_config, Range, print_config, \
     ConfigChromosome, ConfigPopulation
 from veles.json_encoders import ConfigJSONEncoder
@@ -68,6 +73,12 @@ class EvaluationError(Exception):
 @implementer(IUnit, IDistributable, IResultProvider)
 @add_metaclass(UnitCommandLineArgumentsRegistry)
 class GeneticsOptimizer(Unit):
+    EVALUATION_MODES = ("subprocess", "pool")
+    EVALUATION_OVERRIDES = ["root.common.disable.snapshotting=True",
+                            "root.common.disable.publishing=True"]
+    THREADS_ENVIRONMENT = ("OMP_NUM_THREADS", "MKL_NUM_THREADS",
+                           "OPENBLAS_NUM_THREADS")
+
     def __init__(self, workflow, **kwargs):
         kwargs["view_group"] = kwargs.get("view_group", "EVALUATOR")
         super(GeneticsOptimizer, self).__init__(workflow, **kwargs)
@@ -77,6 +88,8 @@ class GeneticsOptimizer(Unit):
             del self.config.common
         self.plotters_are_disabled = kwargs.get(
             "plotters_are_disabled", root.common.genetics.disable.plotting)
+        self.evaluation = kwargs.get("evaluation", self.evaluation)
+        self.jobs = kwargs.get("jobs", self._jobs)
         self._tuneables = []
         process_config(self.config, Range, self._add_tuneable)
         if len(self.tuneables) == 0:
@@ -105,6 +118,67 @@ class GeneticsOptimizer(Unit):
         super(GeneticsOptimizer, self).init_unpickled()
         self._filtered_argv_ = []
         self._pending_ = defaultdict(set)
+        self._evaluation_pool_ = None
+        self._config_lock_ = threading.Lock()
+        self._evaluation_pool_lock_ = threading.Lock()
+        parser = GeneticsOptimizer.init_parser()
+        args, _ = parser.parse_known_args(self.argv)
+        self._evaluation = args.genetics_evaluation or \
+            root.common.genetics.evaluation
+        self._jobs = args.genetics_jobs if args.genetics_jobs is not None \
+            else root.common.genetics.jobs
+
+    @staticmethod
+    def init_parser(parser=None):
+        parser = parser or argparse.ArgumentParser()
+        parser.add_argument(
+            "--genetics-evaluation",
+            choices=GeneticsOptimizer.EVALUATION_MODES,
+            help="How to evaluate chromosomes: \"subprocess\" runs a new "
+                 "process for each of them, \"pool\" reuses long-lived "
+                 "processes which keep the loaded data and the device "
+                 "(defaults to root.common.genetics.evaluation).")
+        parser.add_argument(
+            "--genetics-jobs", type=int,
+            help="The number of chromosomes to evaluate simultaneously in "
+                 "standalone mode; 0 means the number of CPUs divided by "
+                 "root.common.genetics.threads_per_job (defaults to "
+                 "root.common.genetics.jobs).")
+        return parser
+
+    @property
+    def evaluation(self):
+        return self._evaluation
+
+    @evaluation.setter
+    def evaluation(self, value):
+        if value not in GeneticsOptimizer.EVALUATION_MODES:
+            raise ValueError(
+                "evaluation must be one of %s (got %s)" %
+                (GeneticsOptimizer.EVALUATION_MODES, value))
+        self._evaluation = value
+
+    @property
+    def jobs(self):
+        """The number of chromosomes which are evaluated simultaneously in
+        standalone mode.
+        """
+        if self._jobs > 0:
+            return self._jobs
+        return max(1, cpu_count() //
+                   max(1, root.common.genetics.threads_per_job))
+
+    @jobs.setter
+    def jobs(self, value):
+        if not isinstance(value, int):
+            raise TypeError("jobs must be an integer (got %s)" % type(value))
+        if value < 0:
+            raise ValueError("jobs must be >= 0 (got %d)" % value)
+        self._jobs = value
+
+    @property
+    def concurrent(self):
+        return self.is_standalone and self.jobs > 1
 
     @property
     def population(self):
@@ -144,17 +218,23 @@ class GeneticsOptimizer(Unit):
             self.argv, "-l", "--listen-address", "-m", "--master-address",
             "-n", "--nodes", "-b", "--background", "-s", "--stealth",
             "--optimize", "--slave-launch-transform", "--result-file",
-            "--pdb-on-finish")
+            "--pdb-on-finish", "--genetics-evaluation", "--genetics-jobs")
 
     def run(self):
         self.generation_changed <<= False
-        self.info("Evaluating chromosome #%d...", self._chromosome_index)
-        self.population.evaluate(self._chromosome_index)
+        if self.concurrent:
+            self._evaluate_concurrently()
+        else:
+            self.info("Evaluating chromosome #%d...", self._chromosome_index)
+            self.population.evaluate(self._chromosome_index)
         self._chromosome_index += 1
         if self.is_slave:
             self.complete <<= True
 
     def stop(self):
+        if self._evaluation_pool_ is not None:
+            self._evaluation_pool_.shutdown()
+            self._evaluation_pool_ = None
         if self.is_slave:
             return
         self.info("Best fitness: %s", self.best.fitness)
@@ -220,39 +300,106 @@ class GeneticsOptimizer(Unit):
             self._pending_[slave].clear()
             self._update_has_more_data_for_slave()
 
-    def evaluate(self, chromo):
-        for tune, val in zip(self.tuneables, chromo.numeric):
-            tune <<= val
-        chromo.config = copy.deepcopy(self.config)
+    def evaluate(self, chromo, index=None):
+        if index is None:
+            index = self._chromosome_index
+        with self._config_lock_:
+            for tune, val in zip(self.tuneables, chromo.numeric):
+                tune <<= val
+            chromo.config = copy.deepcopy(self.config)
+        if self.evaluation == "pool":
+            result = self._evaluate_in_pool(chromo.config, index)
+        else:
+            result = self._evaluate_in_subprocess(chromo.config, index)
+        if result is None:
+            raise EvaluationError()
+        try:
+            chromo.fitness = result["EvaluationFitness"]
+        except KeyError:
+            raise from_none(EvaluationError(
+                "Failed to find \"EvaluationFitness\" in the evaluation "
+                "results"))
+        chromo.snapshot = result.get("Snapshot")
+        self.info("Chromosome #%d was evaluated to %f", index, chromo.fitness)
+
+    def _evaluate_concurrently(self):
+        """Evaluates all the pending chromosomes of the current generation
+        in up to :attr:`jobs` child processes at once and then lets the
+        population breed the next one.
+        """
+        pending = [i for i, chromo in enumerate(self.population)
+                   if chromo.fitness is None]
+        jobs = min(self.jobs, len(pending))
+        self.info("Evaluating %d chromosomes in %d parallel jobs...",
+                  len(pending), jobs)
+        pool = ThreadPool(jobs)
+        try:
+            pool.map(lambda i: self.evaluate(self.population[i], i), pending,
+                     chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        self.population.update()
+
+    def _evaluate_in_subprocess(self, config, index):
         with NamedTemporaryFile(mode="wb", prefix="veles-optimization-config-",
                                 suffix=".%d.pickle" % best_protocol) as fcfg:
-            pickle.dump(self.config, fcfg)
+            pickle.dump(config, fcfg)
             fcfg.flush()
             with NamedTemporaryFile(
                     mode="r", prefix="veles-optimization-result-",
                     suffix=".%d.pickle" % best_protocol) as fres:
                 argv = ["--result-file", fres.name, "--stealth", "--log-id",
                         self.launcher.log_id] + self._filtered_argv_ + \
-                    ["root.common.disable.snapshotting=True",
-                     "root.common.disable.publishing=True"]
+                    self.EVALUATION_OVERRIDES
                 if self.plotters_are_disabled:
                     argv = ["-p", ""] + argv
                 i = -1
                 while "=" in argv[i]:
                     i -= 1
                 argv[i] = fcfg.name
-                result = self._exec(argv, fres)
-                if result is None:
-                    raise EvaluationError()
-        try:
-            chromo.fitness = result["EvaluationFitness"]
-        except KeyError:
-            raise from_none(EvaluationError(
-                "Failed to find \"EvaluationFitness\" in the evaluation "
-                "results"))
-        chromo.snapshot = result.get("Snapshot")
-        self.info("Chromosome #%d was evaluated to %f", self._chromosome_index,
-                  chromo.fitness)
+                return self._exec(argv, fres, index)
+
+    def _evaluate_in_pool(self, config, index):
+        """Evaluates the config in a long-lived worker process. Falls back to
+        subprocess mode if the workers cannot be started.
+        """
+        with self._evaluation_pool_lock_:
+            if self.evaluation == "pool" and self._evaluation_pool_ is None:
+                self._evaluation_pool_ = EvaluationPool(
+                    self._filtered_argv_ + self.EVALUATION_OVERRIDES,
+                    self.launcher.seeds, self.launcher.log_id,
+                    size=self.jobs if self.concurrent else 1,
+                    environment=self._jobs_environment)
+                try:
+                    self._evaluation_pool_.start()
+                except RuntimeError as e:
+                    self._fall_back_to_subprocess(e)
+            pool = self._evaluation_pool_
+        if pool is not None:
+            try:
+                return pool.evaluate(config)
+            except RuntimeError as e:
+                with self._evaluation_pool_lock_:
+                    self._fall_back_to_subprocess(e)
+        return self._evaluate_in_subprocess(config, index)
+
+    def _fall_back_to_subprocess(self, error):
+        self.warning("%s\nFalling back to the subprocess evaluation", error)
+        if self._evaluation_pool_ is not None:
+            self._evaluation_pool_.shutdown()
+            self._evaluation_pool_ = None
+        self.evaluation = "subprocess"
+
+    @property
+    def _jobs_environment(self):
+        """Limits the number of threads in each child process, so that the
+        simultaneous jobs do not oversubscribe the CPUs.
+        """
+        if not self.concurrent:
+            return {}
+        threads = str(max(1, root.common.genetics.threads_per_job))
+        return {name: threads for name in self.THREADS_ENVIRONMENT}
 
     def _update_has_more_data_for_slave(self):
         self.has_data_for_slave = \
@@ -265,15 +412,15 @@ class GeneticsOptimizer(Unit):
         self.tuneables.append(value)
         return value
 
-    def _exec(self, argv, fin):
+    def _exec(self, argv, fin, index):
         __main__ = os.path.join(__root__, "veles", "__main__.py")
         argv = [sys.executable, __main__] + argv
         self.debug("exec: %s", " ".join(argv))
         env = {"PYTHONPATH": os.getenv("PYTHONPATH", __root__)}
         env.update(os.environ)
+        env.update(self._jobs_environment)
         if subprocess.call(argv, env=env):
-            self.error("Failed to evaluate chromosome #%d",
-                       self._chromosome_index)
+            self.error("Failed to evaluate chromosome #%d", index)
             return
         try:
             return json.load(fin)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Content addressed cache of the compiled OpenCL and CUDA programs.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import errno
+import fcntl
+from hashlib import sha1
+import json
+import os
+import threading
+
+from veles.config import root
+from veles.logger import Logger
+from veles.pickle2 import pickle, best_protocol
+
+
+class KernelCache(Logger):
+    """Stores the program binaries by the hash of everything they were built
+    from: the generated source, the contents of the included files, the
+    device and the defines. Each program is a separate file named after the
+    key, so a hit costs a single read. "index.json" lists the size and the
+    name of each entry; it is only read and rewritten when a program is
+    stored, under an exclusive lock on "lock", so several processes may
+    share the cache. The entries are evicted in the least recently used order
+    (the modification time is refreshed on each hit) when the total size
+    exceeds max_size.
+    """
+    INDEX = "index.json"
+    LOCK = "lock"
+    EXTENSION = ".bin"
+
+    def __init__(self, directory=None, max_size=None, **kwargs):
+        super(KernelCache, self).__init__(**kwargs)
+        cfg = root.common.engine.kernel_cache
+        self.directory = directory or cfg.dir
+        self.max_size = max_size if max_size is not None else cfg.max_size
+        self.hits = self.misses = self.stores = self.evictions = 0
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._files = {}
+
+    @staticmethod
+    def key(source, dependencies, device_id, defines):
+        """Calculates the key of the program.
+
+        :param source: The generated source code (str).
+        :param dependencies: The digests of the included files.
+        :param device_id: The identifier of the device the program is built
+            for (anything with the stable repr()).
+        :param defines: The dictionary with the preprocessor definitions.
+        """
+        digest = sha1(source.encode("utf-8"))
+        for dep in sorted(dependencies):
+            digest.update(dep.encode("utf-8"))
+        digest.update(repr((device_id, sorted(
+            (str(k), str(v)) for k, v in defines.items()))).encode("utf-8"))
+        return digest.hexdigest()
+
+    def read_file(self, path):
+        """Returns the hash and the contents of the file. They are reused
+        until the modification time or the size of the file changes, so
+        that each included file is read only once.
+        """
+        stat = os.stat(path)
+        signature = stat.st_mtime, stat.st_size
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1:]
+        with open(path, "rb") as fin:
+            contents = fin.read()
+        digest = sha1(contents).hexdigest()
+        with self._lock:
+            self._files[path] = signature, digest, contents
+        return digest, contents
+
+    def get(self, key):
+        """
+        :return: The dictionary which was stored with key or None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fin:
+                data = pickle.loads(fin.read())
+        except (IOError, OSError, EOFError, ValueError,
+                pickle.UnpicklingError) as e:
+            if not isinstance(e, (IOError, OSError)) or \
+                    e.errno != errno.ENOENT:
+                self.warning("Failed to read %s: %s", path, e)
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # The modification time marks the last usage
+            os.utime(path, None)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data, name):
+        """Atomically stores data (a picklable dictionary) with key and evicts
+        the least recently used entries if the cache became too large.
+
+        :param name: The human readable name of the entry.
+        """
+        blob = pickle.dumps(data, protocol=best_protocol)
+        if len(blob) > self.max_size:
+            return
+        path = self._path(key)
+        tmp = "%s.%d.%d.tmp" % (path, os.getpid(),
+                                threading.current_thread().ident)
+        try:
+            try:
+                os.makedirs(self.directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(tmp, "wb") as fout:
+                fout.write(blob)
+            os.rename(tmp, path)
+            self._update_index(key, len(blob), name)
+        except (IOError, OSError) as e:
+            self.warning("Failed to store %s in %s: %s", name, path, e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self.stores += 1
+
+    def entries(self):
+        """
+        :return: The dictionary key -> (size in bytes, name).
+        """
+        try:
+            with open(os.path.join(self.directory, self.INDEX), "r") as fin:
+                return {k: tuple(v) for k, v in json.load(fin).items()}
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def print_stats(self):
+        """Reports the hit rate since the previous call, if there were any
+        lookups.
+        """
+        with self._lock:
+            hits, misses, stores, evictions = \
+                self.hits, self.misses, self.stores, self.evictions
+            self.hits = self.misses = self.stores = self.evictions = 0
+        if hits + misses == 0:
+            return
+        self.info("%s: %d hits, %d misses (%d%% hit rate), %d programs "
+                  "stored, %d evicted", self.directory, hits, misses,
+                  hits * 100 // (hits + misses), stores, evictions)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.EXTENSION)
+
+    def _update_index(self, key, size, name):
+        with self._index_lock, open(os.path.join(
+                self.directory, self.LOCK), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self.entries()
+            entries[key] = size, name
+            total = sum(e[0] for e in entries.values())
+            if total > self.max_size:
+                total = self._evict(entries, total, key)
+            tmp = os.path.join(self.directory, "%s.%d.tmp" % (
+                self.INDEX, os.getpid()))
+            with open(tmp, "w") as fout:
+                json.dump(entries, fout)
+            os.rename(tmp, os.path.join(self.directory, self.INDEX))
+        self.debug("Stored %s as %s (%d entries, %d bytes)", name, key,
+                   len(entries), total)
+
+    def _evict(self, entries, total, keep):
+        def last_used(key):
+            try:
+                return os.path.getmtime(self._path(key))
+            except OSError:
+                return 0
+
+        for key in sorted(entries, key=last_used):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            total -= entries.pop(key)[0]
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            with self._lock:
+                self.evictions += 1
+        return total
+
+
+__caches__ = {}
+__caches_lock__ = threading.Lock()
+
+
+def get(directory=None):
+    """
+    :return: The shared KernelCache instance for directory (the configured
+        one by default).
+    """
+    directory = directory or root.common.engine.kernel_cache.dir
+    with __caches_lock__:
+        cache = __caches__.get(directory)
+        if cache is None:
+            cache = __caches__[directory] = KernelCache(directory)
+        return cache
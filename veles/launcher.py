@@ -69,6 +69,7 @@ from veles.plotter import Plotter
 import veles.logger as logger
 from veles.server import Server as MasterManager
 from veles.thread_pool import ThreadPool
+import veles.tracing as tracing
 from veles.external.pytrie import StringTrie
 
 
@@ -429,6 +430,8 @@ class Launcher(logger.Logger):
 
     @threadsafe
     def initialize(self, **kwargs):
+        if root.common.trace.timeline:
+            tracing.start(self.mode)
         # Ensure reactor stops in some rare cases when it does not normally
         if not self.interactive:
             self.workflow.thread_pool.register_on_shutdown(
@@ -689,6 +692,8 @@ class Launcher(logger.Logger):
             import pdb
             pdb.set_trace()
         self.info("Stopping everything (%s mode)", self.mode)
+        if tracing.enabled:
+            tracing.stop()
         self._initialized = False
         self._running = False
         # Wait for the own graphics client to terminate normally
@@ -37,10 +37,11 @@ under the License.
 
 from __future__ import division
 import argparse
-from collections import defaultdict
+from collections import defaultdict, deque
 from copy import copy
 import logging
 import marshal
+import threading
 import time
 import types
 
@@ -52,6 +53,7 @@ try:
 except ImportError:
     chisquare = None
 import six
+from six.moves import queue
 from zope.interface import implementer, Interface
 
 from veles.compat import from_none, has_colors
@@ -146,6 +148,25 @@ class Loader(Unit):
 
     LABEL_DTYPE = numpy.int32
     INDEX_DTYPE = numpy.int32
+    # Compatible NumPy dtype kinds of raw labels for each labels_mapping key
+    # kind, see map_labels()
+    _LABEL_KINDS = {"i": "iu", "u": "iu", "f": "f", "U": "U", "S": "S"}
+    # Straggler detection: the number of recent job durations to keep for
+    # each slave and the minimal number of them to trust the statistics
+    STRAGGLER_WINDOW = 32
+    STRAGGLER_MIN_SAMPLES = 3
+    # A minibatch is late if its slave processes it longer than
+    # mean + STRAGGLER_SIGMAS * std of its own durations or
+    # STRAGGLER_SLOWDOWN times longer than the median slave
+    STRAGGLER_SIGMAS = 3
+    STRAGGLER_SLOWDOWN = 2
+    # The smallest minibatch which weighted_minibatches may serve, relative
+    # to max_minibatch_size
+    MIN_WEIGHTED_MINIBATCH = 0.1
+    # The attributes of the background prefetch copy which must not be
+    # copied back besides the minibatch buffers
+    PREFETCHED_ATTRS = ("_minibatch_offset_", "_minibatch_size_",
+                        "_minibatch_class", "_prng", "_id")
     exports = "epoch_ended", "epoch_number", "train_ended", "class_lengths", \
         "minibatch_data", "minibatch_class", "minibatch_data", "has_labels", \
         "minibatch_labels", "minibatch_size", "max_minibatch_size", \
@@ -193,6 +214,15 @@ class Loader(Unit):
 
         self.failed_minibatches = []
         self._total_failed = 0
+        self.speculative_execution = kwargs.get(
+            "speculative_execution",
+            config.root.common.engine.speculative_execution)
+        self.weighted_minibatches = kwargs.get(
+            "weighted_minibatches",
+            config.root.common.engine.weighted_minibatches)
+        self.prefetch_minibatch = kwargs.get(
+            "prefetch_minibatch",
+            config.root.common.loader.prefetch_minibatch)
         self._on_initialized = nothing
         self._unique_labels_count = 1  # "None" label
 
@@ -207,7 +237,44 @@ class Loader(Unit):
         self._minibatch_offset_ = 0
         self._minibatch_size_ = 0
         self.pending_minibatches_ = defaultdict(list)
+        # the times when each pending minibatch was served, per slave
+        self._serve_times_ = defaultdict(deque)
+        self._job_durations_ = defaultdict(
+            lambda: deque(maxlen=Loader.STRAGGLER_WINDOW))
+        # the sizes of the minibatches which _job_durations_ correspond to
+        self._job_samples_ = defaultdict(
+            lambda: deque(maxlen=Loader.STRAGGLER_WINDOW))
+        # the execution times which the slaves reported for the same jobs
+        # (None if they did not); unlike _job_durations_, they include
+        # neither the time in the slave's queue nor its idle time
+        self._job_run_times_ = defaultdict(
+            lambda: deque(maxlen=Loader.STRAGGLER_WINDOW))
+        # when the slave started the current job, see generate_data_for_master
+        self._job_start_time_ = None
+        # the computing powers reported by the slaves
+        self._slave_powers_ = {}
+        # minibatch => the IDs of the slaves which were given it
+        self._speculative_ = {}
+        # Snapshots taken before these switches were introduced lack them
+        if not hasattr(self, "speculative_execution"):
+            self.speculative_execution = \
+                config.root.common.engine.speculative_execution
+        if not hasattr(self, "weighted_minibatches"):
+            self.weighted_minibatches = \
+                config.root.common.engine.weighted_minibatches
+        if not hasattr(self, "prefetch_minibatch"):
+            self.prefetch_minibatch = \
+                config.root.common.loader.prefetch_minibatch
         self._minibatch_serve_timestamp_ = time.time()
+        self._labels_keys_ = self._labels_values_ = self._labels_lut_ = None
+        self._labels_compiled_for_ = None
+        # the background minibatch filling, see prefetch_minibatch
+        self._minibatch_prefetch_thread_ = None
+        self._minibatch_prefetch_jobs_ = None
+        self._minibatch_prefetch_results_ = None
+        self._minibatch_prefetch_buffers_ = None
+        self._minibatch_prefetch_prng_ = None
+        self._prefetched_minibatch_ = None
         self.initialize = self._with_initialized_callback(self.initialize)
         parser = Loader.init_parser()
         args, _ = parser.parse_known_args(self.argv)
@@ -218,8 +285,8 @@ class Loader(Unit):
         # Move all pending minibatches to failed set
         if not self.epoch_ended:
             state["failed_minibatches"] = copy(state["failed_minibatches"])
-            for pmb in self.pending_minibatches_.values():
-                state["failed_minibatches"].extend(pmb)
+            state["failed_minibatches"].extend(
+                self._outstanding_minibatches())
         else:
             state["failed_minibatches"] = []
         oni = self._on_initialized
@@ -415,7 +482,19 @@ class Loader(Unit):
 
     @property
     def pending_minibatches_count(self):
-        return sum(len(v) for v in self.pending_minibatches_.values())
+        # None marks the duplicate which was already processed by another
+        # slave (see drops_update_from())
+        return sum(len(v) - v.count(None)
+                   for v in self.pending_minibatches_.values())
+
+    @property
+    def has_data_for_slave(self):
+        return super(Loader, self).has_data_for_slave or \
+            self._find_straggler(None) is not None
+
+    @has_data_for_slave.setter
+    def has_data_for_slave(self, value):
+        Unit.has_data_for_slave.fset(self, value)
 
     @property
     def minibatch_class(self):
@@ -616,6 +695,8 @@ class Loader(Unit):
             self.shuffled_indices.mem = None
         if not self.restored_from_snapshot or self.testing:
             self.shuffle()
+        if self.prefetch_minibatch and self.is_standalone:
+            self._init_minibatch_prefetch()
 
     def run(self):
         """Prepares the minibatch.
@@ -624,12 +705,33 @@ class Loader(Unit):
             del self.pending_minibatches_[None]
         self.serve_next_minibatch(None)
         self._on_successful_serve()
+        if self._minibatch_prefetch_jobs_ is not None:
+            self._prefetch_next_minibatch()
+
+    def stop(self):
+        self._stop_minibatch_prefetch()
 
     def generate_data_for_master(self):
-        return True
+        if self._job_start_time_ is None:
+            return True
+        return {"duration": time.time() - self._job_start_time_}
 
     def generate_data_for_slave(self, slave):
+        power = getattr(slave, "power", None)
+        if power:
+            self._slave_powers_[slave.id] = power
+        straggler = self._find_straggler(slave.id)
+        if straggler is not None:
+            minibatch, holder = straggler
+            self.info("Minibatch %s is late on slave %s, serving it to %s "
+                      "as well", minibatch, holder, slave.id)
+            self._speculative_[minibatch] = [
+                sid for sid, pending in self.pending_minibatches_.items()
+                for mb in pending if mb == minibatch] + [slave.id]
+            # serve_next_minibatch() will take it from there
+            self.failed_minibatches.append(minibatch)
         self.serve_next_minibatch(slave.id)
+        self._serve_times_[slave.id].append(time.time())
         data = {'indices': self.minibatch_indices.mem[:self.minibatch_size]}
         for attr in ("minibatch_class", "minibatch_size", "minibatch_offset",
                      "epoch_number"):
@@ -639,6 +741,7 @@ class Loader(Unit):
         return data
 
     def apply_data_from_master(self, data):
+        self._job_start_time_ = time.time()
         # Just feed single minibatch
         for attr in ("minibatch_class", "minibatch_size", "minibatch_offset",
                      "epoch_number"):
@@ -667,25 +770,154 @@ class Loader(Unit):
             # Partial update
             return
         try:
-            self.minibatch_offset, self.minibatch_size = \
-                self.pending_minibatches_[slave.id].pop()
-        except KeyError:
+            # the updates arrive in the same order as the jobs were sent,
+            # even if the slave prefetches several of them
+            minibatch = self.pending_minibatches_[slave.id].pop(0)
+        except (KeyError, IndexError):
             raise error.Bug("pending_minibatches_ does not contain %s" %
                             slave.id)
+        self._complete_minibatch(
+            slave.id, minibatch,
+            data.get("duration") if isinstance(data, dict) else None)
+        self.minibatch_offset, self.minibatch_size = minibatch
         self._on_successful_serve()
-        if not self.has_data_for_slave:
+        if not super(Loader, self).has_data_for_slave:
             self.has_data_for_slave = self.last_minibatch
 
+    def drops_update_from(self, slave):
+        pending = self.pending_minibatches_.get(slave.id)
+        if not pending or pending[0] is not None:
+            return False
+        del pending[0]
+        self._serve_times_[slave.id].popleft()
+        self.debug("Dropped the duplicate update from %s", slave.id)
+        return True
+
     def drop_slave(self, slave):
         if slave.id in self.pending_minibatches_:
             self._total_failed += 1
-            self.failed_minibatches.extend(self.pending_minibatches_[slave.id])
-            del self.pending_minibatches_[slave.id]
+            for minibatch in self.pending_minibatches_.pop(slave.id):
+                if minibatch is None:
+                    continue
+                holders = self._speculative_.get(minibatch)
+                if holders is not None:
+                    holders.remove(slave.id)
+                    if holders:
+                        # the other slave is still working on it
+                        continue
+                    del self._speculative_[minibatch]
+                self.failed_minibatches.append(minibatch)
+            self._serve_times_.pop(slave.id, None)
+            self._job_durations_.pop(slave.id, None)
+            self._job_samples_.pop(slave.id, None)
+            self._job_run_times_.pop(slave.id, None)
+            self._slave_powers_.pop(slave.id, None)
             self.has_data_for_slave = True
             self.info("Jobs failed: %d/pending: %d",
                       len(self.failed_minibatches),
                       self.pending_minibatches_count)
 
+    def _outstanding_minibatches(self):
+        result = []
+        for pending in self.pending_minibatches_.values():
+            result.extend(mb for mb in pending
+                          if mb is not None and mb not in result)
+        return result
+
+    def _complete_minibatch(self, slave_id, minibatch, run_time=None):
+        """Updates the job durations of the slave and marks the duplicates of
+        the minibatch which other slaves are processing as obsolete.
+        """
+        try:
+            served = self._serve_times_[slave_id].popleft()
+        except IndexError:
+            pass
+        else:
+            self._job_durations_[slave_id].append(time.time() - served)
+            self._job_samples_[slave_id].append(minibatch[1])
+            self._job_run_times_[slave_id].append(run_time)
+        holders = self._speculative_.pop(minibatch, None)
+        if holders is None:
+            return
+        holders.remove(slave_id)
+        for holder in holders:
+            pending = self.pending_minibatches_.get(holder, [])
+            if minibatch in pending:
+                pending[pending.index(minibatch)] = None
+        self.debug("Minibatch %s was processed by %s first", minibatch,
+                   slave_id)
+
+    def _slave_speeds(self):
+        """Estimates the relative speeds of the slaves. The measured
+        throughputs are preferred to the reported computing powers, but they
+        are not compared to each other. The throughputs are based on the
+        execution times which the slaves report; the times from serving the
+        jobs to applying their updates are used for the slaves which do not.
+
+        Returns:
+            {slave ID: speed in (0, 1]}, the fastest slave has 1.
+        """
+        throughputs = {}
+        for sid, durations in self._job_durations_.items():
+            samples = self._job_samples_[sid]
+            run_times = [(t, n) for t, n in zip(
+                self._job_run_times_.get(sid, ()), samples) if t is not None]
+            if len(run_times) >= Loader.STRAGGLER_MIN_SAMPLES:
+                durations, samples = zip(*run_times)
+            if len(durations) >= Loader.STRAGGLER_MIN_SAMPLES and \
+                    sum(durations) > 0:
+                throughputs[sid] = sum(samples) / sum(durations)
+        speeds = {}
+        for values in self._slave_powers_, throughputs:
+            if values:
+                fastest = max(values.values())
+                speeds.update((sid, val / fastest)
+                              for sid, val in values.items())
+        return speeds
+
+    def _max_minibatch_size_for(self, slave_id):
+        """Returns the minibatch size for the specified slave which is
+        proportional to its speed if weighted_minibatches is set.
+        """
+        if not self.weighted_minibatches or slave_id is None:
+            return self.max_minibatch_size
+        speed = self._slave_speeds().get(slave_id, 1)
+        return max(int(round(self.max_minibatch_size * max(
+            speed, Loader.MIN_WEIGHTED_MINIBATCH))), 1)
+
+    def _find_straggler(self, slave_id):
+        """Looks for the minibatch which is worth serving once more at the
+        end of the class.
+
+        Returns:
+            (minibatch, slave ID) or None. The minibatches processed by
+            slave_id itself are never returned: it would not finish them
+            sooner.
+        """
+        if not self.speculative_execution or not self.class_ended or \
+                len(self.failed_minibatches) > 0:
+            return None
+        means = [numpy.mean(d) for d in self._job_durations_.values()
+                 if len(d) >= Loader.STRAGGLER_MIN_SAMPLES]
+        if not means:
+            return None
+        slowest = numpy.median(means) * Loader.STRAGGLER_SLOWDOWN
+        now = time.time()
+        for sid, pending in self.pending_minibatches_.items():
+            if sid == slave_id:
+                continue
+            threshold = slowest
+            durations = self._job_durations_.get(sid, ())
+            if len(durations) >= Loader.STRAGGLER_MIN_SAMPLES:
+                threshold = min(threshold, numpy.mean(durations) +
+                                Loader.STRAGGLER_SIGMAS * numpy.std(durations))
+            for minibatch, served in zip(pending, self._serve_times_[sid]):
+                if minibatch is None or minibatch in self._speculative_ or \
+                        now - served <= threshold:
+                    continue
+                return minibatch, sid
+        return None
+
     def get_metric_names(self):
         if not self.testing:
             return {"Total epochs"}
@@ -727,7 +959,8 @@ class Loader(Unit):
         try:
             minibatch_def = self.failed_minibatches.pop()
         except IndexError:
-            minibatch_def = self._advance_global_offset()
+            minibatch_def = self._advance_global_offset(
+                self._max_minibatch_size_for(slave_id))
         minibatch_offset, minibatch_size = minibatch_def
         self.pending_minibatches_[slave_id].append(minibatch_def)
         self.minibatch_offset, self.minibatch_size = minibatch_def
@@ -737,14 +970,16 @@ class Loader(Unit):
             # If this method returned True, it means that some acceleration
             # is used and numpy/CPU is not directly used; effectively,
             # fill_minibatch() becomes redundant.
+            self._stop_minibatch_prefetch()
             return
 
         if self.is_master:
             return
 
-        self.fill_minibatch()
-        self.normalize_minibatch()
-        self.map_minibatch_labels()
+        if not self._take_prefetched_minibatch(minibatch_def):
+            self.fill_minibatch()
+            self.normalize_minibatch()
+            self.map_minibatch_labels()
 
         if minibatch_size < self.max_minibatch_size:
             self.minibatch_data[minibatch_size:] = 0.0
@@ -808,7 +1043,12 @@ class Loader(Unit):
         if not self.has_labels:
             return
         self.minibatch_labels.map_write()
-        for i, l in enumerate(self.raw_minibatch_labels[:self.minibatch_size]):
+        raw_labels = self.raw_minibatch_labels[:self.minibatch_size]
+        if self.map_labels(raw_labels,
+                           self.minibatch_labels.mem[:self.minibatch_size]):
+            return
+        # Slow path which is also responsible for error reporting
+        for i, l in enumerate(raw_labels):
             try:
                 self.minibatch_labels[i] = self.labels_mapping[l]
             except KeyError as e:
@@ -818,6 +1058,65 @@ class Loader(Unit):
                         "inside fill_minibatch()")
                 raise from_none(e)
 
+    def map_labels(self, raw_labels, out):
+        """Maps raw_labels to internal integer labels in out using the
+        compiled form of labels_mapping (see _compile_labels_mapping()).
+
+        Returns:
+            True: out was filled.
+            False: vectorized mapping is impossible (e.g., unknown labels or
+                   unsupported label types), fall back to labels_mapping.
+        """
+        # labels_mapping may be changed in place, so the contents are
+        # compared (it is as small as the number of the distinct labels)
+        if self._labels_compiled_for_ != self.labels_mapping:
+            self._compile_labels_mapping()
+        keys = self._labels_keys_
+        if keys is None or len(raw_labels) == 0:
+            return False
+        raw = numpy.asarray(raw_labels)
+        if raw.shape != out.shape or \
+                raw.dtype.kind not in self._LABEL_KINDS[keys.dtype.kind]:
+            return False
+        lut = self._labels_lut_
+        if lut is not None:
+            if raw.min() < 0 or raw.max() >= len(lut):
+                return False
+            numpy.take(lut, raw, out=out, mode="clip")
+            return not (out < 0).any()
+        positions = numpy.searchsorted(keys, raw)
+        numpy.minimum(positions, len(keys) - 1, positions)
+        if not (keys[positions] == raw).all():
+            return False
+        numpy.take(self._labels_values_, positions, out=out, mode="clip")
+        return True
+
+    def _compile_labels_mapping(self):
+        """Converts labels_mapping to NumPy arrays so that the whole minibatch
+        can be mapped at once. Small non-negative integer labels produce a
+        dense lookup table, other homogeneous scalar labels (strings, floats,
+        sparse integers) produce sorted keys for numpy.searchsorted().
+        """
+        mapping = self.labels_mapping
+        self._labels_compiled_for_ = dict(mapping)
+        self._labels_keys_ = self._labels_values_ = self._labels_lut_ = None
+        if len(mapping) == 0 or len(set(type(k) for k in mapping)) > 1:
+            return
+        keys = numpy.array(list(mapping))
+        if keys.ndim != 1 or keys.dtype.kind not in self._LABEL_KINDS:
+            return
+        values = numpy.array(list(mapping.values()), Loader.LABEL_DTYPE)
+        order = numpy.argsort(keys, kind="mergesort")
+        self._labels_keys_ = keys[order]
+        self._labels_values_ = values[order]
+        if keys.dtype.kind not in "iu":
+            return
+        kmin, kmax = int(keys.min()), int(keys.max())
+        if kmin < 0 or kmax >= max(4 * len(keys), 1 << 16):
+            return
+        self._labels_lut_ = numpy.full(kmax + 1, -1, Loader.LABEL_DTYPE)
+        self._labels_lut_[keys] = values
+
     def fill_indices(self, start_offset, count):
         """Fills minibatch_indices.
 
@@ -877,8 +1176,12 @@ class Loader(Unit):
             (self.minibatch_class == TEST and self.testing) or
             (self.minibatch_class == TRAIN and self.class_lengths[VALID] == 0))
 
-    def _advance_global_offset(self):
+    def _advance_global_offset(self, max_size=None):
         """Increments global_offset by an appropriate minibatch_size.
+
+        Arguments:
+            max_size: the limit of the minibatch size which is lower than
+                      max_minibatch_size (see weighted_minibatches).
         """
         # Slave mode is much simpler than others
         if self.is_slave:
@@ -891,12 +1194,143 @@ class Loader(Unit):
         # Compute next minibatch class and size
         self.minibatch_class, remainder = self.class_index_by_sample_index(
             self.global_offset)
-        minibatch_size = min(remainder, self.max_minibatch_size)
+        minibatch_size = min(remainder, max_size or self.max_minibatch_size)
         self.global_offset += minibatch_size
         self.train_ended <<= self.global_offset >= self.effective_total_samples
         self.test_ended <<= self.global_offset >= self.class_end_offsets[TEST]
         return self.global_offset, minibatch_size
 
+    def _init_minibatch_prefetch(self):
+        """Allocates the second set of the minibatch buffers (each Array or
+        per sample list attribute with "minibatch" in the name) and the random
+        generator of the background fill. The latter is seeded from prng, so
+        that the runs with prefetching are reproducible.
+        """
+        self._stop_minibatch_prefetch()
+        buffers = {}
+        for name, value in self.__dict__.items():
+            if "minibatch" not in name:
+                continue
+            if isinstance(value, memory.Array):
+                buffers[name] = memory.Array(
+                    numpy.zeros_like(value.mem) if value else None)
+            elif isinstance(value, list) and \
+                    len(value) == self.max_minibatch_size:
+                buffers[name] = None
+        self._minibatch_prefetch_buffers_ = buffers
+        self._minibatch_prefetch_prng_ = random_generator.RandomGenerator(
+            "%s_prefetch" % self.id)
+        # The Mersenne Twister state is 624 words (position 624 makes it
+        # regenerate them before the first draw); prng must not advance,
+        # otherwise the following shuffles would differ
+        state = self.prng.state
+        self._minibatch_prefetch_prng_.state = (
+            "MT19937", self.prng.randint(0, 1 << 32, 624).astype(
+                numpy.uint32), 624, 0, 0.0)
+        self.prng.state = state
+        self._minibatch_prefetch_jobs_ = queue.Queue()
+        self._minibatch_prefetch_results_ = queue.Queue()
+        self._minibatch_prefetch_thread_ = threading.Thread(
+            target=self._minibatch_prefetch_loop,
+            args=(self._minibatch_prefetch_jobs_,
+                  self._minibatch_prefetch_results_),
+            name="%s minibatch prefetch" % self.name)
+        self._minibatch_prefetch_thread_.daemon = True
+        self._minibatch_prefetch_thread_.start()
+
+    def _prefetch_next_minibatch(self):
+        """Predicts the next minibatch and passes it to the background thread
+        unless the next serve is not known in advance: a failed minibatch is
+        pending or the data is going to be reshuffled.
+        """
+        if self.failed_minibatches or \
+                self.global_offset >= self.effective_total_samples:
+            return
+        minibatch_class, remainder = self.class_index_by_sample_index(
+            self.global_offset)
+        size = min(remainder, self.max_minibatch_size)
+        # A shallow copy of this loader which fills the second set of the
+        # buffers, so that the units may go on reading the first one
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        for name, buffer in self._minibatch_prefetch_buffers_.items():
+            clone.__dict__[name] = buffer if buffer is not None else \
+                [None] * len(self.__dict__[name])
+        clone.__dict__.update(
+            _minibatch_offset_=self.global_offset + size,
+            _minibatch_size_=size, _minibatch_class=minibatch_class,
+            _prng=self._minibatch_prefetch_prng_, _id=self.id + " prefetch")
+        self.shuffled_indices.map_read()
+        clone.minibatch_indices.mem[:size] = self.shuffled_indices[
+            self.global_offset:self.global_offset + size]
+        self._prefetched_minibatch_ = clone, dict(self.__dict__)
+        self._minibatch_prefetch_jobs_.put(clone)
+
+    def _stop_minibatch_prefetch(self):
+        if self._minibatch_prefetch_jobs_ is None:
+            return
+        self._take_prefetched_minibatch(None)
+        self._minibatch_prefetch_jobs_.put(None)
+        self._minibatch_prefetch_jobs_ = None
+        self._minibatch_prefetch_thread_ = None
+
+    @staticmethod
+    def _minibatch_prefetch_loop(jobs, results):
+        while True:
+            clone = jobs.get()
+            if clone is None:
+                break
+            try:
+                clone.fill_minibatch()
+                clone.normalize_minibatch()
+                clone.map_minibatch_labels()
+            except Exception as e:
+                results.put(e)
+            else:
+                results.put(None)
+
+    def _take_prefetched_minibatch(self, minibatch_def):
+        """Waits for the background fill and copies its results to the
+        minibatch buffers if it prepared minibatch_def.
+
+        Returns:
+            True if the minibatch was prefetched; otherwise, False.
+        """
+        if self._prefetched_minibatch_ is None:
+            return False
+        clone, original = self._prefetched_minibatch_
+        self._prefetched_minibatch_ = None
+        error = self._minibatch_prefetch_results_.get()
+        size = clone.minibatch_size
+        if error is not None:
+            self.warning("Failed to prefetch the minibatch: %s", error)
+            return False
+        if minibatch_def != (clone.minibatch_offset, size) or \
+                clone.minibatch_class != self.minibatch_class or \
+                (clone.minibatch_indices.mem[:size] !=
+                 self.minibatch_indices.mem[:size]).any():
+            self.debug("Discarded the prefetched minibatch %s",
+                       (clone.minibatch_offset, size))
+            return False
+        for name in self._minibatch_prefetch_buffers_:
+            src, dst = clone.__dict__[name], self.__dict__[name]
+            if isinstance(dst, list):
+                dst[:size] = src[:size]
+            elif dst:
+                dst.map_invalidate()
+                dst.mem[:size] = src.mem[:size]
+        # Keep what fill_minibatch() reassigned, e.g. the counters of caches
+        missing = object()
+        for name, value in clone.__dict__.items():
+            if name in self._minibatch_prefetch_buffers_ or \
+                    name in Loader.PREFETCHED_ATTRS:
+                continue
+            before = original.get(name, missing)
+            if value is not before and \
+                    self.__dict__.get(name, missing) is before:
+                self.__dict__[name] = value
+        return True
+
     def _on_successful_serve(self):
         self.samples_served += self.minibatch_size
         if self.last_minibatch:
@@ -933,6 +1367,7 @@ class Loader(Unit):
             self.labels_mapping.update(
                 {k: i for i, k in enumerate(sorted(self.train_diff_labels))})
             self._reversed_labels_mapping[:] = sorted(self.labels_mapping)
+        self._compile_labels_mapping()
         self._print_label_stats(self.train_diff_labels, CLASS_NAME[TRAIN])
         for i, diff_labels in enumerate(other_diff_labels):
             if self.class_lengths[i] > 0:
@@ -36,6 +36,8 @@ under the License.
 
 
 from __future__ import division
+import argparse
+from hashlib import sha1
 from itertools import chain
 import cv2
 import numpy
@@ -44,10 +46,13 @@ from zope.interface import implementer
 
 from veles.compat import from_none
 import veles.error as error
+from veles.external.progressbar import ProgressBar
+from veles.loader.base import LoaderError
 from veles.loader.file_loader import AutoLabelFileLoader, FileFilter, \
     FileLoaderBase, FileListLoaderBase
 from veles.loader.image import ImageLoader, IImageLoader, MODE_COLOR_MAP, \
     COLOR_CHANNELS_MAP
+from veles.loader.image_cache import ImageCache
 
 
 class FileImageLoaderBase(ImageLoader, FileFilter):
@@ -60,6 +65,83 @@ class FileImageLoaderBase(ImageLoader, FileFilter):
         kwargs["file_type"] = "image"
         kwargs["file_subtypes"] = kwargs.get("file_subtypes", ["jpeg", "png"])
         super(FileImageLoaderBase, self).__init__(workflow, **kwargs)
+        self.cache_images = kwargs.get("cache_images", self.cache_images)
+
+    def init_unpickled(self):
+        super(FileImageLoaderBase, self).init_unpickled()
+        self._image_cache_ = None
+        parser = FileImageLoaderBase.init_parser()
+        args, _ = parser.parse_known_args(self.argv)
+        self.cache_images = args.image_cache
+
+    @staticmethod
+    def init_parser(parser=None):
+        parser = parser or argparse.ArgumentParser()
+        parser.add_argument("--image-cache", default=False,
+                            action="store_true",
+                            help="Store decoded images on disk and reuse "
+                                 "them in the subsequent runs (see "
+                                 "root.common.loader.image_cache).")
+        return parser
+
+    @property
+    def image_cache(self):
+        if not self.cache_images or self.uncropped_shape == tuple():
+            return None
+        if self._image_cache_ is None:
+            self._image_cache_ = ImageCache(self.image_cache_settings)
+        return self._image_cache_
+
+    @property
+    def image_cache_settings(self):
+        """
+        :return: dict with everything which influences the results of
+        _load_image(crop=False).
+        """
+        if self.background_image is not None:
+            background = sha1(numpy.ascontiguousarray(
+                self.background_image)).hexdigest()
+        else:
+            background = [float(c) for c in self.background_color]
+        # Only the image reading implementation matters, so that the cache
+        # warmed by one loader class is shared with the others
+        reader = next(c for c in type(self).__mro__
+                      if "get_image_data" in c.__dict__)
+        return {
+            "reader": "%s.%s" % (reader.__module__, reader.__name__),
+            "color_space": self.color_space,
+            "source_dtype": numpy.dtype(self.source_dtype).str,
+            "shape": list(self.uncropped_shape),
+            "scale": self.scale if not isinstance(self.scale, tuple)
+            else list(self.scale),
+            "scale_maintain_aspect_ratio": self.scale_maintain_aspect_ratio,
+            "add_sobel": self.add_sobel,
+            "background": background,
+        }
+
+    def warm_image_cache(self):
+        """Decodes and caches all the images which are not cached yet.
+        :return: The number of decoded images.
+        """
+        cache = self.image_cache
+        if cache is None:
+            raise LoaderError("Image cache is disabled")
+        keys = [k for k in chain.from_iterable(self.class_keys)
+                if not cache.is_fresh(k)]
+        self.info("Caching %d images in %s...", len(keys), cache.path)
+        pbar = ProgressBar(maxval=len(keys), term_width=40)
+        pbar.start()
+        for _ in self._load_images(keys):
+            pbar.inc()
+        pbar.finish()
+        cache.flush()
+        return len(keys)
+
+    def stop(self):
+        super(FileImageLoaderBase, self).stop()
+        if self._image_cache_ is not None:
+            self._image_cache_.close()
+            self._image_cache_ = None
 
     def get_image_info(self, key):
         """
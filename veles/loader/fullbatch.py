@@ -48,6 +48,7 @@ from veles.accelerated_units import AcceleratedUnit, IOpenCLUnit, ICUDAUnit, \
 from veles.backends import NumpyDevice
 from veles.compat import from_none
 import veles.memory as memory
+from veles.numpy_ext import gather
 from veles.opencl_types import numpy_dtype_to_opencl
 from veles.units import UnitCommandLineArgumentsRegistry
 from veles.loader.base import ILoader, Loader, LoaderMSEMixin, \
@@ -310,13 +311,12 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
         return True
 
     def fill_minibatch(self):
-        for i, sample_index in enumerate(
-                self.minibatch_indices.mem[:self.minibatch_size]):
-            # int() is required by (guess what...) PyPy
-            self.minibatch_data[i] = self.original_data[int(sample_index)]
-            if self.has_labels:
-                self.minibatch_labels[i] = \
-                    self._mapped_original_labels_[int(sample_index)]
+        indices = self.minibatch_indices.mem[:self.minibatch_size]
+        gather(self.original_data.mem, indices,
+               self.minibatch_data.mem[:self.minibatch_size])
+        if self.has_labels:
+            gather(self._mapped_original_labels_.mem, indices,
+                   self.minibatch_labels.mem[:self.minibatch_size])
 
     def map_minibatch_labels(self):
         pass
@@ -460,6 +460,9 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
     def _init_mapped_original_labels(self):
         self._mapped_original_labels_.reset(
             numpy.zeros(self.total_samples, Loader.LABEL_DTYPE))
+        if self.map_labels(self.original_labels,
+                           self._mapped_original_labels_.mem):
+            return
         for i, label in enumerate(self.original_labels):
             self._mapped_original_labels_[i] = self.labels_mapping[label]
 
@@ -555,9 +558,9 @@ class FullBatchLoaderMSEMixin(LoaderMSEMixin):
 
     def fill_minibatch(self):
         super(FullBatchLoaderMSEMixin, self).fill_minibatch()
-        for i, v in enumerate(self.minibatch_indices[:self.minibatch_size]):
-            # int() is required by PyPy
-            self.minibatch_targets[i] = self.original_targets[int(v)]
+        gather(self.original_targets.mem,
+               self.minibatch_indices.mem[:self.minibatch_size],
+               self.minibatch_targets.mem[:self.minibatch_size])
 
 
 class FullBatchLoaderMSE(FullBatchLoaderMSEMixin, FullBatchLoader):
@@ -119,8 +119,7 @@ class FullBatchImageLoader(ImageLoader, FullBatchLoader):
     def _load_distorted_keys(self, keys, data, labels, label_values, offset,
                              pbar):
         has_labels = False
-        for key in keys:
-            img, _, bbox = self._load_image(key, crop=False)
+        for key, (img, _, bbox) in self._load_images(keys):
             label, has_labels = self._load_label(key, has_labels)
             for ci in range(self.crop_number):
                 if self.crop is not None:
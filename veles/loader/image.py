@@ -36,8 +36,11 @@ under the License.
 
 
 from __future__ import division
-from collections import defaultdict
+import argparse
+from collections import defaultdict, deque
 from itertools import chain
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 try:
     import cv2
 except ImportError:
@@ -112,6 +115,8 @@ class ImageLoader(LoaderWithValidationRatio):
                      the values supported by OpenCV, e.g., GRAY or HSV.
         source_dtype: dtype to work with during various image operations.
         shape: image shape (tuple) - set after initialize().
+        loader_workers: the number of threads which decode images (0 means
+                        the number of CPU cores).
 
      Must be overriden in child classes:
         get_image_label()
@@ -142,6 +147,51 @@ class ImageLoader(LoaderWithValidationRatio):
             "background_color", (0xff, 0x14, 0x93))
         self.smart_crop = kwargs.get("smart_crop", True)
         self.minibatch_label_values = Array()
+        self.loader_workers = kwargs.get("loader_workers", self.loader_workers)
+
+    def init_unpickled(self):
+        super(ImageLoader, self).init_unpickled()
+        self._decoding_pool_ = None
+        parser = ImageLoader.init_parser()
+        args, _ = parser.parse_known_args(self.argv)
+        self.loader_workers = args.loader_workers
+
+    @staticmethod
+    def init_parser(parser=None):
+        parser = parser or argparse.ArgumentParser()
+        parser.add_argument("--loader-workers", default=1, type=int,
+                            help="Number of threads which decode and scale "
+                                 "images in image loaders (0 means the number "
+                                 "of CPU cores).")
+        return parser
+
+    @property
+    def loader_workers(self):
+        return self._loader_workers
+
+    @loader_workers.setter
+    def loader_workers(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                "loader_workers must be an integer (got %s)" % type(value))
+        if value < 0:
+            raise ValueError(
+                "loader_workers must be greater than or equal to zero "
+                "(got %d)" % value)
+        if value == 0:
+            value = cpu_count()
+        if getattr(self, "_decoding_pool_", None) is not None and \
+                value != self._loader_workers:
+            self._close_decoding_pool()
+        self._loader_workers = value
+
+    @property
+    def image_cache(self):
+        """
+        :return: :class:`veles.loader.image_cache.ImageCache` which stores
+        the results of _load_image(crop=False) or None.
+        """
+        return None
 
     @property
     def source_dtype(self):
@@ -563,8 +613,9 @@ class ImageLoader(LoaderWithValidationRatio):
         """
         index = 0
         has_labels = False
-        for key in keys:
-            obj, label_value, _ = self._load_image(key)
+        for key, (obj, label_value, bbox) in self._load_images(keys):
+            if self.crop is not None:
+                obj, label_value = self.crop_image(obj, bbox)
             label, has_labels = self._load_label(key, has_labels)
             if (self.crop is None or not crop) and \
                     obj.shape[:2] != self.uncropped_shape:
@@ -583,6 +634,10 @@ class ImageLoader(LoaderWithValidationRatio):
                 pbar.inc()
         return has_labels
 
+    def stop(self):
+        super(ImageLoader, self).stop()
+        self._close_decoding_pool()
+
     def load_labels(self):
         if not self.has_labels:
             return
@@ -612,9 +667,12 @@ class ImageLoader(LoaderWithValidationRatio):
             self.info("Scanning for changes...")
             progress = ProgressBar(maxval=self.total_samples, term_width=40)
             progress.start()
+            cache = self.image_cache
             for keys in self.class_keys:
                 for key in keys:
                     progress.inc()
+                    if cache is not None and cache.is_fresh(key):
+                        continue
                     size, _ = self.get_effective_image_info(key)
                     if size != self.uncropped_shape:
                         raise error.BadFormatError(
@@ -774,6 +832,57 @@ class ImageLoader(LoaderWithValidationRatio):
         bbox = self.get_image_bbox(key, size)
         return self.preprocess_image(data, color, crop, bbox)
 
+    def _load_images(self, keys):
+        """Yields (key, _load_image(key, crop=False)) in the order of keys.
+
+        Decoding, color conversion and scaling run on loader_workers threads
+        (OpenCV and PIL release the GIL). Cropping and distortions use
+        self.prng and thus must be applied by the caller in the keys order,
+        so that the results do not depend on the number of workers.
+        """
+        # Create the cache on this thread before the workers access it
+        cache = self.image_cache
+        if self.loader_workers == 1:
+            for key in keys:
+                yield key, self._load_uncropped_image(key)
+        else:
+            if self._decoding_pool_ is None:
+                self._decoding_pool_ = ThreadPool(self.loader_workers)
+            # Bound the number of decoded images waiting to be consumed
+            window = self.loader_workers * 4
+            pending = deque()
+            for key in keys:
+                pending.append((key, self._decoding_pool_.apply_async(
+                    self._load_uncropped_image, (key,))))
+                if len(pending) >= window:
+                    key, result = pending.popleft()
+                    yield key, result.get()
+            while len(pending) > 0:
+                key, result = pending.popleft()
+                yield key, result.get()
+        if cache is not None:
+            cache.flush(force=False)
+
+    def _load_uncropped_image(self, key):
+        cache = self.image_cache
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                data, bbox = cached
+                return data, 1, bbox
+        data, label_value, bbox = self._load_image(key, crop=False)
+        if cache is not None:
+            cache.put(key, data, bbox)
+        return data, label_value, bbox
+
+    def _close_decoding_pool(self):
+        pool = self._decoding_pool_
+        if pool is None:
+            return
+        self._decoding_pool_ = None
+        pool.close()
+        pool.join()
+
     def _load_label(self, key, has_labels):
         label = self.get_image_label(key)
         if label is not None:
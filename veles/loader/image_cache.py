@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Persistent cache of decoded images for file based image loaders.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import errno
+import fcntl
+from hashlib import sha1
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy
+
+from veles.config import root
+from veles.logger import Logger
+
+
+class ImageCache(Logger):
+    """Stores decoded and scaled images on disk, so that the next runs with
+    the same preprocessing settings do not have to decode them again.
+
+    Images which were preprocessed with the same settings share a bucket -
+    a directory with "data.bin", the memory mapped array of samples, and
+    "index.json", which maps each image path to the row in that array and
+    the (mtime, size) of the file it was decoded from. Several processes may
+    use the same bucket: the first one which opens it becomes the writer,
+    the others only read. Each user holds a shared lock on "lock", so that
+    buckets in use are never evicted. The rest are evicted in the least
+    recently used order when the total size exceeds max_size.
+
+    Cropping and distortions are random and thus are applied after the
+    cache, so they do not influence the settings.
+    """
+    INDEX = "index.json"
+    DATA = "data.bin"
+    LOCK = "lock"
+    WRITER_LOCK = "writer.lock"
+
+    def __init__(self, settings, directory=None, max_size=None, **kwargs):
+        super(ImageCache, self).__init__(**kwargs)
+        cfg = root.common.loader.image_cache
+        self.directory = directory or cfg.dir
+        self.max_size = max_size if max_size is not None else cfg.max_size
+        self.settings = settings
+        self.path = os.path.join(self.directory, sha1(json.dumps(
+            settings, sort_keys=True).encode("utf-8")).hexdigest())
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dtype = self._shape = None
+        self._rows = 0
+        self._data = None
+        self._full = False
+        self._dirty = False
+        self._last_flush = time.time()
+        self._open()
+
+    @property
+    def writable(self):
+        return self._writable
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def is_fresh(self, key):
+        """Checks whether key is cached and the file has not changed since.
+        """
+        entry = self._entries.get(key)
+        return entry is not None and entry[1:3] == self._stat(key)
+
+    def get(self, key):
+        """
+        :param key: The path to the image file.
+        :return: (data, bbox) or None if key is not cached or is stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1:3] != self._stat(key):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return numpy.array(self._data[entry[0]]), tuple(entry[3])
+
+    def put(self, key, data, bbox):
+        """Stores the preprocessed image data. Silently does nothing if the
+        cache is read only, full or data has the different shape.
+        :return: True if data was stored; otherwise, False.
+        """
+        if not self.writable or self._full:
+            return False
+        stat = self._stat(key)
+        if stat is None:
+            return False
+        with self._lock:
+            if self._shape is None:
+                self._dtype, self._shape = data.dtype, data.shape
+            if data.dtype != self._dtype or data.shape != self._shape:
+                return False
+            entry = self._entries.get(key)
+            if entry is not None:
+                row = entry[0]
+            else:
+                row = self._rows
+                if not self._reserve(row + 1):
+                    return False
+                self._rows += 1
+            self._data[row] = data
+            self._entries[key] = [row, stat[0], stat[1],
+                                  [int(b) for b in bbox]]
+            self._dirty = True
+        return True
+
+    def flush(self, force=True):
+        """Writes the index to disk. If force is False, does nothing if the
+        previous flush happened less than flush_interval seconds ago.
+        """
+        if not self.writable or not self._dirty:
+            return
+        if not force and time.time() - self._last_flush < \
+                root.common.loader.image_cache.flush_interval:
+            return
+        with self._lock:
+            self._data.flush()
+            index = {"settings": self.settings,
+                     "dtype": self._dtype.str, "shape": self._shape,
+                     "rows": self._rows, "entries": self._entries}
+            tmp = os.path.join(self.path, self.INDEX + ".tmp")
+            with open(tmp, "w") as fout:
+                json.dump(index, fout)
+            os.rename(tmp, os.path.join(self.path, self.INDEX))
+            self._dirty = False
+            self._last_flush = time.time()
+        self.debug("Flushed %d entries to %s", len(self._entries), self.path)
+
+    def close(self):
+        if self._data is None:
+            return
+        self.flush()
+        self._data = None
+        self._writer_lock_file.close()
+        self._lock_file.close()
+        self.info("%s: %d hits, %d misses, %d images", self.path, self.hits,
+                  self.misses, len(self._entries))
+
+    @staticmethod
+    def buckets(directory=None):
+        """
+        :return: The list of (path, size in bytes, last usage time, settings)
+        of buckets ordered from the least recently used.
+        """
+        directory = directory or root.common.loader.image_cache.dir
+        if not os.path.isdir(directory):
+            return []
+        buckets = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                last_used = os.path.getmtime(
+                    os.path.join(path, ImageCache.LOCK))
+                with open(os.path.join(path, ImageCache.INDEX), "r") as fin:
+                    settings = json.load(fin)["settings"]
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+            buckets.append((path, ImageCache._bucket_size(path), last_used,
+                            settings))
+        buckets.sort(key=lambda b: b[2])
+        return buckets
+
+    @staticmethod
+    def purge(directory=None, max_size=0, keep=None):
+        """Removes the least recently used buckets until the total size
+        becomes not greater than max_size. Buckets which are in use and keep
+        are not removed.
+        :return: The total size of the remaining buckets.
+        """
+        buckets = ImageCache.buckets(directory)
+        total = sum(b[1] for b in buckets)
+        for path, size, _, _ in buckets:
+            if total <= max_size:
+                break
+            if path == keep:
+                continue
+            with open(os.path.join(path, ImageCache.LOCK), "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        return total
+
+    def _open(self):
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._lock_file = open(os.path.join(self.path, self.LOCK), "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_SH)
+        self._writer_lock_file = open(
+            os.path.join(self.path, self.WRITER_LOCK), "a")
+        try:
+            fcntl.flock(self._writer_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._writable = True
+        except (IOError, OSError):
+            self._writable = False
+        # The modification time of the lock file marks the last usage
+        os.utime(self._lock_file.name, None)
+        try:
+            with open(os.path.join(self.path, self.INDEX), "r") as fin:
+                index = json.load(fin)
+        except (IOError, OSError, ValueError):
+            index = None
+        if index is not None and index["rows"] > 0:
+            self._dtype = numpy.dtype(index["dtype"])
+            self._shape = tuple(index["shape"])
+            self._rows = index["rows"]
+            self._entries = index["entries"]
+            self._data = numpy.memmap(
+                os.path.join(self.path, self.DATA), self._dtype,
+                "r+" if self.writable else "r",
+                shape=(self._rows,) + self._shape)
+        self.debug("Opened %s (%d images, %s)", self.path, self._rows,
+                   "writable" if self.writable else "read only")
+
+    def _reserve(self, rows):
+        if self._data is not None and len(self._data) >= rows:
+            return True
+        capacity = max(rows, 2 * (len(self._data) if self._data is not None
+                                  else 0), 64)
+        row_size = self._dtype.itemsize * int(numpy.prod(self._shape))
+        file_name = os.path.join(self.path, self.DATA)
+        old_size = os.path.getsize(file_name) \
+            if os.path.exists(file_name) else 0
+        new_size = capacity * row_size
+        if ImageCache.purge(self.directory, self.max_size -
+                            (new_size - old_size), keep=self.path) + \
+                new_size - old_size > self.max_size:
+            self.warning("%s is full (max size is %d bytes)", self.path,
+                         self.max_size)
+            self._full = True
+            return False
+        if self._data is not None:
+            self._data.flush()
+        with open(file_name, "ab") as fout:
+            fout.truncate(new_size)
+        self._data = numpy.memmap(file_name, self._dtype, "r+",
+                                  shape=(capacity,) + self._shape)
+        return True
+
+    @staticmethod
+    def _stat(key):
+        try:
+            stat = os.stat(key)
+        except (OSError, TypeError):
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    @staticmethod
+    def _bucket_size(path):
+        try:
+            return os.path.getsize(os.path.join(path, ImageCache.DATA))
+        except OSError:
+            return 0
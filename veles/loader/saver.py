@@ -36,12 +36,17 @@ under the License.
 
 
 import bz2
+from collections import OrderedDict
 import gzip
 from io import SEEK_END
+import json
 import os
+import struct
+import threading
 
 import numpy
 from six import BytesIO
+from six.moves import queue
 import snappy
 from zope.interface import implementer
 
@@ -49,6 +54,7 @@ from veles import error
 from veles.compat import from_none, lzma
 from veles.config import root
 from veles.loader.base import Loader, ILoader, CLASS_NAME, TRAIN
+from veles.numpy_ext import gather, roundup
 from veles.pickle2 import pickle, best_protocol
 from veles.snapshotter import SnappyFile
 from veles.units import Unit, IUnit
@@ -65,9 +71,97 @@ if not hasattr(gzip, "decompress"):
     gzip.decompress = decompress
 
 
+# The raw format starts with this signature, followed by the little endian
+# uint64 length of the JSON header and the header itself. Sample and label
+# arrays of each class follow, aligned to RAW_ALIGNMENT bytes; their offsets
+# in the header are relative to the aligned end of the header.
+RAW_SIGNATURE = b"VELESMB\x01"
+RAW_ALIGNMENT = 4096
+
+
+def read_raw_header(file):
+    """Reads the header of the raw minibatches file.
+    :return: The header dict, the absolute offset of the arrays.
+    """
+    if file.read(len(RAW_SIGNATURE)) != RAW_SIGNATURE:
+        raise error.BadFormatError("%s is not a raw minibatches file" %
+                                   file.name)
+    size, = struct.unpack("<Q", file.read(8))
+    header = json.loads(file.read(size).decode("utf-8"))
+    return header, roundup(len(RAW_SIGNATURE) + 8 + size, RAW_ALIGNMENT)
+
+
+def write_raw_header(file, class_lengths, max_minibatch_size, sample_shape,
+                     data_dtype, labels_shape, labels_dtype, labels_mapping):
+    """Writes the header of the raw minibatches file and reserves the space
+    for the arrays.
+    :return: The absolute offsets of sample arrays, the absolute offsets of
+    label arrays, sample size in bytes, label size in bytes.
+    """
+    data_dtype = numpy.dtype(data_dtype)
+    has_labels = labels_shape is not None
+    if has_labels:
+        labels_dtype = numpy.dtype(labels_dtype)
+    header = {
+        "class_lengths": list(class_lengths),
+        "max_minibatch_size": max_minibatch_size,
+        "data_shape": list(sample_shape),
+        "data_dtype": data_dtype.str,
+        "labels_shape": list(labels_shape) if has_labels else None,
+        "labels_dtype": labels_dtype.str if has_labels else None,
+        "labels_mapping": sorted(
+            ((k.item() if isinstance(k, numpy.generic) else k, v)
+             for k, v in labels_mapping.items()), key=lambda p: p[1]),
+        "data_offsets": [], "labels_offsets": []}
+    sample_size = data_dtype.itemsize * int(numpy.prod(sample_shape))
+    label_size = labels_dtype.itemsize * int(numpy.prod(labels_shape)) \
+        if has_labels else 0
+    offset = 0
+    for length in class_lengths:
+        header["data_offsets"].append(offset)
+        offset = roundup(offset + length * sample_size, RAW_ALIGNMENT)
+        header["labels_offsets"].append(offset)
+        offset = roundup(offset + length * label_size, RAW_ALIGNMENT)
+    encoded = json.dumps(header).encode("utf-8")
+    file.write(RAW_SIGNATURE)
+    file.write(struct.pack("<Q", len(encoded)))
+    file.write(encoded)
+    base = roundup(file.tell(), RAW_ALIGNMENT)
+    file.truncate(base + offset)
+    return ([base + o for o in header["data_offsets"]],
+            [base + o for o in header["labels_offsets"]],
+            sample_size, label_size)
+
+
+def read_offset_table(file, chunks_count):
+    """Reads the offset table which MinibatchesSaver writes to the end of
+    the pickle format file. Its size is measured by pickling the fake one.
+    """
+    class BytesMeasurer(object):
+        def __init__(self):
+            self.size = 0
+
+        def write(self, data):
+            self.size += len(data)
+
+    bm = BytesMeasurer()
+    fake_table = [numpy.uint64(i) for i in range(chunks_count)]
+    pickle.dump(fake_table, bm, protocol=best_protocol)
+    file.seek(-bm.size, SEEK_END)
+    offset_table = [int(offset) for offset in pickle.load(file)]
+    # Virtual end
+    offset_table.append(file.tell() - bm.size)
+    return offset_table
+
+
 @implementer(IUnit)
 class MinibatchesSaver(Unit):
     """Saves data from Loader to pickle file.
+
+    Attributes:
+        format: "pickle" writes compressed pickled chunks, "raw" writes
+                uncompressed contiguous arrays which MinibatchesLoader
+                memory maps.
     """
     CODECS = {
         "raw": lambda f, _: f,
@@ -86,6 +180,7 @@ class MinibatchesSaver(Unit):
         self.compression = kwargs.get("compression", "snappy")
         self.compression_level = kwargs.get("compression_level", 9)
         self.class_chunk_sizes = kwargs.get("class_chunk_sizes", (0, 0, 1))
+        self.format = kwargs.get("format", "pickle")
         self.offset_table = []
         self.demand(
             "minibatch_data", "minibatch_labels", "minibatch_class",
@@ -95,11 +190,24 @@ class MinibatchesSaver(Unit):
     def init_unpickled(self):
         super(MinibatchesSaver, self).init_unpickled()
         self._file_ = None
+        self._raw_layout_ = None
 
     @property
     def file(self):
         return self._file_
 
+    @property
+    def format(self):
+        return self._format
+
+    @format.setter
+    def format(self, value):
+        if value not in ("pickle", "raw"):
+            raise ValueError(
+                "format must be either \"pickle\" or \"raw\" (got %s)" %
+                value)
+        self._format = value
+
     @property
     def effective_class_chunk_sizes(self):
         chunk_sizes = []
@@ -119,8 +227,19 @@ class MinibatchesSaver(Unit):
                 "You must disable shuffling in your loader (set shuffle_limit "
                 "to 0)")
         self._file_ = open(self.file_name, "wb")
+        if self.format == "raw":
+            self.write_raw_header()
+            return
         pickle.dump(self.get_header_data(), self.file, protocol=best_protocol)
 
+    def write_raw_header(self):
+        self._raw_layout_ = write_raw_header(
+            self.file, self.class_lengths, self.max_minibatch_size,
+            self.minibatch_data.shape[1:], self.minibatch_data.dtype,
+            self.minibatch_labels.shape[1:] if self.has_labels else None,
+            self.minibatch_labels.dtype if self.has_labels else None,
+            self.labels_mapping) + ([0] * len(self.class_lengths),)
+
     def get_header_data(self):
         return self.compression, self.class_lengths, self.max_minibatch_size, \
             self.effective_class_chunk_sizes, \
@@ -148,7 +267,26 @@ class MinibatchesSaver(Unit):
         if self.has_labels:
             prepared[1][:] = self.minibatch_labels[interval[0]:interval[1]]
 
+    def write_raw_minibatch(self):
+        data_offsets, labels_offsets, sample_size, label_size, written = \
+            self._raw_layout_
+        ci, size = self.minibatch_class, self.minibatch_size
+        if written[ci] + size > self.class_lengths[ci]:
+            raise error.Bug("%s overflow: %d + %d > %d" % (
+                CLASS_NAME[ci], written[ci], size, self.class_lengths[ci]))
+        self.minibatch_data.map_read()
+        self.file.seek(data_offsets[ci] + written[ci] * sample_size)
+        self.file.write(self.minibatch_data.mem[:size].tobytes())
+        if self.has_labels:
+            self.minibatch_labels.map_read()
+            self.file.seek(labels_offsets[ci] + written[ci] * label_size)
+            self.file.write(self.minibatch_labels.mem[:size].tobytes())
+        written[ci] += size
+
     def run(self):
+        if self.format == "raw":
+            self.write_raw_minibatch()
+            return
         prepared = self.prepare_chunk_data()
         chunk_size = self.effective_class_chunk_sizes[self.minibatch_class]
         chunks_number = int(numpy.ceil(self.max_minibatch_size / chunk_size))
@@ -160,10 +298,22 @@ class MinibatchesSaver(Unit):
                 prepared, (i * chunk_size, (i + 1) * chunk_size))
             pickle.dump(prepared, file, protocol=best_protocol)
             file.flush()
+            if file is not self.file and not isinstance(file, SnappyFile):
+                # gzip, bz2 and xz streams are finished only on close(),
+                # which leaves the underlying file open
+                file.close()
 
     def stop(self):
         if self.file.closed:
             return
+        if self.format == "raw":
+            written = self._raw_layout_[-1]
+            if written != list(self.class_lengths):
+                self.warning("Not all the samples were written: %s of %s",
+                             written, self.class_lengths)
+            self.file.close()
+            self.info("Wrote %s", self.file_name)
+            return
         pos = self.file.tell()
         pickle.dump(self.offset_table, self.file, protocol=best_protocol)
         self.debug("Offset table took %d bytes", self.file.tell() - pos)
@@ -180,6 +330,17 @@ def decompress_snappy(data):
 
 @implementer(ILoader)
 class MinibatchesLoader(Loader):
+    """Loads minibatches saved by :class:`MinibatchesSaver`. Files in the raw
+    format are memory mapped; the chunk cache and prefetching apply only to
+    the pickle format.
+
+    Attributes:
+        chunk_cache_size: the maximal size in bytes of the decoded chunks
+                          which are kept in memory (0 disables the cache).
+        prefetch_minibatches: the number of the next minibatches whose chunks
+                              are decoded in the background (0 disables
+                              prefetching).
+    """
 
     CODECS = {
         "raw": lambda b: b,
@@ -203,13 +364,64 @@ class MinibatchesLoader(Loader):
         self.minibatch_labels_shape = None
         self.minibatch_labels_dtype = None
         self.decompress = None
+        self.chunk_cache_size = kwargs.get("chunk_cache_size", 1 << 28)
+        self.prefetch_minibatches = kwargs.get("prefetch_minibatches", 2)
+
+    def init_unpickled(self):
+        super(MinibatchesLoader, self).init_unpickled()
+        # Snapshots taken before the chunk cache was introduced lack these
+        if not hasattr(self, "chunk_cache_size"):
+            self.chunk_cache_size = 1 << 28
+        if not hasattr(self, "prefetch_minibatches"):
+            self.prefetch_minibatches = 2
+        self._chunk_cache_ = OrderedDict()
+        self._chunk_cache_bytes_ = 0
+        self._pending_chunks_ = {}
+        self._chunk_lock_ = threading.Lock()
+        self._file_lock_ = threading.Lock()
+        self._prefetch_queue_ = None
+        self._prefetch_thread_ = None
+        self._chunk_cache_hits_ = self._chunk_cache_misses_ = 0
+        self._raw_data_ = self._raw_labels_ = None
 
     @property
     def file(self):
         return self._file_
 
+    @property
+    def chunk_cache_hits(self):
+        return self._chunk_cache_hits_
+
+    @property
+    def chunk_cache_misses(self):
+        return self._chunk_cache_misses_
+
+    def get_metric_names(self):
+        names = super(MinibatchesLoader, self).get_metric_names()
+        names.update(("Chunk cache hits", "Chunk cache misses"))
+        return names
+
+    def get_metric_values(self):
+        values = super(MinibatchesLoader, self).get_metric_values()
+        values.update({"Chunk cache hits": self.chunk_cache_hits,
+                       "Chunk cache misses": self.chunk_cache_misses})
+        return values
+
     def load_data(self):
         self._file_ = open(self.file_name, "rb")
+        if self.file.read(len(RAW_SIGNATURE)) == RAW_SIGNATURE:
+            self.file.seek(0)
+            self.load_raw_data()
+        else:
+            self.file.seek(0)
+            self.load_pickled_data()
+        if self.class_lengths[TRAIN] == 0:
+            assert self.normalization_type == "none", \
+                "You specified \"%s\" normalization but there are no train " \
+                "samples to analyze." % self.normalization_type
+            self.normalizer.analyze(self.minibatch_data.mem)
+
+    def load_pickled_data(self):
         (codec, class_lengths, self.old_max_minibatch_size,
          self.class_chunk_lengths,
          self.minibatch_data_shape, self.minibatch_data_dtype,
@@ -228,33 +440,49 @@ class MinibatchesLoader(Loader):
             mb_count = int(numpy.ceil(cl / self.old_max_minibatch_size))
             self.chunk_numbers.append(mb_chunks * mb_count)
 
-        class BytesMeasurer(object):
-            def __init__(self):
-                self.size = 0
-
-            def write(self, data):
-                self.size += len(data)
-
-        bm = BytesMeasurer()
-        fake_table = [numpy.uint64(i) for i in range(sum(self.chunk_numbers))]
-        pickle.dump(fake_table, bm, protocol=best_protocol)
-        self.file.seek(-bm.size, SEEK_END)
         try:
-            self.offset_table = pickle.load(self.file)
+            self.offset_table = read_offset_table(
+                self.file, sum(self.chunk_numbers))
         except pickle.UnpicklingError as e:
-            self.error("Failed to read the offset table (table offset was %d)",
-                       bm.size)
+            self.error("Failed to read the offset table")
             raise from_none(e)
-        for i, offset in enumerate(self.offset_table):
-            self.offset_table[i] = int(offset)
-        # Virtual end
-        self.offset_table.append(self.file.tell() - bm.size)
         self.debug("Offsets: %s", self.offset_table)
-        if self.class_lengths[TRAIN] == 0:
-            assert self.normalization_type == "none", \
-                "You specified \"%s\" normalization but there are no train " \
-                "samples to analyze." % self.normalization_type
-            self.normalizer.analyze(self.minibatch_data.mem)
+
+    def load_raw_data(self):
+        """Memory maps the arrays of the raw format file, nothing is
+        actually read until fill_minibatch().
+        """
+        header, base = read_raw_header(self.file)
+        self.class_lengths[:] = header["class_lengths"]
+        self.old_max_minibatch_size = header["max_minibatch_size"]
+        self.minibatch_data_dtype = numpy.dtype(header["data_dtype"])
+        self.minibatch_data_shape = \
+            (self.old_max_minibatch_size,) + tuple(header["data_shape"])
+        self._has_labels = header["labels_shape"] is not None
+        if self.has_labels:
+            self.minibatch_labels_dtype = numpy.dtype(header["labels_dtype"])
+            self.minibatch_labels_shape = \
+                (self.old_max_minibatch_size,) + tuple(header["labels_shape"])
+        self._labels_mapping = {
+            tuple(k) if isinstance(k, list) else k: v
+            for k, v in header["labels_mapping"]}
+        self._reversed_labels_mapping[:] = sorted(self.labels_mapping)
+        self._raw_data_ = []
+        self._raw_labels_ = []
+        for ci, length in enumerate(self.class_lengths):
+            self._raw_data_.append(self._memmap(
+                base + header["data_offsets"][ci], self.minibatch_data_dtype,
+                (length,) + self.minibatch_data_shape[1:]))
+            self._raw_labels_.append(self._memmap(
+                base + header["labels_offsets"][ci],
+                self.minibatch_labels_dtype,
+                (length,) + self.minibatch_labels_shape[1:])
+                if self.has_labels else None)
+
+    def _memmap(self, offset, dtype, shape):
+        if shape[0] == 0:
+            return numpy.empty(shape, dtype)
+        return numpy.memmap(self.file, dtype, "r", offset, shape)
 
     def create_minibatch_data(self):
         self.minibatch_data.reset(numpy.zeros(
@@ -262,28 +490,54 @@ class MinibatchesLoader(Loader):
             dtype=self.minibatch_data_dtype))
 
     def fill_minibatch(self):
-        chunks_map = [
-            self.get_address(sample) + (i,) for i, sample in
-            enumerate(self.minibatch_indices.mem[:self.minibatch_size])]
-        chunks_map.sort()
-        prev_chunk_number = -1
-        chunk = None
-        for chunk_number, chunk_offset, index in chunks_map:
-            if prev_chunk_number != chunk_number:
-                prev_chunk_number = chunk_number
-                self.file.seek(self.offset_table[chunk_number])
-                buffer = self.file.read(self.offset_table[chunk_number + 1] -
-                                        self.offset_table[chunk_number])
-                chunk = pickle.loads(self.decompress(buffer))
-            mb_data, mb_labels = chunk
-            self.minibatch_data[index] = mb_data[chunk_offset]
+        if self._raw_data_ is not None:
+            self.fill_raw_minibatch()
+            return
+        chunk_numbers, chunk_offsets = self.get_addresses(
+            self.minibatch_indices.mem[:self.minibatch_size])
+        order = numpy.argsort(chunk_numbers, kind="mergesort")
+        bounds = numpy.flatnonzero(numpy.diff(chunk_numbers[order])) + 1
+        for positions in numpy.split(order, bounds):
+            mb_data, mb_labels = self._get_chunk(
+                int(chunk_numbers[positions[0]]))
+            offsets = chunk_offsets[positions]
+            self.minibatch_data.mem[positions] = mb_data[offsets]
+            if self.has_labels:
+                self.minibatch_labels.mem[positions] = mb_labels[offsets]
+        self._schedule_prefetch()
+
+    def fill_raw_minibatch(self):
+        size = self.minibatch_size
+        class_indices, class_offsets = self.get_class_offsets(
+            self.minibatch_indices.mem[:size])
+        if (class_indices == class_indices[0]).all():
+            # The usual case - the whole minibatch belongs to the same class
+            ci = class_indices[0]
+            gather(self._raw_data_[ci], class_offsets,
+                   self.minibatch_data.mem[:size])
             if self.has_labels:
-                self.minibatch_labels[index] = mb_labels[chunk_offset]
+                gather(self._raw_labels_[ci], class_offsets,
+                       self.minibatch_labels.mem[:size])
+            return
+        for ci in numpy.unique(class_indices):
+            positions = numpy.flatnonzero(class_indices == ci)
+            offsets = class_offsets[positions]
+            self.minibatch_data.mem[positions] = self._raw_data_[ci][offsets]
+            if self.has_labels:
+                self.minibatch_labels.mem[positions] = \
+                    self._raw_labels_[ci][offsets]
 
     def map_minibatch_labels(self):
         # Already done in fill_minibatch()
         pass
 
+    def stop(self):
+        super(MinibatchesLoader, self).stop()
+        if self._prefetch_thread_ is not None:
+            self._prefetch_queue_.put(None)
+            self._prefetch_thread_.join()
+            self._prefetch_thread_ = None
+
     def get_address(self, index):
         class_index, class_remainder = self.class_index_by_sample_index(index)
         chunk_length = self.class_chunk_lengths[class_index]
@@ -291,6 +545,177 @@ class MinibatchesLoader(Loader):
         class_offset = self.class_lengths[class_index] - class_remainder
         mb_chunks = int(numpy.ceil(self.old_max_minibatch_size / chunk_length))
         mb_ind, mb_off = divmod(class_offset, self.old_max_minibatch_size)
-        chunk_number += mb_ind * mb_chunks
-        mb_ind, mb_off = divmod(mb_off, chunk_length)
-        return chunk_number, mb_off
+        chunk_ind, chunk_off = divmod(mb_off, chunk_length)
+        return chunk_number + mb_ind * mb_chunks + chunk_ind, chunk_off
+
+    def get_class_offsets(self, indices):
+        """Vectorized class_index_by_sample_index().
+        :return: numpy arrays of class indices and sample offsets in those
+        classes.
+        """
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        ends = numpy.array(self.effective_class_end_offsets, numpy.int64)
+        class_indices = numpy.searchsorted(ends, indices, side="right")
+        if len(indices) > 0 and class_indices.max() >= len(ends):
+            raise error.Bug("Could not convert sample index to class index, "
+                            "probably due to incorrect class_end_offsets.")
+        class_offsets = numpy.array(self.class_lengths, numpy.int64)[
+            class_indices] - (ends[class_indices] - indices)
+        return class_indices, class_offsets
+
+    def get_addresses(self, indices):
+        """Vectorized get_address().
+        :return: numpy arrays of chunk numbers and offsets in those chunks.
+        """
+        class_indices, class_offsets = self.get_class_offsets(indices)
+        chunk_lengths = numpy.array(self.class_chunk_lengths, numpy.int64)[
+            class_indices]
+        first_chunks = numpy.cumsum([0] + self.chunk_numbers[:-1])[
+            class_indices]
+        mb_chunks = -(-self.old_max_minibatch_size // chunk_lengths)
+        mb_ind, mb_off = numpy.divmod(class_offsets,
+                                      self.old_max_minibatch_size)
+        chunk_ind, chunk_off = numpy.divmod(mb_off, chunk_lengths)
+        return first_chunks + mb_ind * mb_chunks + chunk_ind, chunk_off
+
+    def _read_chunk(self, number):
+        with self._file_lock_:
+            self.file.seek(self.offset_table[number])
+            buffer = self.file.read(self.offset_table[number + 1] -
+                                    self.offset_table[number])
+        return pickle.loads(self.decompress(buffer))
+
+    def _get_chunk(self, number, prefetch=False):
+        """Returns the decoded chunk from the cache or reads it. If another
+        thread is reading the same chunk, waits for it. Prefetching does not
+        wait and returns None in that case.
+        """
+        with self._chunk_lock_:
+            chunk = self._chunk_cache_.pop(number, None)
+            if chunk is not None:
+                # Move to the most recently used end
+                self._chunk_cache_[number] = chunk
+                if not prefetch:
+                    self._chunk_cache_hits_ += 1
+                return chunk
+            pending = self._pending_chunks_.get(number)
+            owner = pending is None
+            if owner:
+                pending = self._pending_chunks_[number] = \
+                    [threading.Event(), None]
+            elif prefetch:
+                return None
+            if not prefetch:
+                if owner:
+                    self._chunk_cache_misses_ += 1
+                else:
+                    self._chunk_cache_hits_ += 1
+        if not owner:
+            pending[0].wait()
+            if pending[1] is not None:
+                return pending[1]
+            return self._read_chunk(number)
+        chunk = None
+        try:
+            chunk = pending[1] = self._read_chunk(number)
+        finally:
+            with self._chunk_lock_:
+                del self._pending_chunks_[number]
+                if chunk is not None:
+                    self._cache_chunk(number, chunk)
+            pending[0].set()
+        return chunk
+
+    def _cache_chunk(self, number, chunk):
+        size = sum(a.nbytes for a in chunk if a is not None)
+        if size > self.chunk_cache_size:
+            return
+        while self._chunk_cache_bytes_ + size > self.chunk_cache_size:
+            _, evicted = self._chunk_cache_.popitem(last=False)
+            self._chunk_cache_bytes_ -= sum(
+                a.nbytes for a in evicted if a is not None)
+        self._chunk_cache_[number] = chunk
+        self._chunk_cache_bytes_ += size
+
+    def _schedule_prefetch(self):
+        """Passes the chunks which the next prefetch_minibatches minibatches
+        need to the background thread. The indices are known in advance
+        from shuffled_indices unless the epoch ends and they are reshuffled.
+        """
+        if self.prefetch_minibatches <= 0 or self.chunk_cache_size <= 0 or \
+                self.is_slave:
+            return
+        start = self.global_offset
+        finish = min(start + self.prefetch_minibatches *
+                     self.max_minibatch_size, self.effective_total_samples)
+        if start >= finish:
+            return
+        numbers = numpy.unique(self.get_addresses(
+            self.shuffled_indices.mem[start:finish])[0])
+        if self._prefetch_thread_ is None:
+            self._prefetch_queue_ = queue.Queue(self.prefetch_minibatches)
+            self._prefetch_thread_ = threading.Thread(
+                target=self._prefetch_loop, name="%s prefetch" % self.name)
+            self._prefetch_thread_.daemon = True
+            self._prefetch_thread_.start()
+        try:
+            self._prefetch_queue_.put_nowait(numbers)
+        except queue.Full:
+            self.debug("Prefetching lags behind, skipped %d chunks",
+                       len(numbers))
+
+    def _prefetch_loop(self):
+        while True:
+            numbers = self._prefetch_queue_.get()
+            if numbers is None:
+                break
+            for number in numbers:
+                try:
+                    self._get_chunk(int(number), prefetch=True)
+                except Exception as e:
+                    self.warning("Failed to prefetch chunk %d: %s", number, e)
+
+
+def convert_to_raw(src, dst, logger=None):
+    """Converts the pickle format file written by :class:`MinibatchesSaver`
+    to the raw format.
+    :param src: The path to the existing file.
+    :param dst: The path to the raw format file to write.
+    """
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        (codec, class_lengths, max_minibatch_size, chunk_lengths,
+         data_shape, data_dtype, labels_shape, labels_dtype,
+         labels_mapping) = pickle.load(fin)
+        decompress = MinibatchesLoader.CODECS[codec]
+        mb_chunks = [int(numpy.ceil(max_minibatch_size / cl))
+                     for cl in chunk_lengths]
+        mb_counts = [int(numpy.ceil(cl / max_minibatch_size))
+                     for cl in class_lengths]
+        offset_table = read_offset_table(fin, sum(
+            c * n for c, n in zip(mb_chunks, mb_counts)))
+        data_offsets, labels_offsets, sample_size, label_size = \
+            write_raw_header(
+                fout, class_lengths, max_minibatch_size, data_shape[1:],
+                data_dtype, labels_shape[1:] if labels_shape else None,
+                labels_dtype, labels_mapping)
+        chunk_number = 0
+        for ci, length in enumerate(class_lengths):
+            written = 0
+            for _ in range(mb_counts[ci] * mb_chunks[ci]):
+                fin.seek(offset_table[chunk_number])
+                data, labels = pickle.loads(decompress(fin.read(
+                    offset_table[chunk_number + 1] -
+                    offset_table[chunk_number])))
+                chunk_number += 1
+                size = min(len(data), length - written)
+                if size <= 0:
+                    continue
+                fout.seek(data_offsets[ci] + written * sample_size)
+                fout.write(data[:size].tobytes())
+                if labels is not None:
+                    fout.seek(labels_offsets[ci] + written * label_size)
+                    fout.write(labels[:size].tobytes())
+                written += size
+            if logger is not None:
+                logger.info("Converted %d %s samples", written,
+                            CLASS_NAME[ci])
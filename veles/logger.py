@@ -54,6 +54,7 @@ from veles.compat import from_none, has_colors
 from veles.external.daemon import redirect_stream
 from veles.external.progressbar import ProgressBar
 from veles.paths import __root__
+import veles.tracing as tracing
 
 
 class Logger(object):
@@ -264,6 +265,8 @@ class Logger(object):
     def event(self, name, etype, **info):
         """
         Records an event to MongoDB. Events can be later viewed in web status.
+        They are also recorded to the timeline if it is enabled (see
+        veles/tracing.py).
         Parameters:
             name: the name of the event, for example, "Work".
             etype: the type of the event, can be either "begin", "end" or
@@ -273,6 +276,8 @@ class Logger(object):
         if etype not in ("begin", "end", "single"):
             raise ValueError("Event type must any of the following: 'begin', "
                              "'end', 'single'")
+        if tracing.enabled:
+            tracing.get().event(etype, name, self.__class__.__name__, info)
         for handler in logging.getLogger().handlers:
             if isinstance(handler, MongoLogHandler):
                 data = {"session": handler.log_id,
@@ -131,6 +131,7 @@ class NormalizerBase(Verified):
             if not self._initialized:
                 self._initialize(data)
                 self._initialized = True
+            self._cache = None
             return fn(data)
         wrapped.__name__ = "initialized_" + fn.__name__
         return wrapped
@@ -151,6 +152,7 @@ class NormalizerBase(Verified):
         super(NormalizerBase, self).__init__(**kwargs)
         self.verify_interface(INormalizer)
         self._initialized = False
+        self._cache = None
         self.analyze = self.initialized(self.analyze)
         self.normalize = self.assert_initialized(self.normalize)
         if state is not None:
@@ -179,6 +181,7 @@ class NormalizerBase(Verified):
                 "state must be a dictionary (got %s)" % type(value))
         self._initialized = False
         self.__dict__.update(value)
+        self._cache = None
         self._initialized = True
 
     @property
@@ -209,8 +212,7 @@ class NormalizerBase(Verified):
         super(NormalizerBase, self).__setstate__(state)
         initialized = self._initialized
         self._initialized = False
-        if hasattr(self, "_cache"):
-            self._cache = None
+        self._cache = None
         self.analyze = self.initialized(self.analyze)
         self.normalize = self.assert_initialized(self.normalize)
         self._initialized = initialized
@@ -220,8 +222,7 @@ class NormalizerBase(Verified):
         return self._initialized
 
     def reset(self):
-        if hasattr(self, "_cache"):
-            delattr(self, "_cache")
+        self._cache = None
         self._initialized = False
 
     @staticmethod
@@ -251,6 +252,45 @@ class NormalizerBase(Verified):
         """
         return reshape(transpose(data), (data.shape[1],) + shape)
 
+    def _get_frozen_coefficients(self, dtype):
+        """
+        Returns the (multiplier, addend) pair from _calculate_multiply_add()
+        converted to contiguous arrays of the specified dtype. They are
+        calculated once and reused until the next analyze(), reset() or
+        state assignment.
+        :param dtype: numpy.dtype of the data to be (de)normalized.
+        :return tuple (mul, add); mul may be None, meaning 1.
+        """
+        cache = self._cache
+        if cache is None:
+            cache = self._cache = {}
+        coeffs = cache.get(dtype)
+        if coeffs is None:
+            coeffs = cache[dtype] = tuple(
+                numpy.ascontiguousarray(c, dtype) if c is not None else None
+                for c in self._calculate_multiply_add())
+        return coeffs
+
+    def _calculate_multiply_add(self):
+        """
+        Represents normalize() as data * mul + add.
+        :return tuple (mul, add); mul may be None, meaning 1.
+        """
+        raise NotImplementedError()
+
+    def _multiply_add(self, data):
+        mul, add = self._get_frozen_coefficients(data.dtype)
+        if mul is not None:
+            data *= mul
+        data += add
+
+    def _unmultiply_add(self, data):
+        mul, add = self._get_frozen_coefficients(data.dtype)
+        data -= add
+        if mul is not None:
+            data /= mul
+        return data
+
     def _get_state(self):
         return {k: v for k, v in self.__dict__.items()
                 if k not in ("_initialized", "_cache", "_logger_")
@@ -306,17 +346,18 @@ class MeanDispersionNormalizer(NormalizerBase):
     def _calculate_coefficients(self):
         return self._sum / self._count, self._max - self._min
 
-    def normalize(self, data):
+    def _calculate_multiply_add(self):
         mean, disp = self._calculate_coefficients()
-        data -= mean
+        disp = disp.astype(numpy.float64)
         disp[disp == 0] = 1
-        data /= disp
+        mul = 1 / disp
+        return mul, -mean * mul
+
+    def normalize(self, data):
+        self._multiply_add(data)
 
     def denormalize(self, data, **kwargs):
-        mean, disp = self._calculate_coefficients()
-        data *= disp
-        data += mean
-        return data
+        return self._unmultiply_add(data)
 
 
 class IntervalNormalizer(NormalizerBase):
@@ -341,6 +382,7 @@ class IntervalNormalizer(NormalizerBase):
                     "Each value in the interval must be either an int or a "
                     "float (got %s of %s)" % (v, v.__class__))
         self._interval = float(vmin), float(vmax)
+        self._cache = None
 
 
 @implementer(INormalizer)
@@ -450,18 +492,16 @@ class RangeLinearNormalizer(IntervalNormalizer):
         data += (dmin * imax - dmax * imin) / diff
 
     def denormalize(self, data, **kwargs):
-        data, shape = NormalizerBase.prepare(data)
-        dmin = self.min
-        dmax = self.max
-        diff = dmin - dmax
-        imin, imax = self.interval
-        data -= (dmin * imax - dmax * imin) / diff
-        data /= (imin - imax) / diff
-        return NormalizerBase.unprepare(data, shape)
+        return self._unmultiply_add(data)
 
     def _calculate_coefficients(self):
         return self.interval + (self.min, self.max)
 
+    def _calculate_multiply_add(self):
+        imin, imax, dmin, dmax = self._calculate_coefficients()
+        diff = float(dmin) - float(dmax)
+        return (imin - imax) / diff, (dmin * imax - dmax * imin) / diff
+
 
 @implementer(INormalizer)
 class ExponentNormalizer(StatelessNormalizer):
@@ -520,30 +560,17 @@ class PointwiseNormalizer(NormalizerBase):
     def _initialize(self, data):
         self._min = data[0].copy()
         self._max = data[0].copy()
-        self._reset_cache()
-
-    def _reset_cache(self):
-        dtype = numpy.float32 if self._min.dtype != numpy.float64 \
-            else numpy.float64
-        self._cache = [numpy.zeros_like(self._min, dtype=dtype)
-                       for _ in (0, 1)]
 
     def analyze(self, data):
         numpy.minimum(self._min, numpy.min(data, axis=0), self._min)
         numpy.maximum(self._max, numpy.max(data, axis=0), self._max)
 
-    def __setstate__(self, state):
-        super(PointwiseNormalizer, self).__setstate__(state)
-        initialized = self._initialized
-        self._initialized = False
-        self._reset_cache()
-        self._initialized = initialized
-
     def _calculate_coefficients(self):
         disp = self._max - self._min
         nonzeros = numpy.nonzero(disp)
 
-        mul, add = self._cache
+        mul = numpy.zeros_like(self._min, dtype=numpy.float64)
+        add = numpy.zeros_like(mul)
         mul[nonzeros] = 2.0
         mul[nonzeros] /= disp[nonzeros]
         mm = self._min * mul
@@ -551,16 +578,14 @@ class PointwiseNormalizer(NormalizerBase):
 
         return mul, add
 
+    def _calculate_multiply_add(self):
+        return self._calculate_coefficients()
+
     def normalize(self, data):
-        mul, add = self._calculate_coefficients()
-        data *= mul
-        data += add
+        self._multiply_add(data)
 
     def denormalize(self, data, **kwargs):
-        mul, add = self._calculate_coefficients()
-        data -= add
-        data /= mul
-        return data
+        return self._unmultiply_add(data)
 
 
 class MeanNormalizerBase(object):
@@ -579,6 +604,7 @@ class MeanNormalizerBase(object):
         if not isinstance(value, (int, float, numpy.float32, numpy.float64)):
             raise TypeError("Scale must be a scalar floating point value")
         self._scale = float(value)
+        self._cache = None
 
     def apply_scale(self, data):
         if self.scale != 1:
@@ -652,11 +678,14 @@ class InternalMeanNormalizer(MeanNormalizerBase, NormalizerBase):
     def _calculate_coefficients(self):
         return self._sum / self._count
 
+    def _calculate_multiply_add(self):
+        mean = self._calculate_coefficients()
+        if self.scale == 1:
+            return None, -mean
+        return self.scale, -mean * self.scale
+
     def normalize(self, data):
-        data -= self._calculate_coefficients()
-        self.apply_scale(data)
+        self._multiply_add(data)
 
     def denormalize(self, data, **kwargs):
-        self.unapply_scale(data)
-        data += self._calculate_coefficients()
-        return data
+        return self._unmultiply_add(data)
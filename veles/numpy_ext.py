@@ -106,6 +106,28 @@ def interleave(arr):
     return b
 
 
+def gather(src, indices, out):
+    """Copies src[indices] into out with a single vectorized call.
+
+    numpy.take() writes directly into out if the dtypes and shapes match,
+    otherwise we fall back to fancy indexing with a cast. Raises IndexError
+    if any index is out of range, negative indices wrap as usual.
+    """
+    if (out.dtype == src.dtype and out.flags.c_contiguous and
+            out.shape == indices.shape + src.shape[1:]):
+        # mode="raise" always allocates the intermediate buffer when out is
+        # given, so the indices are checked once here and mode="wrap" is
+        # used (it maps the valid negative indices the same way)
+        if indices.size > 0 and (indices.min() < -len(src) or
+                                 indices.max() >= len(src)):
+            raise IndexError("gather() indices are out of range [%d, %d)" %
+                             (-len(src), len(src)))
+        numpy.take(src, indices, axis=0, out=out, mode="wrap")
+    else:
+        out[:] = src[indices]
+    return out
+
+
 def roundup(num, align):
     d = num % align
     if d == 0:
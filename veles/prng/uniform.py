@@ -135,32 +135,31 @@ class Uniform(AcceleratedUnit):
         self.output.map_invalidate()
         n_rounds = nbytes // bytes_per_round
 
-        u64 = numpy.array([1181783497276652981], dtype=numpy.uint64)
-        s0 = numpy.zeros(1, dtype=numpy.uint64)
-        s1 = numpy.zeros(1, dtype=numpy.uint64)
-
-        states = self.states.mem.view(dtype=numpy.uint64)
-        states = states.reshape(states.size // 16, 16)
-        output = self.output.mem.view(dtype=numpy.uint64)
-        for i in range(self.num_states):
-            offs = i
-            s = states[i]
-            self.p = 0
-            for _round in range(n_rounds):
-                for _iter in range(16):
-                    output[offs] = self._next_rand(s, s0, s1, u64)
-                    offs += self.num_states
-
-    def _next_rand(self, s, s0, s1, u64):
-        s0[0] = s[self.p]
-        self.p = (self.p + 1) & 15
-        s1[0] = s[self.p]
-        s1 ^= s1 << 31
-        s1 ^= s1 >> 11
-        s0 ^= s0 >> 30
-        s0 ^= s1
-        s[self.p] = s0[0]
-        return (s0 * u64)[0]
+        # All the streams advance at once: row i of the transposed states
+        # holds s[i] of every stream, and the output is interleaved exactly
+        # like in random_xorshift1024star
+        states = self.states.mem.view(dtype=numpy.uint64).reshape(
+            self.num_states, 16)
+        s = numpy.ascontiguousarray(states.transpose())
+        output = self.output.mem.view(dtype=numpy.uint64)[
+            :n_rounds * 16 * self.num_states].reshape(
+            n_rounds * 16, self.num_states)
+        mul = numpy.uint64(1181783497276652981)
+        shifts = tuple(numpy.uint64(n) for n in (31, 11, 30))
+        s0 = numpy.empty(self.num_states, dtype=numpy.uint64)
+        s1 = numpy.empty_like(s0)
+        for row in range(n_rounds * 16):
+            p = row & 15
+            q = (p + 1) & 15
+            numpy.left_shift(s[q], shifts[0], s1)
+            s1 ^= s[q]
+            numpy.right_shift(s1, shifts[1], s0)
+            s1 ^= s0
+            numpy.right_shift(s[p], shifts[2], s0)
+            s0 ^= s[p]
+            numpy.bitwise_xor(s0, s1, s[q])
+            numpy.multiply(s[q], mul, output[row])
+        states[:] = s.transpose()
 
     def fill(self, nbytes):
         self._backend_fill_(nbytes)
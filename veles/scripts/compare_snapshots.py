@@ -66,8 +66,10 @@ def parse_args():
         "-s", "--sort", choices=SORT_CHOICES,
         help="Sort by this field (may be specified multiple times).",
         nargs='*', action='append', default=["dep", "avgreldiff"])
-    parser.add_argument('first', help='Path to the first snapshot.')
-    parser.add_argument('second', help="Path to the second snapshot.")
+    parser.add_argument(
+        'first', help='Path to the first snapshot (file or directory).')
+    parser.add_argument(
+        'second', help="Path to the second snapshot (file or directory).")
     return parser.parse_args()
 
 
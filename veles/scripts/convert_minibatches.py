@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Converts the minibatches file written by MinibatchesSaver to the raw,
+memory mappable format.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+import os
+
+from veles.dot_pip import install_dot_pip
+install_dot_pip()
+from veles.logger import Logger
+from veles.loader.saver import convert_to_raw
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Convert the minibatches file to the raw format",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("source", help="Path to the existing file.")
+    parser.add_argument("destination", help="Path to the raw file to write.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    convert_to_raw(args.source, args.destination, logger)
+    logger.info("Wrote %s", args.destination)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Manages the persistent cache of decoded images (see
+:class:`veles.loader.image_cache.ImageCache`).
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+from datetime import datetime
+import logging
+import os
+
+from veles.dot_pip import install_dot_pip
+install_dot_pip()
+from veles.config import root
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.loader.image_cache import ImageCache
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Manage the persistent cache of decoded images",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-d", "--dir",
+                        default=root.common.loader.image_cache.dir,
+                        help="Cache directory.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("list", help="List cached datasets.")
+    purge = subparsers.add_parser(
+        "purge", help="Remove the least recently used datasets.")
+    purge.add_argument("-s", "--max-size", type=int, default=0,
+                       help="Remove datasets until the cache size becomes "
+                            "not greater than this number of bytes.")
+    warm = subparsers.add_parser(
+        "warm", help="Decode the images in the specified directories, the "
+                     "label is the name of the parent directory.")
+    warm.add_argument("paths", nargs="+", help="Directories with images.")
+    warm.add_argument("-s", "--max-size", type=int,
+                      default=root.common.loader.image_cache.max_size,
+                      help="Maximal cache size in bytes.")
+    warm.add_argument("-j", "--workers", type=int, default=0,
+                      help="Number of decoding threads (0 means the number "
+                           "of CPU cores).")
+    warm.add_argument("--color-space", default="RGB",
+                      help="Color space to convert images to.")
+    warm.add_argument("--scale", type=float, nargs="+", default=[1.0],
+                      help="Either the scale factor or the target height "
+                           "and width.")
+    warm.add_argument("--no-aspect-ratio", action="store_true",
+                      help="Do not maintain the aspect ratio while scaling.")
+    warm.add_argument("--add-sobel", action="store_true",
+                      help="Add the Sobel channel.")
+    return parser.parse_args()
+
+
+def list_buckets(args):
+    table = PrettyTable("Path", "Size", "Last used", "Settings")
+    for fn in table.field_names:
+        table.align[fn] = "l"
+    for path, size, last_used, settings in ImageCache.buckets(args.dir):
+        table.add_row(os.path.basename(path), size,
+                      datetime.fromtimestamp(last_used).strftime("%c"),
+                      ", ".join("%s=%s" % p for p in sorted(settings.items())))
+    print(table)
+
+
+def purge(args, logger):
+    size = ImageCache.purge(args.dir, args.max_size)
+    logger.info("The cache size is %d bytes now", size)
+
+
+def warm(args):
+    from veles.dummy import DummyWorkflow
+    from veles.loader.file_image import AutoLabelFileImageLoader
+
+    if len(args.scale) == 1:
+        scale = args.scale[0]
+    elif len(args.scale) == 2:
+        scale = tuple(int(s) for s in args.scale)
+    else:
+        raise ValueError("--scale must have either 1 or 2 values")
+    root.common.loader.image_cache.update({
+        "dir": args.dir, "max_size": args.max_size})
+    loader = AutoLabelFileImageLoader(
+        DummyWorkflow(), train_paths=args.paths, cache_images=True,
+        loader_workers=args.workers, color_space=args.color_space,
+        scale=scale, scale_maintain_aspect_ratio=not args.no_aspect_ratio,
+        add_sobel=args.add_sobel)
+    try:
+        loader.load_data()
+        loader.warm_image_cache()
+    finally:
+        loader.stop()
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    if args.command == "list":
+        list_buckets(args)
+    elif args.command == "purge":
+        purge(args, logger)
+    else:
+        warm(args)
+
+if __name__ == "__main__":
+    main()
@@ -36,7 +36,7 @@ under the License.
 
 
 import argparse
-from collections import namedtuple
+from collections import deque, namedtuple
 import json
 import socket
 import time
@@ -45,6 +45,7 @@ import uuid
 import numpy
 import six
 from twisted.internet import reactor, threads, task
+from twisted.internet.defer import Deferred
 from twisted.internet.protocol import ServerFactory
 from twisted.names import client as dns
 from twisted.python.failure import Failure
@@ -53,7 +54,9 @@ import zmq
 from veles.cmdline import CommandLineArgumentsRegistry
 from veles.config import root
 import veles.external.fysom as fysom
-from veles.txzmq import ZmqConnection, ZmqEndpoint, SharedIO
+from veles.external.prettytable import PrettyTable
+from veles.txzmq import ZmqConnection, ZmqEndpoint, SharedIO, \
+    SharedIOChannel, AdaptiveCompression
 from veles.logger import Logger
 from veles.network_common import NetworkAgent, StringLineReceiver, IDLogger
 from veles.thread_pool import errback
@@ -68,7 +71,6 @@ class ZmqRouter(ZmqConnection, Logger):
         'update':
         lambda protocol, payload: protocol.updateReceived(payload)
     }
-    RESERVE_SHMEM_SIZE = 0.05
 
     def __init__(self, host, *endpoints, **kwargs):
         super(ZmqRouter, self).__init__(endpoints, logger=kwargs.get("logger"))
@@ -77,10 +79,12 @@ class ZmqRouter(ZmqConnection, Logger):
         self.routing = {b'job': {}, b'update': {}}
         self.shmem = {}
         self.use_shmem = kwargs.get('use_shared_memory', True)
+        self.compressions = {}
         self._command = None
         self._command_str = None
         self.ignore_unknown_commands = ignore_unknown_commands
         self.pickles_compression = root.common.engine.network_compression
+        self.pickles_out_of_band = root.common.engine.network_out_of_band
 
     def change_log_message(self, msg):
         return "zmq: " + msg
@@ -92,7 +96,9 @@ class ZmqRouter(ZmqConnection, Logger):
             self.error("ZeroMQ sent an invalid message %s", message[0:3])
             return
         node_id = node_id.decode('charmap')
-        self.routing[command][node_id] = routing
+        # prefetching slaves may have several requests of the same kind
+        # waiting for the replies
+        self.routing[command].setdefault(node_id, deque()).append(routing)
         protocol = self.host.protocols.get(node_id)
         if protocol is None:
             self.error("ZeroMQ sent unknown node ID %s (unsync during drop?)",
@@ -138,37 +144,125 @@ class ZmqRouter(ZmqConnection, Logger):
         self.event("ZeroMQ", "begin", dir="receive", id=self.node_id,
                    command=self._command_str, height=0.5)
 
+    def shares_memory_with(self, node_id):
+        """Checks whether the jobs and the updates of the specified node
+        should be transferred via shared memory.
+        """
+        return self.use_shmem and self.host.nodes[node_id].get(
+            'endpoint', "").startswith("ipc://")
+
+    def release(self, node_id):
+        """Frees the shared memory which was used to communicate with the
+        specified node.
+        """
+        for routing in self.routing.values():
+            routing.pop(node_id, None)
+        shmem = self.shmem.pop(node_id, None)
+        if shmem is not None:
+            shmem.close()
+        SharedIO.forget("veles-update-" + node_id)
+
+    def compression_for(self, node_id):
+        """Returns the pickles compression of the link with the specified
+        node: either the codec name or the node's
+        :class:`veles.txzmq.AdaptiveCompression`.
+        """
+        if self.host.nodes[node_id].get('endpoint', "").startswith("ipc://"):
+            return None
+        if self.pickles_compression != "adaptive":
+            return self.pickles_compression
+        compression = self.compressions.get(node_id)
+        if compression is None:
+            compression = self.compressions[node_id] = AdaptiveCompression(
+                logger=self.logger)
+        return compression
+
     def reply(self, node_id, channel, message):
         self.event("ZeroMQ", "begin", dir="send", id=node_id,
                    command=channel.decode('charmap'), height=0.5)
-        if self.use_shmem:
-            is_ipc = self.host.nodes[node_id]['endpoint'].startswith("ipc://")
-            io_overflow = False
+        shmem = None
+        if self.shares_memory_with(node_id) and channel == b"job":
             shmem = self.shmem.get(node_id)
-            if shmem is not None and channel == b"job":
-                self.shmem[node_id].seek(0)
+            if shmem is None:
+                shmem = self.shmem[node_id] = SharedIOChannel(
+                    "veles-job-" + node_id)
+        io_overflow = False
         try:
             pickles_size = self.send(
-                self.routing[channel].pop(node_id), channel, message,
-                io=shmem, pickles_compression=self.pickles_compression
-                if not is_ipc else None)
-        except ZmqConnection.IOOverflow:
-            pickles_size = shmem.size
-            self.shmem[node_id] = None
+                self.routing[channel][node_id].popleft(), channel, message,
+                io=shmem.acquire() if shmem is not None else None,
+                pickles_compression=self.compression_for(node_id),
+                out_of_band=self.pickles_out_of_band)
+        except ZmqConnection.IOOverflow as e:
+            pickles_size = e.size
             io_overflow = True
-        except KeyError:
+        except (KeyError, IndexError):
             self.warning("Could not find node %s on channel %s",
                          node_id, channel)
             return
-        if self.use_shmem and is_ipc and channel == b"job":
-            if io_overflow or self.shmem.get(node_id) is None:
-                self.shmem[node_id] = SharedIO(
-                    "veles-job-" + node_id,
-                    int(pickles_size * (1.0 + ZmqRouter.RESERVE_SHMEM_SIZE)))
+        if shmem is not None:
+            shmem.commit(pickles_size, io_overflow)
         self.event("ZeroMQ", "end", dir="send", id=node_id,
                    command=channel.decode('charmap'), height=0.5)
 
 
+class UpdateAggregator(Logger):
+    """Collects the slave updates which arrive within the window or while
+    the previous batch is being applied and applies them together with
+    :meth:`veles.workflow.Workflow.apply_data_from_slaves`.
+    """
+    def __init__(self, workflow, window, **kwargs):
+        super(UpdateAggregator, self).__init__(**kwargs)
+        self.workflow = workflow
+        self.window = window
+        # IReactorTime to schedule the batches with
+        self.clock = reactor
+        self._pending = []
+        self._applying = False
+        self._flush_call = None
+        self.batches = 0
+        self.updates = 0
+
+    def submit(self, data, slave):
+        """Returns the Deferred which fires with the result of applying
+        this update (False if the workflow dropped it) or fails if the batch
+        which includes it failed.
+        """
+        deferred = Deferred()
+        self._pending.append((data, slave, deferred))
+        if not self._applying and self._flush_call is None:
+            self._flush_call = self.clock.callLater(self.window, self._flush)
+        return deferred
+
+    def _flush(self):
+        self._flush_call = None
+        if len(self._pending) == 0:
+            return
+        batch, self._pending = self._pending, []
+        self._applying = True
+        self.batches += 1
+        self.updates += len(batch)
+        self.debug("Applying a batch of %d updates", len(batch))
+        self._apply([(data, slave) for data, slave, _ in batch]) \
+            .addBoth(self._applied, batch)
+
+    def _apply(self, updates):
+        return threads.deferToThreadPool(
+            reactor, self.workflow.thread_pool,
+            self.workflow.apply_data_from_slaves, updates)
+
+    def _applied(self, result, batch):
+        self._applying = False
+        if len(self._pending) > 0:
+            # the window has already passed while the batch was applied
+            self._flush_call = self.clock.callLater(0, self._flush)
+        for index, (_, _, deferred) in enumerate(batch):
+            if isinstance(result, Failure):
+                deferred.errback(result)
+            else:
+                deferred.callback(result[index])
+
+
 class SlaveDescription(namedtuple(
         "SlaveDescriptionTuple",
         ['id', 'mid', 'pid', 'power', 'host', 'state'])):
@@ -269,6 +363,7 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self._id = None
         self._not_a_slave = False
         self._balance = 0
+        self._prefetch = 0
         self._endpoint = None
         self.state = fysom.Fysom(VelesProtocol.FSM_DESCRIPTION, self)
         self._responders = {"handshake": self._handshake,
@@ -382,6 +477,7 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 else:
                     self.debug("appending to the sync point job requests list")
                     self.host.job_requests.add(self)
+                    self._retryJobRequestsLater()
                     hanged_slaves = []
                     for proto in self.host.protocols.values():
                         if len(proto.jobs_processed) == 0:
@@ -402,10 +498,13 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self.debug("update was received")
         if self._balance == 1:
             self.state.idle()
-        upd = threads.deferToThreadPool(
-            reactor, self.host.workflow.thread_pool,
-            self.host.workflow.apply_data_from_slave, data,
-            SlaveDescription.make(self.nodes[self.id]))
+        slave = SlaveDescription.make(self.nodes[self.id])
+        if self.host.update_aggregator is not None:
+            upd = self.host.update_aggregator.submit(data, slave)
+        else:
+            upd = threads.deferToThreadPool(
+                reactor, self.host.workflow.thread_pool,
+                self.host.workflow.apply_data_from_slave, data, slave)
         upd.addCallback(self.updateFinished)
         upd.addErrback(errback)
         now = time.time()
@@ -438,6 +537,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
     def _erase_self(self, del_node=False):
         if self.id in self.host.protocols:
             del self.host.protocols[self.id]
+        if self.id is not None:
+            self.host.zmq_connection.release(self.id)
         if del_node:
             if self.id in self.nodes:
                 del self.nodes[self.id]
@@ -447,6 +548,21 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             requester = self.host.job_requests.pop()
             requester._requestJob()
 
+    def _retryJobRequestsLater(self):
+        """The late minibatches at the sync point may be served speculatively
+        (see :meth:`veles.loader.base.Loader.generate_data_for_slave`), so
+        the waiting slaves must not wait for the next update only.
+        Otherwise, only the next update may let them go on.
+        """
+        if not root.common.engine.speculative_execution:
+            return
+        interval = root.common.engine.job_requests_retry_interval
+        retry = self.host.job_requests_retry
+        if interval is None or (retry is not None and retry.active()):
+            return
+        self.host.job_requests_retry = reactor.callLater(
+            interval, self._retryJobRequests)
+
     def _checkQuery(self, msg):
         """Respond to possible informational requests.
         """
@@ -491,6 +607,7 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             self._sendError("Workflow checksum mismatch: "
                             "expected %s, got %s" % (mysha, your_sha))
             return
+        self._prefetch = msg.get("prefetch", 0)
         must_reply = False
         msgid = msg.get("id")
         if msgid is None:
@@ -513,7 +630,9 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 SlaveDescription.make(self.nodes[self.id]))
             endpoint = self.host.choose_endpoint(self.id, mid, pid, self.hip)
             self.nodes[self.id]['endpoint'] = self._endpoint = endpoint
-            retmsg = {'endpoint': endpoint, 'data': data}
+            retmsg = {'endpoint': endpoint, 'data': data,
+                      'shmem': self.host.zmq_connection.shares_memory_with(
+                          self.id)}
             if not msgid:
                 retmsg['id'] = self.id
             retmsg['log_id'] = self.host.launcher.log_id
@@ -594,7 +713,9 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self.sendLine({"error": err})
 
     def _requestJob(self):
-        if self._balance > 1:
+        # one job is being executed, self._prefetch jobs are queued and
+        # one update may still be being applied
+        if self._balance > self._prefetch + 1:
             self.debug("job balance %d, will give the job after applying "
                        "the update", self._balance)
             return
@@ -671,8 +792,14 @@ class Server(NetworkAgent, ServerFactory):
         self.nodes = {}
         self.protocols = {}
         self.job_requests = set()
+        # the delayed call to retry job_requests
+        self.job_requests_retry = None
         self.blacklist = set()
         self.paused_nodes = {}
+        window = root.common.engine.update_aggregation_window
+        self.update_aggregator = UpdateAggregator(
+            workflow, window, logger=self.logger) \
+            if window is not None else None
         fqdn = socket.getfqdn()
         host = socket.gethostname()
         self.domain_name = fqdn[len(host) + 1:] if fqdn != host else ""
@@ -745,7 +872,17 @@ class Server(NetworkAgent, ServerFactory):
             self.warning("Slave %s was not paused, so not resumed", slave_id)
 
     def print_stats(self):
-        pass
+        if not self.zmq_connection.compressions:
+            return
+        table = PrettyTable("node", "codec", "ratio", "bandwidth, MB/s")
+        table.align["node"] = "l"
+        for nid, compression in sorted(
+                self.zmq_connection.compressions.items()):
+            table.add_row(
+                nid, compression.codec or "none", "%.2f" % compression.ratio,
+                "%.1f" % (compression.bandwidth / (1 << 20))
+                if compression.bandwidth is not None else "n/a")
+        self.info("Compression of jobs:\n%s", table)
 
     def buildProtocol(self, addr):
         return VelesProtocol(addr, self)
@@ -758,5 +895,8 @@ class Server(NetworkAgent, ServerFactory):
         return nodes
 
     def close(self):
+        if self.job_requests_retry is not None and \
+                self.job_requests_retry.active():
+            self.job_requests_retry.cancel()
         if self._listener_ is not None:
             self._listener_.stopListening()
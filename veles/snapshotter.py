@@ -39,10 +39,13 @@ import bz2
 from datetime import datetime
 import gzip
 import logging
+import numpy
 import os
 import pyodbc
 from six import BytesIO, add_metaclass
 import snappy
+import shutil
+import threading
 import time
 from zope.interface import implementer, Interface
 
@@ -98,6 +101,12 @@ class SnapshotterBase(Unit):
         interval - take only one snapshot within this run() invocations number
         time_interval - take no more than one snapshot within this time window
         skip - If True, run() is skipped but _skipped_counter is incremented.
+        asynchronous - pickle the workflow in memory and then compress and
+                       write it on a background thread, so that the
+                       workflow is stalled only for the time of pickling.
+        max_in_flight - the maximal number of the snapshots which are
+                        written in the background at once; the next
+                        snapshot waits for the oldest to finish.
     """
 
     hide_from_registry = True
@@ -120,11 +129,27 @@ class SnapshotterBase(Unit):
         self._skipped_counter = 0
         self.skip = Bool(False)
         self._warn_about_size = kwargs.get("warn_about_size", True)
+        self.asynchronous = kwargs.get(
+            "asynchronous", root.common.engine.async_snapshots)
+        self.max_in_flight = kwargs.get(
+            "max_in_flight", root.common.engine.snapshots_in_flight)
         self.demand("suffix")
 
     def init_unpickled(self):
         super(SnapshotterBase, self).init_unpickled()
         self._slaves = {}
+        self._in_flight_ = []
+        self._written_lock_ = threading.Lock()
+        self._written_ = []
+        self._snapshots_counter_ = 0
+        self._last_written_ = 0
+        self._stall_time_ = 0.0
+        self._background_time_ = 0.0
+        # Snapshots taken before the asynchronous mode lack these
+        if not hasattr(self, "asynchronous"):
+            self.asynchronous = root.common.engine.async_snapshots
+        if not hasattr(self, "max_in_flight"):
+            self.max_in_flight = root.common.engine.snapshots_in_flight
 
     def __getstate__(self):
         state = super(SnapshotterBase, self).__getstate__()
@@ -139,6 +164,25 @@ class SnapshotterBase(Unit):
     def slaves(self):
         return self._slaves
 
+    @property
+    def in_flight(self):
+        """The number of the snapshots which are being written in the
+        background.
+        """
+        return sum(1 for thread in self._in_flight_ if thread.is_alive())
+
+    @property
+    def stall_time(self):
+        """Seconds the workflow spent waiting for the snapshots.
+        """
+        return self._stall_time_
+
+    @property
+    def saved_time(self):
+        """Seconds of compression and writing moved to the background.
+        """
+        return self._background_time_
+
     @property
     def warn_about_size(self):
         return self._warn_about_size
@@ -169,14 +213,113 @@ class SnapshotterBase(Unit):
         if delta < self.time_interval:
             self.debug("%f < %f, dropped", delta, self.time_interval)
             return
-        self.export()
+        self.take_snapshot()
         self.time = time.time()
         return True
 
     def stop(self):
         if self._skipped_counter > 0 and not self.skip:
             self._skipped_counter = 0
+            self.take_snapshot()
+        self.wait_snapshots()
+
+    def take_snapshot(self):
+        """Calls export() or, in asynchronous mode, pickles the workflow and
+        passes it to a background thread.
+        """
+        if not self.asynchronous:
             self.export()
+            return
+        start = time.time()
+        self._reap_snapshots()
+        while self.in_flight >= max(self.max_in_flight, 1):
+            self.debug("%d snapshots are in flight, waiting for the oldest",
+                       self.in_flight)
+            self._in_flight_[0].join()
+            self._reap_snapshots()
+        data = self.capture()
+        target = self.prepare_snapshot()
+        self._snapshots_counter_ += 1
+        thread = threading.Thread(
+            target=self._write_in_background,
+            args=(target, data, self._snapshots_counter_),
+            name="%s writer" % self.name)
+        # not a daemon: the interpreter must not exit in the middle of writing
+        thread.start()
+        self._in_flight_.append(thread)
+        stall = time.time() - start
+        self._stall_time_ += stall
+        self.info("Captured the workflow in %.2f sec, writing %s in the "
+                  "background...", stall, target)
+
+    def wait_snapshots(self):
+        """Blocks until all the snapshots in flight are written.
+        """
+        if not self._in_flight_:
+            return
+        start = time.time()
+        for thread in self._in_flight_:
+            thread.join()
+        self._stall_time_ += time.time() - start
+        self._reap_snapshots()
+        self.info("Snapshots stalled the workflow for %.2f sec in total, "
+                  "%.2f sec were spent in the background", self.stall_time,
+                  self.saved_time)
+
+    def capture(self):
+        """Returns the consistent copy of the workflow state which is passed
+        to write_snapshot(). Called on the control flow thread.
+        """
+        # Pickling copies the contents of all the arrays, so the workflow may
+        # go on as soon as it is finished
+        return pickle.dumps(self.workflow, protocol=best_protocol)
+
+    def prepare_snapshot(self):
+        """Chooses the destination of the asynchronous snapshot. Called on
+        the control flow thread, so that the suffix is consistent with the
+        pickled state.
+        :return: The object which is passed to write_snapshot().
+        """
+        raise NotImplementedError()
+
+    def write_snapshot(self, target, data):
+        """Compresses and writes the pickled workflow. Called on a background
+        thread.
+        :return: The size of the written snapshot.
+        """
+        raise NotImplementedError()
+
+    def snapshot_written(self, target, size):
+        """Called on the background thread after write_snapshot() succeeds,
+        unless a later snapshot has already been written.
+        """
+        pass
+
+    def _write_in_background(self, target, data, number):
+        start = time.time()
+        try:
+            result = self.write_snapshot(target, data)
+            with self._written_lock_:
+                if number > self._last_written_:
+                    self._last_written_ = number
+                    self.snapshot_written(target, result)
+        except Exception as e:
+            result = e
+        with self._written_lock_:
+            self._written_.append((target, result, time.time() - start))
+
+    def _reap_snapshots(self):
+        self._in_flight_ = [t for t in self._in_flight_ if t.is_alive()]
+        with self._written_lock_:
+            written, self._written_ = self._written_, []
+        for target, result, elapsed in written:
+            if isinstance(result, Exception):
+                self.error("Failed to write %s", target)
+                raise result
+            self._background_time_ += elapsed
+            self.info("Wrote %s (%d bytes) in %.2f sec in the background",
+                      target, result, elapsed)
+            self.check_snapshot_size(result)
 
     def generate_data_for_slave(self, slave):
         self.slaves[slave.id] = 1
@@ -195,10 +338,16 @@ class SnapshotterBase(Unit):
             self._slave_ended(slave)
 
     def get_metric_names(self):
+        if self.asynchronous:
+            return {"Snapshot", "Snapshot stall"}
         return {"Snapshot"}
 
     def get_metric_values(self):
-        return {"Snapshot": self.destination}
+        values = {"Snapshot": self.destination}
+        if self.asynchronous:
+            values["Snapshot stall"] = {"stall": self.stall_time,
+                                        "background": self.saved_time}
+        return values
 
     def check_snapshot_size(self, size):
         if size > self.SIZE_WARNING_THRESHOLD and self._warn_about_size:
@@ -234,9 +383,9 @@ class SnapshotterBase(Unit):
             self.run()
 
     @staticmethod
-    def _import_fobj(fobj):
+    def _import_fobj(fobj, load=pickle.load):
         try:
-            obj = pickle.load(fobj)
+            obj = load(fobj)
         except ImportError as e:
             logging.getLogger("Snapshotter").error(
                 "Are you trying to import snapshot belonging to a different "
@@ -356,11 +505,65 @@ class SnappyFile(object):
         self.close()
 
 
+class SegmentedPickler(pickle.Pickler):
+    """Pickles the big numpy arrays by reference. The referenced arrays are
+    collected in :attr:`segments` and must be saved next to the pickle.
+    """
+    def __init__(self, file, protocol, min_size):
+        super(SegmentedPickler, self).__init__(file, protocol)
+        self.min_size = min_size
+        self.segments = []
+        self._names = {}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, numpy.ndarray) or obj.dtype.hasobject or \
+                obj.nbytes < self.min_size:
+            return None
+        name = self._names.get(id(obj))
+        if name is None:
+            name = "%05d.npy" % len(self.segments)
+            self._names[id(obj)] = name
+            # keeps obj alive so that its id() is not reused
+            self.segments.append((name, obj))
+        return "npy", name
+
+
+class SegmentedUnpickler(pickle.Unpickler):
+    """Loads the pickles written by :class:`SegmentedPickler`. The arrays are
+    memory mapped from the segments in the specified directory unless
+    mmap_mode is None.
+    """
+    def __init__(self, file, directory, mmap_mode="c"):
+        super(SegmentedUnpickler, self).__init__(file)
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        self._arrays = {}
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != "npy":
+            raise pickle.UnpicklingError(
+                "Unsupported persistent id: %s" % kind)
+        arr = self._arrays.get(name)
+        if arr is None:
+            arr = self._arrays[name] = numpy.load(
+                os.path.join(self.directory, name), mmap_mode=self.mmap_mode)
+        return arr
+
+
 @implementer(ISnapshotter)
 class SnapshotterToFile(SnapshotterBase):
     """Takes workflow snapshots to the file system.
+
+    Attributes:
+        separate_arrays - write the directory with the pickle and the big
+                          numpy arrays as separate uncompressed .npy files,
+                          so that import_() can memory map them.
+        segment_min_size - the minimal size of the array in bytes to be
+                           written separately.
     """
     MAPPING = "file"
+    PICKLE_NAME = "workflow"
 
     WRITE_CODECS = {
         None: lambda n, l: open(n, "wb"),
@@ -383,20 +586,116 @@ class SnapshotterToFile(SnapshotterBase):
         kwargs["view_group"] = kwargs.get("view_group", "SERVICE")
         super(SnapshotterToFile, self).__init__(workflow, **kwargs)
         self.directory = kwargs.get("directory", root.common.dirs.snapshots)
+        self.separate_arrays = kwargs.get(
+            "separate_arrays", root.common.engine.snapshot_separate_arrays)
+        self.segment_min_size = kwargs.get(
+            "segment_min_size", root.common.engine.snapshot_segment_min_size)
+
+    def init_unpickled(self):
+        super(SnapshotterToFile, self).init_unpickled()
+        # Snapshots taken before the separate arrays mode lack these
+        if not hasattr(self, "separate_arrays"):
+            self.separate_arrays = \
+                root.common.engine.snapshot_separate_arrays
+        if not hasattr(self, "segment_min_size"):
+            self.segment_min_size = \
+                root.common.engine.snapshot_segment_min_size
+
+    @property
+    def extension(self):
+        return ("." + self.compression) if self.compression else ""
+
+    @property
+    def pickle_name(self):
+        return "%s.%d.pickle%s" % (
+            self.PICKLE_NAME, best_protocol, self.extension)
 
     def export(self):
-        ext = ("." + self.compression) if self.compression else ""
-        rel_file_name = "%s_%s.%d.pickle%s" % (
-            self.prefix, self.suffix, best_protocol, ext)
+        self.prepare_snapshot()
+        self.info("Snapshotting to %s..." % self.destination)
+        if not self.separate_arrays:
+            with self._open_file() as fout:
+                pickle.dump(self.workflow, fout, protocol=best_protocol)
+            size = os.path.getsize(self.destination)
+        else:
+            part = self._create_part(self.destination)
+            with self._open_file(os.path.join(part, self.pickle_name)) as fout:
+                pickler = SegmentedPickler(
+                    fout, best_protocol, self.segment_min_size)
+                pickler.dump(self.workflow)
+            size = self._commit_part(part, self.destination, pickler.segments)
+        self.check_snapshot_size(size)
+        self._link_current(self.destination)
+
+    def capture(self):
+        if not self.separate_arrays:
+            return super(SnapshotterToFile, self).capture()
+        fio = BytesIO()
+        pickler = SegmentedPickler(fio, best_protocol, self.segment_min_size)
+        pickler.dump(self.workflow)
+        # the segments are written later, so they must be copied
+        return fio.getvalue(), [(name, numpy.array(arr))
+                                for name, arr in pickler.segments]
+
+    def prepare_snapshot(self):
+        if self.separate_arrays:
+            rel_file_name = "%s_%s.%d.snapshot" % (
+                self.prefix, self.suffix, best_protocol)
+        else:
+            rel_file_name = "%s_%s.%d.pickle%s" % (
+                self.prefix, self.suffix, best_protocol, self.extension)
         self._destination = os.path.abspath(os.path.join(
             self.directory, rel_file_name))
-        self.info("Snapshotting to %s..." % self.destination)
-        with self._open_file() as fout:
-            pickle.dump(self.workflow, fout, protocol=best_protocol)
-        self.check_snapshot_size(os.path.getsize(self.destination))
-        file_name_link = os.path.join(
-            self.directory, "%s_current.%d.pickle%s" % (
-                self.prefix, best_protocol, ext))
+        return self.destination
+
+    def write_snapshot(self, target, data):
+        # The previous snapshot with the same name stays intact until this
+        # one is complete
+        if isinstance(data, tuple):
+            data, segments = data
+            part = self._create_part(target)
+            with self._open_file(os.path.join(part, self.pickle_name)) as fout:
+                fout.write(data)
+            return self._commit_part(part, target, segments)
+        part = target + ".part"
+        with self._open_file(part) as fout:
+            fout.write(data)
+        os.rename(part, target)
+        return os.path.getsize(target)
+
+    @staticmethod
+    def _create_part(target):
+        part = target + ".part"
+        if os.path.exists(part):
+            shutil.rmtree(part)
+        os.mkdir(part)
+        return part
+
+    @staticmethod
+    def _commit_part(part, target, segments):
+        """Saves the arrays and replaces the target directory with part.
+        :return: The overall size of the written files.
+        """
+        for name, arr in segments:
+            # .npy headers are padded, so the data is aligned for mmap
+            numpy.save(os.path.join(part, name), arr)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(part, target)
+        return sum(os.path.getsize(os.path.join(target, name))
+                   for name in os.listdir(target))
+
+    def snapshot_written(self, target, size):
+        self._link_current(target)
+
+    def _link_current(self, file_name):
+        rel_file_name = os.path.basename(file_name)
+        if os.path.isdir(file_name):
+            link_name = "%s_current.%d.snapshot" % (self.prefix, best_protocol)
+        else:
+            link_name = "%s_current.%d.pickle%s" % (
+                self.prefix, best_protocol, self.extension)
+        file_name_link = os.path.join(self.directory, link_name)
         # Link creation may fail when several processes do this all at once,
         # so try-except here:
         try:
@@ -409,19 +708,44 @@ class SnapshotterToFile(SnapshotterBase):
             pass
 
     @staticmethod
-    def import_(file_name):
+    def import_(file_name, mmap_mode="c"):
+        """Loads the workflow from the snapshot file or directory. The arrays
+        of the latter are memory mapped in mmap_mode ("c" is copy-on-write,
+        so that the snapshot is never changed) or read if it is None.
+        """
         file_name = file_name.strip()
         if not os.path.exists(file_name):
             raise FileNotFoundError(file_name)
+        if os.path.isdir(file_name):
+            return SnapshotterToFile._import_dir(file_name, mmap_mode)
         _, ext = os.path.splitext(file_name)
         codec = SnapshotterToFile.READ_CODECS[ext[1:]]
         with codec(file_name) as fin:
             logging.getLogger("Snapshotter").info("Reading %s...", file_name)
             return SnapshotterToFile._import_fobj(fin)
 
-    def _open_file(self):
+    @staticmethod
+    def _import_dir(dir_name, mmap_mode):
+        for name in sorted(os.listdir(dir_name)):
+            if name.startswith(SnapshotterToFile.PICKLE_NAME + "."):
+                break
+        else:
+            raise FileNotFoundError(os.path.join(
+                dir_name, SnapshotterToFile.PICKLE_NAME))
+        _, ext = os.path.splitext(name)
+        codec = SnapshotterToFile.READ_CODECS[ext[1:]]
+        file_name = os.path.join(dir_name, name)
+
+        def load(fobj):
+            return SegmentedUnpickler(fobj, dir_name, mmap_mode).load()
+
+        with codec(file_name) as fin:
+            logging.getLogger("Snapshotter").info("Reading %s...", file_name)
+            return SnapshotterToFile._import_fobj(fin, load)
+
+    def _open_file(self, file_name=None):
         return SnapshotterToFile.WRITE_CODECS[self.compression](
-            self.destination, self.compression_level)
+            file_name or self.destination, self.compression_level)
 
 
 @implementer(ISnapshotter)
@@ -466,30 +790,50 @@ class SnapshotterToDB(SnapshotterBase):
         self._db_ = pyodbc.connect(self.odbc)
         self._cursor_ = self._db_.cursor()
 
+    def init_unpickled(self):
+        super(SnapshotterToDB, self).init_unpickled()
+        # the connection must not be used by several writers at once
+        self._db_lock_ = threading.Lock()
+
     def stop(self):
+        self.wait_snapshots()
         if self.odbc is not None:
             self._db_.close()
 
     def export(self):
-        self._destination = ".".join(
-            (self.prefix, self.suffix, str(best_protocol)))
+        self.prepare_snapshot()
         fio = BytesIO()
         self.info("Preparing the snapshot...")
         with self._open_fobj(fio) as fout:
             pickle.dump(self.workflow, fout, protocol=best_protocol)
         self.check_snapshot_size(len(fio.getvalue()))
-        binary = pyodbc.Binary(fio.getvalue())
+        self._insert(self.destination, fio.getvalue())
+
+    def prepare_snapshot(self):
+        self._destination = ".".join(
+            (self.prefix, self.suffix, str(best_protocol)))
+        return self.destination
+
+    def write_snapshot(self, target, data):
+        fio = BytesIO()
+        with self._open_fobj(fio) as fout:
+            fout.write(data)
+        self._insert(target, fio.getvalue())
+        return len(fio.getvalue())
+
+    def _insert(self, name, data):
+        binary = pyodbc.Binary(data)
         self.info("Executing SQL insert into \"%s\"...", self.table)
         now = datetime.now()
-        self._cursor_.execute(
-            "insert into %s(timestamp, id, log_id, workflow, name, codec, data"
-            ") values (?, ?, ?, ?, ?, ?, ?);" % self.table, now,
-            self.launcher.id, self.launcher.log_id,
-            self.launcher.workflow.name, self.destination, self.compression,
-            binary)
-        self._db_.commit()
+        with self._db_lock_:
+            self._cursor_.execute(
+                "insert into %s(timestamp, id, log_id, workflow, name, codec, "
+                "data) values (?, ?, ?, ?, ?, ?, ?);" % self.table, now,
+                self.launcher.id, self.launcher.log_id,
+                self.launcher.workflow.name, name, self.compression, binary)
+            self._db_.commit()
         self.info("Successfully wrote %d bytes as %s @ %s",
-                  len(binary), self.destination, now)
+                  len(binary), name, now)
 
     @staticmethod
     def import_(odbc, table, id_, log_id, name=None):
@@ -509,9 +853,11 @@ class SnapshotterToDB(SnapshotterBase):
             return SnapshotterToDB._import_fobj(fin)
 
     def get_metric_values(self):
-        return {"Snapshot": {"odbc": self.odbc,
-                             "table": self.table,
-                             "name": self.destination}}
+        values = super(SnapshotterToDB, self).get_metric_values()
+        values["Snapshot"] = {"odbc": self.odbc,
+                              "table": self.table,
+                              "name": self.destination}
+        return values
 
     def _open_fobj(self, fobj):
         return SnapshotterToDB.WRITE_CODECS[self.compression](
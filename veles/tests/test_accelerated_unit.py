@@ -35,12 +35,16 @@ under the License.
 
 import logging
 import os
+import shutil
+import tempfile
+import time
 import unittest
 from zope.interface import implementer
 
 from veles.accelerated_units import AcceleratedUnit, IOpenCLUnit, ICUDAUnit, \
     INumpyUnit
 from veles.dummy import DummyWorkflow
+from veles.kernel_cache import KernelCache
 
 
 @implementer(IOpenCLUnit, ICUDAUnit, INumpyUnit)
@@ -141,6 +145,61 @@ Some text from fourth.jcc
 """, src)
 
 
+class TestKernelCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix="veles-test-kernel-cache-")
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_key(self):
+        cache = KernelCache(self.cache_dir)
+        include = os.path.join(self.cache_dir, "include.cl")
+        with open(include, "w") as fout:
+            fout.write("#define A 1")
+        digest, contents = cache.read_file(include)
+        self.assertEqual(contents, b"#define A 1")
+        key = cache.key("source", [digest], "device", {"B": 2})
+        self.assertEqual(key, cache.key("source", [digest], "device",
+                                        {"B": 2}))
+        self.assertNotEqual(key, cache.key("source", [digest], "device",
+                                           {"B": 3}))
+        self.assertNotEqual(key, cache.key("source", [digest], "other",
+                                           {"B": 2}))
+        with open(include, "w") as fout:
+            fout.write("#define A 22")
+        self.assertNotEqual(key, cache.key(
+            "source", [cache.read_file(include)[0]], "device", {"B": 2}))
+
+    def test_get_put(self):
+        cache = KernelCache(self.cache_dir)
+        self.assertIsNone(cache.get("0" * 40))
+        data = {"binaries": [b"\x00" * 100], "device": "device"}
+        cache.put("1" * 40, data, "unit.cl")
+        other = KernelCache(self.cache_dir)
+        self.assertEqual(other.get("1" * 40), data)
+        self.assertEqual((cache.hits, cache.misses, cache.stores), (0, 1, 1))
+        self.assertEqual(other.hits, 1)
+        self.assertEqual(list(cache.entries().values()), [
+            (os.path.getsize(cache._path("1" * 40)), "unit.cl")])
+        cache.print_stats()
+        self.assertEqual(cache.misses, 0)
+
+    def test_evict(self):
+        cache = KernelCache(self.cache_dir, max_size=1000)
+        for index in range(3):
+            key = str(index) * 40
+            cache.put(key, {"binaries": b"\x00" * 300}, "unit%d" % index)
+            when = time.time() - 100 + index
+            os.utime(cache._path(key), (when, when))
+        # the hit makes the first entry the most recently used one
+        self.assertIsNotNone(cache.get("0" * 40))
+        cache.put("3" * 40, {"binaries": b"\x00" * 300}, "unit3")
+        self.assertEqual(set(cache.entries()), {"0" * 40, "2" * 40, "3" * 40})
+        self.assertFalse(os.path.exists(cache._path("1" * 40)))
+        self.assertEqual(cache.evictions, 1)
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     unittest.main()
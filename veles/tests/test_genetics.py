@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy
+from zope.interface import implementer
+
+from veles import __root__
+from veles.config import Config, root
+from veles.dummy import DummyWorkflow
+from veles.genetics import Range
+from veles.genetics.evaluation_pool import EvaluationPool, \
+    LoadedDataCache, override_config, restore_config
+from veles.loader import IFullBatchLoader, FullBatchLoader
+from veles.genetics.optimization_workflow import GeneticsOptimizer
+from veles.import_file import import_file_as_module
+
+SAMPLE = os.path.join(__root__, "veles", "samples", "GeneticExample")
+
+
+class TestEvaluationPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = EvaluationPool(
+            [os.path.join(SAMPLE, "genetics.py"),
+             os.path.join(SAMPLE, "genetics_config.py"),
+             "root.common.disable.snapshotting=True"], [], "test")
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_evaluate(self):
+        config = Config("")
+        config.test.update({"x": 0.5, "y": 0.0})
+        for y in (0.0, -0.5, 0.27):
+            config.test.y = y
+            result = self.pool.evaluate(copy.deepcopy(config))
+            self.assertEqual(result["log_id"], "test")
+            self.assertAlmostEqual(
+                result["EvaluationFitness"],
+                -(0.5 - 0.33) ** 2 * (y - 0.27) ** 2)
+        self.assertEqual(len(self.pool._workers), 1)
+
+    def test_failure(self):
+        config = Config("")
+        config.test.x = "not a number"
+        self.assertIsNone(self.pool.evaluate(config))
+        config.test.x = 0.33
+        self.assertEqual(
+            self.pool.evaluate(config)["EvaluationFitness"], 0)
+
+    def test_config_reset(self):
+        config = Config("")
+        config.test.update({"x": 0.5, "y": 0.0})
+        self.pool.evaluate(config)
+        # x must not leak from the previous evaluation
+        config = Config("")
+        config.test.update({"x": 0.33})
+        self.assertEqual(
+            self.pool.evaluate(config)["EvaluationFitness"], 0)
+        config = Config("")
+        config.test.update({"y": 0.0})
+        self.assertAlmostEqual(
+            self.pool.evaluate(config)["EvaluationFitness"],
+            -0.33 ** 2 * 0.27 ** 2)
+
+
+class TestConfigOverride(unittest.TestCase):
+    def test_override_restore(self):
+        root.test_override.update({"a": 1, "nested": {"b": 2, "c": 3}})
+        nested = root.test_override.nested
+        config = Config("")
+        config.test_override.update({"a": 10, "nested": {"b": 20},
+                                     "extra": {"d": 4}})
+        undo = []
+        override_config(root, config, undo)
+        self.assertEqual(root.test_override.a, 10)
+        self.assertIs(root.test_override.nested, nested)
+        self.assertEqual(nested.b, 20)
+        self.assertEqual(nested.c, 3)
+        self.assertEqual(root.test_override.extra.d, 4)
+        restore_config(undo)
+        self.assertEqual(root.test_override.a, 1)
+        self.assertEqual(nested.b, 2)
+        self.assertEqual(nested.c, 3)
+        self.assertNotIn("extra", root.test_override.__content__)
+        self.assertEqual(undo, [])
+
+
+@implementer(IFullBatchLoader)
+class CountingLoader(FullBatchLoader):
+    calls = 0
+
+    def load_data(self):
+        CountingLoader.calls += 1
+        self.original_data.mem = numpy.arange(
+            100, dtype=numpy.float32).reshape(50, 2)
+        self.original_labels.extend(range(50))
+        self.class_lengths[:] = 0, 10, 40
+
+
+class TestLoadedDataCache(unittest.TestCase):
+    def setUp(self):
+        CountingLoader.calls = 0
+        self.cache = LoadedDataCache()
+
+    def load(self, lock=False, **kwargs):
+        workflow = DummyWorkflow()
+        loader = CountingLoader(workflow, name="loader", **kwargs)
+        if lock:
+            loader.lock = threading.Lock()
+        self.cache.attach(workflow)
+        try:
+            loader.load_data()
+        finally:
+            self.cache.detach(workflow)
+        self.assertNotIn("load_data", loader.__dict__)
+        return loader
+
+    def test_reuse(self):
+        first = self.load()
+        data = first.original_data.mem.copy()
+        first.original_data.mem *= 2
+        second = self.load()
+        self.assertEqual(CountingLoader.calls, 1)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(first.class_lengths, second.class_lengths)
+        self.assertEqual(first.original_labels, second.original_labels)
+        self.assertTrue((second.original_data.mem == data).all())
+        self.load(minibatch_size=10)
+        self.assertEqual(CountingLoader.calls, 2)
+        self.load(minibatch_size=numpy.int32(10))
+        self.assertEqual(CountingLoader.calls, 3)
+
+    def test_uncomparable(self):
+        for _ in range(2):
+            self.load(lock=True)
+        self.assertEqual(CountingLoader.calls, 2)
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestConcurrentEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+        # stop() writes the best config to the current directory
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp(prefix="veles-test-genetics-")
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_concurrent(self):
+        config = Config("root")
+        config.test.update({"x": Range(0.0, -1.0, 1.0),
+                            "y": Range(0.0, -1.0, 1.0)})
+        model = import_file_as_module(os.path.join(SAMPLE, "genetics.py"))
+        optimizer = GeneticsOptimizer(
+            self.parent, model=model, config=config, size=6, generations=2,
+            evaluation="pool", jobs=3)
+        self.assertTrue(optimizer.concurrent)
+        optimizer.initialize()
+        optimizer._filtered_argv_[:] = [
+            os.path.join(SAMPLE, "genetics.py"),
+            os.path.join(SAMPLE, "genetics_config.py")]
+        try:
+            optimizer.run()
+            self.assertEqual(len(optimizer._evaluation_pool_._workers), 3)
+        finally:
+            optimizer.stop()
+        self.assertTrue(optimizer.generation_changed)
+        population = optimizer.population
+        self.assertEqual(population.generation, 1)
+        for chromo in population[:population.size]:
+            x, y = chromo.numeric
+            self.assertAlmostEqual(
+                chromo.fitness, -(x - 0.33) ** 2 * (y - 0.27) ** 2)
+        self.assertEqual(population.pending_size,
+                         len(population) - population.size)
+        self.assertEqual(optimizer._chromosome_index, population.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
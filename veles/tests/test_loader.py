@@ -35,12 +35,19 @@ under the License.
 """
 
 
+from collections import namedtuple
 from itertools import product
+import logging
 import unittest
 import numpy
 import os
+from PIL import Image
+import shutil
+import tempfile
 from zope.interface import implementer
 from veles.backends import NumpyDevice
+from veles.config import root
+from veles.dummy import DummyLauncher, DummyWorkflow
 
 from veles.tests import AcceleratedTest, assign_backend
 try:
@@ -51,6 +58,14 @@ except ImportError:
     skip_hdf5 = True
 import veles.prng as rnd
 from veles.loader import IFullBatchLoader, FullBatchLoaderMSE
+from veles.loader.fullbatch_image import FullBatchAutoLabelFileImageLoader
+from veles.loader.image_cache import ImageCache
+from veles.numpy_ext import gather
+from veles.timeit2 import timeit
+from veles.workflow import Workflow
+
+Slave = namedtuple("Slave", "id")
+PoweredSlave = namedtuple("PoweredSlave", ("id", "power"))
 
 
 @implementer(IFullBatchLoader)
@@ -111,6 +126,343 @@ class TestFullBatchLoader(AcceleratedTest):
         return res_data, res_labels, res_target
 
 
+class MasterLauncher(DummyLauncher):
+    @property
+    def is_master(self):
+        return True
+
+    @property
+    def is_standalone(self):
+        return False
+
+
+class TestSlaveAccounting(unittest.TestCase):
+    def setUp(self):
+        # the workflow holds a weak reference to its launcher
+        self.launcher = MasterLauncher()
+        self.parent = Workflow(self.launcher)
+
+    def test_prefetched_jobs(self):
+        loader = Loader(self.parent)
+        loader.initialize(NumpyDevice())
+        slave = Slave("slave")
+        served = []
+        for _ in range(3):
+            loader.generate_data_for_slave(slave)
+            served.append((loader.minibatch_offset, loader.minibatch_size))
+        loader.apply_data_from_slave(True, slave)
+        self.assertEqual((loader.minibatch_offset, loader.minibatch_size),
+                         served[0])
+        self.assertEqual(loader.pending_minibatches_[slave.id], served[1:])
+        loader.drop_slave(slave)
+        self.assertEqual(loader.pending_minibatches_count, 0)
+        self.assertEqual(sorted(loader.failed_minibatches), served[1:])
+
+    def test_speculative_execution(self):
+        loader = Loader(self.parent, speculative_execution=True)
+        loader.initialize(NumpyDevice())
+        fast, slow = Slave("fast"), Slave("slow")
+        loader.generate_data_for_slave(slow)
+        late = loader.minibatch_offset, loader.minibatch_size
+        while not loader.class_ended:
+            loader.generate_data_for_slave(fast)
+            loader.apply_data_from_slave(True, fast)
+        self.assertFalse(loader.last_minibatch)
+        loader._job_durations_[fast.id].extend([1.0] * 3)
+        self.assertFalse(loader.has_data_for_slave)
+        loader._serve_times_[slow.id][0] -= 10
+        self.assertTrue(loader.has_data_for_slave)
+        # the slave would not finish its own minibatch any sooner
+        self.assertIsNone(loader._find_straggler(slow.id))
+        loader.generate_data_for_slave(fast)
+        self.assertEqual(
+            (loader.minibatch_offset, loader.minibatch_size), late)
+        self.assertFalse(loader.has_data_for_slave)
+        loader.apply_data_from_slave(True, fast)
+        self.assertTrue(loader.last_minibatch)
+        self.assertEqual(loader.pending_minibatches_count, 0)
+        self.assertFalse(loader.drops_update_from(fast))
+        self.assertTrue(loader.drops_update_from(slow))
+        self.assertEqual(loader.pending_minibatches_[slow.id], [])
+        loader.drop_slave(slow)
+        self.assertEqual(loader.failed_minibatches, [])
+
+    def test_restore_defaults(self):
+        loader = Loader(self.parent)
+        del loader.speculative_execution
+        del loader.weighted_minibatches
+        del loader.prefetch_minibatch
+        loader.init_unpickled()
+        self.assertFalse(loader.speculative_execution)
+        self.assertFalse(loader.weighted_minibatches)
+        self.assertFalse(loader.prefetch_minibatch)
+
+    def test_weighted_minibatches(self):
+        loader = Loader(self.parent, weighted_minibatches=True)
+        loader.initialize(NumpyDevice())
+        fast, slow = PoweredSlave("fast", 100), PoweredSlave("slow", 25)
+
+        def serve(slave, duration):
+            loader.generate_data_for_slave(slave)
+            size = loader.minibatch_size
+            loader._serve_times_[slave.id][-1] -= duration
+            loader.apply_data_from_slave(True, slave)
+            return size
+
+        self.assertEqual(serve(fast, 0.1), 100)
+        self.assertEqual(serve(slow, 1), 25)
+        for _ in range(3):
+            serve(fast, 0.1)
+            serve(slow, 1)
+        # the slow slave is more than 10 times slower than the fast one
+        self.assertEqual(serve(slow, 1), 10)
+        self.assertEqual(serve(fast, 0.1), 100)
+        loader.weighted_minibatches = False
+        self.assertEqual(serve(slow, 1), 100)
+
+    def test_reported_run_times(self):
+        loader = Loader(self.parent, weighted_minibatches=True)
+        loader.initialize(NumpyDevice())
+        fast, slow = Slave("fast"), Slave("slow")
+
+        def serve(slave, run_time):
+            loader.generate_data_for_slave(slave)
+            size = loader.minibatch_size
+            # the fast slave prefetches, so its jobs wait in the queue
+            loader._serve_times_[slave.id][-1] -= 1
+            loader.apply_data_from_slave({"duration": run_time}, slave)
+            return size
+
+        for _ in range(4):
+            serve(fast, 0.1)
+            serve(slow, 1)
+        self.assertEqual(serve(slow, 1), 10)
+        self.assertEqual(serve(fast, 0.1), 100)
+
+    def test_run_time(self):
+        loader = Loader(self.parent)
+        loader.initialize(NumpyDevice())
+        self.assertTrue(loader.generate_data_for_master())
+        loader.apply_data_from_master(
+            loader.generate_data_for_slave(Slave("slave")))
+        duration = loader.generate_data_for_master()["duration"]
+        self.assertGreaterEqual(duration, 0)
+        self.assertLess(duration, 1)
+
+
+class TestMinibatchPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.launcher = DummyLauncher()
+        self.parent = Workflow(self.launcher)
+
+    def serve(self, prefetch, count):
+        rnd.get().seed(123)
+        loader = Loader(self.parent, prefetch_minibatch=prefetch,
+                        force_numpy=True)
+        loader.initialize(NumpyDevice())
+        self.assertEqual(
+            loader._minibatch_prefetch_thread_ is not None, prefetch)
+        served = []
+        for _ in range(count):
+            loader.run()
+            served.append((
+                loader.minibatch_offset, loader.minibatch_size,
+                loader.minibatch_class, bool(loader.last_minibatch),
+                bool(loader.epoch_ended), loader.minibatch_data.mem.copy(),
+                loader.minibatch_labels.mem.copy(),
+                loader.minibatch_targets.mem.copy()))
+            # the units would read the current minibatch here
+            loader.minibatch_data.mem[:] = numpy.nan
+        loader.stop()
+        self.assertIsNone(loader._minibatch_prefetch_thread_)
+        return served
+
+    def test_prefetch(self):
+        # two epochs of 98 + 619 minibatches
+        count = 1500
+        plain = self.serve(False, count)
+        prefetched = self.serve(True, count)
+        for first, second in zip(plain, prefetched):
+            self.assertEqual(first[:5], second[:5])
+            for a, b in zip(first[5:], second[5:]):
+                self.assertTrue((a == b).all())
+
+
+class TestGather(unittest.TestCase):
+    def test_gather(self):
+        src = numpy.arange(1000 * 12, dtype=numpy.float32).reshape(
+            1000, 3, 4)
+        indices = numpy.array([5, 999, 0, 5, 17], dtype=numpy.int32)
+        out = numpy.zeros((8, 3, 4), dtype=numpy.float32)
+        gather(src, indices, out[:len(indices)])
+        self.assertTrue((out[:len(indices)] == src[indices]).all())
+        self.assertTrue((out[len(indices):] == 0).all())
+        out64 = numpy.zeros((len(indices), 3, 4), dtype=numpy.float64)
+        gather(src, indices, out64)
+        self.assertTrue((out64 == src[indices]).all())
+        negative = numpy.array([-1, -1000, 3], dtype=numpy.int32)
+        gather(src, negative, out[:3])
+        self.assertTrue((out[:3] == src[negative]).all())
+        for bad in (1000, -1001):
+            indices[1] = bad
+            self.assertRaises(IndexError, gather, src, indices,
+                              out[:len(indices)])
+
+    def test_gather_speed(self):
+        prng = rnd.get()
+        prng.seed(123)
+        minibatch_size = 100
+        for sample_size in (16, 784, 3072, 150528):
+            count = max(minibatch_size * 10, 10 ** 7 // (sample_size * 4))
+            src = numpy.zeros((count, sample_size), numpy.float32)
+            prng.fill(src)
+            indices = prng.randint(
+                0, count, minibatch_size).astype(numpy.int32)
+            out_loop = numpy.zeros((minibatch_size, sample_size), src.dtype)
+            out = numpy.zeros_like(out_loop)
+
+            def loop():
+                for i, sample_index in enumerate(indices):
+                    out_loop[i] = src[int(sample_index)]
+
+            _, time_loop = timeit(loop)
+            _, time_gather = timeit(gather, src, indices, out)
+            self.assertTrue((out == out_loop).all())
+            logging.info("Sample size %d: loop %.6f sec, gather %.6f sec "
+                         "per minibatch of %d", sample_size, time_loop,
+                         time_gather, minibatch_size)
+
+
+class TestLabelsMapping(unittest.TestCase):
+    def test_map_labels(self):
+        loader = Loader(DummyWorkflow())
+        out = numpy.zeros(5, dtype=numpy.int32)
+        loader.labels_mapping.update(
+            {k: i for i, k in enumerate(range(0, 1000, 3))})
+        self.assertTrue(loader.map_labels([0, 3, 999, 6, 3], out))
+        self.assertEqual(out.tolist(), [0, 1, 333, 2, 1])
+        self.assertFalse(loader.map_labels([0, 3, 998, 6, 3], out))
+        self.assertFalse(loader.map_labels([0, 3, None, 6, 3], out))
+        loader.labels_mapping.clear()
+        loader.labels_mapping.update({"cat": 1, "dog": 0, "zebra": 2})
+        self.assertTrue(loader.map_labels(
+            ["zebra", "cat", "dog", "cat", "dog"], out))
+        self.assertEqual(out.tolist(), [2, 1, 0, 1, 0])
+        self.assertFalse(loader.map_labels(
+            ["zebra", "cat", "do", "cat", "dog"], out))
+        # the same size, but different values
+        loader.labels_mapping.update({"cat": 0, "dog": 2, "zebra": 1})
+        self.assertTrue(loader.map_labels(
+            ["zebra", "cat", "dog", "cat", "dog"], out))
+        self.assertEqual(out.tolist(), [1, 0, 2, 0, 2])
+
+    def test_map_labels_speed(self):
+        loader = Loader(DummyWorkflow())
+        loader.labels_mapping.update({k: i for i, k in enumerate(range(1000))})
+        for count in (10 ** 4, 10 ** 5, 10 ** 6):
+            raw_labels = list(numpy.arange(count) % 1000)
+            out_dict = numpy.zeros(count, dtype=numpy.int32)
+            out = numpy.zeros_like(out_dict)
+
+            def dict_lookup():
+                for i, label in enumerate(raw_labels):
+                    out_dict[i] = loader.labels_mapping[label]
+
+            _, time_dict = timeit(dict_lookup)
+            res, time_lut = timeit(loader.map_labels, raw_labels, out)
+            self.assertTrue(res)
+            self.assertTrue((out == out_dict).all())
+            logging.info("%d labels: dict %.6f sec, lookup table %.6f sec",
+                         count, time_dict, time_lut)
+
+
+class ImagesTestBase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="veles-test-images-")
+        prng = rnd.get()
+        prng.seed(123)
+        for label in "cat", "dog":
+            os.mkdir(os.path.join(self.path, label))
+            for i in range(100):
+                img = numpy.zeros((128, 128, 3), dtype=numpy.uint8)
+                img[:] = prng.randint(0, 256, img.shape)
+                Image.fromarray(img).save(os.path.join(
+                    self.path, label, "%d.%s" % (i, ("png", "jpg")[i % 2])))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+class TestImageLoaderWorkers(ImagesTestBase):
+    def load(self, workers):
+        loader = FullBatchAutoLabelFileImageLoader(
+            DummyWorkflow(), train_paths=[self.path], scale=(96, 96),
+            mirror="random", loader_workers=workers)
+        loader.prng.seed(456)
+        try:
+            _, elapsed = timeit(loader.load_data)
+        finally:
+            loader.stop()
+        return loader, elapsed
+
+    def test_loader_workers(self):
+        single, time_single = self.load(1)
+        multi, time_multi = self.load(4)
+        self.assertEqual(multi.loader_workers, 4)
+        self.assertEqual(single.original_data.shape,
+                         multi.original_data.shape)
+        self.assertTrue((single.original_data.mem ==
+                         multi.original_data.mem).all())
+        self.assertEqual(single.original_labels, multi.original_labels)
+        logging.info("%d images: 1 worker %.3f sec, 4 workers %.3f sec",
+                     single.original_data.shape[0], time_single, time_multi)
+
+
+class TestImageCache(ImagesTestBase):
+    def setUp(self):
+        super(TestImageCache, self).setUp()
+        self.cache_dir = tempfile.mkdtemp(prefix="veles-test-image-cache-")
+        root.common.loader.image_cache.dir = self.cache_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        root.common.loader.image_cache.dir = os.path.join(
+            root.common.dirs.cache, "images")
+        super(TestImageCache, self).tearDown()
+
+    def load(self, cache_images):
+        loader = FullBatchAutoLabelFileImageLoader(
+            DummyWorkflow(), train_paths=[self.path], scale=(96, 96),
+            cache_images=cache_images)
+        loader.load_data()
+        cache = loader.image_cache
+        stats = (cache.hits, cache.misses) if cache is not None else None
+        loader.stop()
+        return loader, stats
+
+    def test_image_cache(self):
+        reference, _ = self.load(False)
+        first, stats = self.load(True)
+        # load_data() probes one image for labels before loading them all
+        self.assertEqual(stats, (1, 200))
+        self.assertTrue((first.original_data.mem ==
+                         reference.original_data.mem).all())
+        changed = os.path.join(self.path, "cat", "0.png")
+        stat = os.stat(changed)
+        os.utime(changed, (stat.st_atime, stat.st_mtime + 1))
+        second, stats = self.load(True)
+        self.assertEqual(stats, (200, 1))
+        self.assertTrue((second.original_data.mem ==
+                         reference.original_data.mem).all())
+        buckets = ImageCache.buckets()
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual(buckets[0][3]["shape"], [96, 96])
+        self.assertEqual(ImageCache.purge(max_size=buckets[0][1]),
+                         buckets[0][1])
+        self.assertEqual(ImageCache.purge(), 0)
+        self.assertEqual(ImageCache.buckets(), [])
+
+
 @unittest.skipIf(skip_hdf5, "h5py is unavailable")
 @assign_backend("ocl")
 class TestHDF5Loader(AcceleratedTest):
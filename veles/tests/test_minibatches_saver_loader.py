@@ -35,13 +35,17 @@ under the License.
 """
 
 
+import os
+import tempfile
 import unittest
 import numpy
 from zope.interface import implementer
 
 from veles.dummy import DummyWorkflow
 from veles.loader import MinibatchesSaver, MinibatchesLoader, Loader, ILoader
+from veles.loader.saver import convert_to_raw
 from veles.logger import Logger, logging
+from veles.timeit2 import timeit
 
 
 @implementer(ILoader)
@@ -61,6 +65,30 @@ class MyLoader(Loader):
             self.counter += 1
 
 
+@implementer(ILoader)
+class LabeledLoader(Loader):
+    def __init__(self, workflow, **kwargs):
+        super(LabeledLoader, self).__init__(workflow, **kwargs)
+        self.sample_size = kwargs.get("sample_size", 1)
+
+    def load_data(self):
+        self.counter = 0
+        self.class_lengths[:] = 100, 200, 700
+        self._has_labels = True
+        self.labels_mapping.update({"l%d" % i: i for i in range(10)})
+        self.normalizer.analyze(self.minibatch_data.mem)
+
+    def create_minibatch_data(self):
+        self.minibatch_data.reset(numpy.zeros(
+            (100, self.sample_size), dtype=numpy.float32))
+
+    def fill_minibatch(self):
+        for i in range(self.minibatch_size):
+            self.minibatch_data[i] = self.counter
+            self.raw_minibatch_labels[i] = "l%d" % (self.counter % 10)
+            self.counter += 1
+
+
 class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
     def setUp(self):
         self.parent = DummyWorkflow()
@@ -68,7 +96,7 @@ class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
         self.loader = MinibatchesLoader(
             self.parent, shuffle_limit=0, file_name=self.saver.file_name)
 
-    def testToTheMoonAndBack(self):
+    def save(self):
         myloader = MyLoader(self.parent, shuffle_limit=0, minibatch_size=100)
         myloader.initialize()
         self.saver.link_attrs(myloader, *Loader.exports)
@@ -77,6 +105,9 @@ class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
             myloader.run()
             self.saver.run()
         self.saver.stop()
+
+    def testToTheMoonAndBack(self):
+        self.save()
         self.loader.initialize()
         counter = 0
         while not self.loader.epoch_ended:
@@ -85,6 +116,133 @@ class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
                 self.assertEqual(self.loader.minibatch_data[i], counter)
                 counter += 1
 
+    def testChunkCache(self):
+        with tempfile.NamedTemporaryFile(suffix=".dat") as fout:
+            # TRAIN chunks are ten times smaller than the minibatch
+            self.save_labeled(fout.name, class_chunk_sizes=(0, 0, 10))
+            loader = MinibatchesLoader(
+                self.parent, shuffle_limit=0, file_name=fout.name,
+                chunk_cache_size=50 * 10 * 4, prefetch_minibatches=2)
+            loader.initialize()
+            self.assertEqual(tuple(loader.class_chunk_lengths), (100, 100, 10))
+            indices = numpy.arange(loader.total_samples)
+            self.assertEqual(
+                [tuple(a) for a in zip(*loader.get_addresses(indices))],
+                [loader.get_address(i) for i in indices])
+            loader.prng.shuffle(loader.shuffled_indices.mem)
+            try:
+                while not loader.train_ended:
+                    loader.run()
+                    size = loader.minibatch_size
+                    indices = loader.minibatch_indices.mem[:size]
+                    self.assertEqual(
+                        loader.minibatch_data.mem[:size, 0].tolist(),
+                        indices.tolist())
+            finally:
+                loader.stop()
+        metrics = loader.get_metric_values()
+        self.assertEqual(loader.chunk_cache_hits,
+                         metrics["Chunk cache hits"])
+        self.assertEqual(loader.chunk_cache_misses,
+                         metrics["Chunk cache misses"])
+        self.assertGreater(loader.chunk_cache_hits, 0)
+        self.assertGreater(loader.chunk_cache_misses, 0)
+
+    def testMinibatchPrefetch(self):
+        with tempfile.NamedTemporaryFile(suffix=".dat") as fout:
+            self.save_labeled(fout.name, class_chunk_sizes=(0, 0, 10))
+            loader = MinibatchesLoader(
+                self.parent, shuffle_limit=0, file_name=fout.name,
+                prefetch_minibatch=True, prefetch_minibatches=2)
+            loader.initialize()
+            self.assertIsNotNone(loader._minibatch_prefetch_thread_)
+            loader.prng.shuffle(loader.shuffled_indices.mem)
+            try:
+                while not loader.train_ended:
+                    loader.run()
+                    size = loader.minibatch_size
+                    indices = loader.minibatch_indices.mem[:size]
+                    self.assertEqual(
+                        loader.minibatch_data.mem[:size, 0].tolist(),
+                        indices.tolist())
+                    # the units would read the current minibatch here
+                    loader.minibatch_data.mem[:] = -1
+            finally:
+                loader.stop()
+            self.assertIsNone(loader._minibatch_prefetch_thread_)
+            self.assertIsNone(loader._prefetch_thread_)
+
+    def save_labeled(self, file_name, sample_size=1, **kwargs):
+        loader = LabeledLoader(self.parent, shuffle_limit=0,
+                               minibatch_size=100, sample_size=sample_size)
+        loader.initialize()
+        saver = MinibatchesSaver(self.parent, file_name=file_name, **kwargs)
+        saver.link_attrs(loader, *Loader.exports)
+        saver.initialize()
+        while not loader.train_ended:
+            loader.run()
+            saver.run()
+        saver.stop()
+
+    def check_labeled(self, file_name, **kwargs):
+        loader = MinibatchesLoader(
+            self.parent, shuffle_limit=0, file_name=file_name, **kwargs)
+        loader.initialize()
+        self.assertEqual(loader.class_lengths, [100, 200, 700])
+        self.assertEqual(len(loader.labels_mapping), 10)
+        # Serve samples from different classes in the same minibatch
+        loader.prng.shuffle(loader.shuffled_indices.mem)
+        served = 0
+        while not loader.train_ended:
+            loader.run()
+            size = loader.minibatch_size
+            indices = loader.minibatch_indices.mem[:size]
+            self.assertEqual(loader.minibatch_data.mem[:size, 0].tolist(),
+                             indices.tolist())
+            self.assertEqual(loader.minibatch_labels.mem[:size].tolist(),
+                             (indices % 10).tolist())
+            served += size
+        self.assertEqual(served, 1000)
+        return loader
+
+    def testRaw(self):
+        with tempfile.NamedTemporaryFile(suffix=".dat") as fout:
+            self.save_labeled(fout.name, format="raw")
+            loader = self.check_labeled(fout.name)
+            self.assertIsNotNone(loader._raw_data_)
+
+    def testConvertToRaw(self):
+        with tempfile.NamedTemporaryFile(suffix=".dat") as src, \
+                tempfile.NamedTemporaryFile(suffix=".raw") as dst:
+            self.save_labeled(src.name, class_chunk_sizes=(10, 0, 20))
+            self.check_labeled(src.name)
+            convert_to_raw(src.name, dst.name)
+            self.check_labeled(dst.name)
+
+    def testReadThroughput(self):
+        def read_epoch(loader):
+            loader.prng.shuffle(loader.shuffled_indices.mem)
+            loader.train_ended <<= False
+            while not loader.train_ended:
+                loader.run()
+
+        for fmt in "raw", "snappy", "gz":
+            with tempfile.NamedTemporaryFile(suffix=".dat") as fout:
+                kwargs = {"format": "raw"} if fmt == "raw" else {
+                    "compression": fmt, "compression_level": 1,
+                    "class_chunk_sizes": (10, 10, 10)}
+                self.save_labeled(fout.name, sample_size=3072, **kwargs)
+                # Measure the format itself, without the chunk cache
+                loader = MinibatchesLoader(
+                    self.parent, shuffle_limit=0, file_name=fout.name,
+                    chunk_cache_size=0)
+                loader.initialize()
+                _, elapsed = timeit(read_epoch, loader)
+                size = loader.total_samples * 3072 * 4
+                logging.info("%s: %.3f sec, %.1f MB/s (file is %d bytes)",
+                             fmt, elapsed, size / elapsed / (1 << 20),
+                             os.path.getsize(fout.name))
+
 
 if __name__ == "__main__":
     Logger.setup_logging(logging.DEBUG)
@@ -33,19 +33,35 @@ under the License.
 """
 
 
+from collections import namedtuple
 import logging
+import multiprocessing
+import numpy
+import os
+from tempfile import mkdtemp
+import shutil
 import threading
 import unittest
 
 from six import BytesIO, PY3
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
 from veles.backends import NumpyDevice
+from veles.config import root
+from zmq import constants
 
 import veles.client as client
-from veles.txzmq.connection import ZmqConnection
+from veles.txzmq import AdaptiveCompression, SharedIO, SharedIOChannel
+from veles.txzmq.compression import SampleFile
+from veles.txzmq.connection import ZmqConnection, ZmqEndpoint, \
+    ZmqEndpointType
+from veles.logger import Logger
+from veles.pickle2 import pickle, best_protocol
 from veles.prng import get as get_rg
 import veles.server as server
 from veles.tests import DummyLauncher
+from veles.timeit2 import timeit
 from veles.workflow import Workflow
 
 
@@ -175,6 +191,547 @@ class TestZmqConnection(unittest.TestCase):
             self.assertEqual(idata, merged)
 
 
+class PairConnection(ZmqConnection):
+    socketType = constants.PAIR
+
+    def __init__(self, endpoints):
+        self.received = []
+        super(PairConnection, self).__init__(endpoints)
+
+    def messageReceived(self, message):
+        self.received.append(message)
+
+    def receive(self):
+        while not self.received:
+            self.socket.poll(10000)
+            self.doRead()
+        return self.received.pop(0)
+
+
+def send_updates(address, size, count, use_shmem):
+    connection = PairConnection(
+        (ZmqEndpoint(ZmqEndpointType.connect, address),))
+    channel = SharedIOChannel("veles-test-update-%d" % os.getpid()) \
+        if use_shmem else None
+    update = numpy.ones(size, dtype=numpy.float32)
+    connection.send(b"ready")
+    connection.receive()
+    for _ in range(count):
+        overflow = False
+        try:
+            pickles_size = connection.send(
+                b"update", update, pickles_compression=None,
+                io=channel.acquire() if channel is not None else None)
+        except ZmqConnection.IOOverflow as e:
+            pickles_size = e.size
+            overflow = True
+        if channel is not None:
+            channel.commit(pickles_size, overflow)
+        # the segment can be reused after the master has read the update
+        connection.receive()
+    connection.shutdown()
+
+
+class TestSharedMemoryUpdates(unittest.TestCase):
+    SLAVES = 4
+    UPDATES = 10
+
+    def setUp(self):
+        self.tmpdir = mkdtemp(prefix="veles-test-network-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def receive_updates(self, size, use_shmem):
+        context = multiprocessing.get_context("spawn")
+        masters = []
+        slaves = []
+        for index in range(self.SLAVES):
+            address = "ipc://" + os.path.join(self.tmpdir, str(index))
+            masters.append(PairConnection(
+                (ZmqEndpoint(ZmqEndpointType.bind, address),)))
+            slaves.append(context.Process(
+                target=send_updates,
+                args=(address, size, self.UPDATES, use_shmem)))
+        for slave in slaves:
+            slave.start()
+        try:
+            # exclude the startup of the slaves
+            for master in masters:
+                self.assertEqual(master.receive(), [b"ready"])
+            for master in masters:
+                master.send(b"go")
+
+            def loop():
+                pending = {master: self.UPDATES for master in masters}
+                while pending:
+                    for master in list(pending):
+                        if not master.socket.poll(0):
+                            continue
+                        master.doRead()
+                        while master.received:
+                            command, update = master.received.pop(0)
+                            self.assertEqual(command, b"update")
+                            self.assertEqual(update.shape, (size,))
+                            master.send(b"ack")
+                            pending[master] -= 1
+                        if pending[master] == 0:
+                            del pending[master]
+
+            _, delta = timeit(loop)
+        finally:
+            for slave in slaves:
+                slave.join()
+            for master in masters:
+                master.shutdown()
+        for slave in slaves:
+            self.assertEqual(slave.exitcode, 0)
+        return delta
+
+    def testBenchmark(self):
+        for size in (1 << 18, 1 << 22):
+            megabytes = size * 4 * self.SLAVES * self.UPDATES / (1 << 20)
+            for use_shmem in (False, True):
+                delta = self.receive_updates(size, use_shmem)
+                logging.info("%d slaves, %d MB updates, shmem=%s: %.0f MB/s",
+                             self.SLAVES, size >> 18, use_shmem,
+                             megabytes / delta)
+
+
+class RouterConnection(PairConnection):
+    socketType = constants.ROUTER
+
+
+class UpdateResults(object):
+    def __init__(self):
+        self.results = []
+
+    def update_result_received(self, result):
+        self.results.append(result)
+
+
+class TestPrefetchedUpdates(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = mkdtemp(prefix="veles-test-network-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testBackToBack(self):
+        address = "ipc://" + os.path.join(self.tmpdir, "socket")
+        master = RouterConnection(
+            (ZmqEndpoint(ZmqEndpointType.bind, address),))
+        host = UpdateResults()
+        nid = "test-%d" % os.getpid()
+        dealer = client.ZmqDealer(
+            nid, host, ZmqEndpoint("connect", address), use_shmem=True)
+        try:
+            updates = [numpy.full(1 << 16, i, numpy.float32)
+                       for i in range(3)]
+            # the first update allocates the segment
+            dealer.request("update", updates[0])
+            self.assertTrue((master.receive()[3] == 0).all())
+            dealer.update_result_received(b'1')
+            self.assertGreater(dealer.shmem.size, 0)
+            # the prefetched job finishes before the master confirms
+            dealer.request("update", updates[1])
+            dealer.request("update", updates[2])
+            for i in (1, 2):
+                self.assertTrue((master.receive()[3] == i).all())
+            dealer.update_result_received(b'1')
+            dealer.update_result_received(b'1')
+            self.assertEqual(host.results, [b'1'] * 3)
+        finally:
+            dealer.shutdown()
+            master.shutdown()
+            SharedIO.forget("veles-update-" + nid)
+
+
+class TestOutOfBand(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = mkdtemp(prefix="veles-test-network-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def connect(self, address):
+        receiver = PairConnection(
+            (ZmqEndpoint(ZmqEndpointType.bind, address),))
+        sender = PairConnection(
+            (ZmqEndpoint(ZmqEndpointType.connect, address),))
+        return sender, receiver
+
+    def ipc_address(self):
+        return "ipc://" + os.path.join(self.tmpdir, "socket")
+
+    def testRoundTrip(self):
+        sender, receiver = self.connect(self.ipc_address())
+        try:
+            big = get_rg().rand(300, 200).astype(numpy.float32)
+            message = {"weights": big, "bias": numpy.arange(10),
+                       "transposed": big.T, "name": "fc"}
+            for compression in (None, "gzip", "snappy", "xz"):
+                sender.send(b"update", message, out_of_band=True,
+                            pickles_compression=compression)
+                command, received = receiver.receive()
+                self.assertEqual(command, b"update")
+                self.assertEqual(received["name"], "fc")
+                for key in ("weights", "bias", "transposed"):
+                    self.assertEqual(received[key].dtype, message[key].dtype)
+                    self.assertTrue(numpy.array_equal(
+                        received[key], message[key]), key)
+                    self.assertTrue(received[key].flags.writeable, key)
+                if compression is None:
+                    self.assertFalse(received["weights"].flags.owndata)
+            # the arrays may be overwritten as soon as send() returns
+            # (the array is too big to be flushed to the socket by then)
+            for compression in (None, "snappy"):
+                sent = numpy.arange(1 << 24, dtype=numpy.float32)
+                sender.send(b"update", {"weights": sent}, out_of_band=True,
+                            pickles_compression=compression)
+                sent[:] = 0
+                _, received = receiver.receive()
+                self.assertTrue(numpy.array_equal(
+                    received["weights"],
+                    numpy.arange(1 << 24, dtype=numpy.float32)))
+            # the pickles without arrays are still understood
+            sender.send(b"job", [1, 2, 3], out_of_band=True)
+            self.assertEqual(receiver.receive(), [b"job", [1, 2, 3]])
+        finally:
+            sender.shutdown()
+            receiver.shutdown()
+
+    def testBenchmark(self):
+        for address in (self.ipc_address(),
+                        "rndtcp://127.0.0.1:1024:65535:20"):
+            receiver = PairConnection(
+                (ZmqEndpoint(ZmqEndpointType.bind, address),))
+            if address.startswith("rndtcp"):
+                address = "tcp://127.0.0.1:%d" % receiver.rnd_vals[0]
+            sender = PairConnection(
+                (ZmqEndpoint(ZmqEndpointType.connect, address),))
+            try:
+                for size in (10, 100):
+                    arr = numpy.ones(size << 18, dtype=numpy.float32)
+                    for out_of_band in (False, True):
+                        def transfer():
+                            sender.send(b"update", arr,
+                                        pickles_compression=None,
+                                        out_of_band=out_of_band)
+                            return receiver.receive()
+
+                        res, delta = timeit(transfer)
+                        self.assertEqual(res[1].shape, arr.shape)
+                        logging.info(
+                            "%s %d MB out_of_band=%s: %.0f MB/s",
+                            address.split(":")[0], size, out_of_band,
+                            size / delta)
+            finally:
+                sender.shutdown()
+                receiver.shutdown()
+
+
+
+class TestAdaptiveCompression(unittest.TestCase):
+    def setUp(self):
+        # compressible, yet not trivial
+        self.message = {"data": numpy.repeat(
+            get_rg().randint(0, 16, 1 << 17).astype(numpy.uint8), 4)}
+
+    def testChoose(self):
+        compression = AdaptiveCompression(initial="snappy")
+        # nothing is known about the link yet
+        self.assertEqual(compression.choose(self.message), "snappy")
+        self.assertEqual(set(compression.ratios), set(compression.CODECS))
+        self.assertEqual(compression.ratios[None], 1.0)
+        self.assertLess(compression.ratios["xz"], 0.5)
+        compression.bandwidth = 1 << 40
+        self.assertIsNone(compression.choose(self.message))
+        compression.bandwidth = 1 << 15
+        self.assertIn(compression.choose(self.message), ("gzip", "xz"))
+        logging.info("Probed %s", compression)
+
+    def testMeasured(self):
+        compression = AdaptiveCompression()
+        compression.choose(self.message)
+        compression._measured(None, 100 << 20, 100 << 20, 1.0)
+        self.assertEqual(compression.bandwidth, 100 << 20)
+        compression._measured(None, 100 << 20, 100 << 20, 0.5)
+        self.assertAlmostEqual(
+            compression.bandwidth,
+            (100 << 20) + AdaptiveCompression.SMOOTHING * (100 << 20))
+        compression.speeds["xz"] = (1 << 20, 1 << 30)
+        # encoding was the bottleneck, so this is only a lower bound
+        compression._measured("xz", 100 << 20, 10 << 20, 100.0)
+        self.assertGreater(compression.bandwidth, 100 << 20)
+
+    def testSend(self):
+        tmpdir = mkdtemp(prefix="veles-test-network-")
+        address = "ipc://" + os.path.join(tmpdir, "socket")
+        receiver = PairConnection(
+            (ZmqEndpoint(ZmqEndpointType.bind, address),))
+        sender = PairConnection(
+            (ZmqEndpoint(ZmqEndpointType.connect, address),))
+        try:
+            compression = AdaptiveCompression(initial="gzip")
+            sender.send(b"job", self.message,
+                        pickles_compression=compression)
+            command, message = receiver.receive()
+            self.assertEqual(command, b"job")
+            self.assertTrue(numpy.array_equal(
+                message["data"], self.message["data"]))
+            self.assertGreater(compression.raw_size,
+                               self.message["data"].nbytes)
+            self.assertLess(compression.ratio, 0.5)
+            sender.pickles_compression = "adaptive"
+            sender.send(b"job", self.message, pickles_compression="adaptive")
+            command, message = receiver.receive()
+            self.assertTrue(numpy.array_equal(
+                message["data"], self.message["data"]))
+            self.assertGreater(sender.adaptive_compression.raw_size,
+                               self.message["data"].nbytes)
+            with self.assertRaises(ValueError):
+                sender.pickles_compression = "lz4"
+        finally:
+            sender.shutdown()
+            receiver.shutdown()
+            shutil.rmtree(tmpdir)
+
+    def testSampleFile(self):
+        sample = SampleFile(1000)
+        with self.assertRaises(SampleFile.Full):
+            pickle.dump(self.message, sample, protocol=best_protocol)
+        self.assertEqual(
+            bytes(sample.data),
+            pickle.dumps(self.message, protocol=best_protocol)[:1000])
+        sample = SampleFile(1 << 20)
+        pickle.dump([1, 2], sample, protocol=best_protocol)
+        self.assertEqual(bytes(sample.data),
+                         pickle.dumps([1, 2], protocol=best_protocol))
+
+
+class FakeSlave(Logger):
+    async = True
+    prefetch = 2
+    death_probability = 0
+
+    def __init__(self):
+        super(FakeSlave, self).__init__()
+        self.launcher = self
+        self.stopped = False
+        self.workflow = TestWorkflow()
+        self.state = client.fysom.Fysom(
+            client.VelesProtocol.FSM_DESCRIPTION, self)
+        self.idling = False
+
+    def stop(self):
+        self.stopped = True
+
+    def start_idling(self):
+        self.idling = True
+
+    def stop_idling(self):
+        self.idling = False
+
+
+class FakeDealer(object):
+    def __init__(self):
+        self.requests = []
+
+    def request(self, command, message=b''):
+        self.requests.append((command, message))
+
+
+class PrefetchingProtocol(client.VelesProtocol):
+    def __init__(self, *args, **kwargs):
+        super(PrefetchingProtocol, self).__init__(*args, **kwargs)
+        self.zmq_connection = FakeDealer()
+        self._power_upload_threshold = float("inf")
+        self.started = []
+
+    def _set_deferred(self, f, *args, **kwargs):
+        self.started.append(args[:2])
+
+    @property
+    def commands(self):
+        return [r[0] for r in self.zmq_connection.requests]
+
+
+class TestJobPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.host = FakeSlave()
+        self.protocol = PrefetchingProtocol(None, self.host)
+        self.host.state.owner = self.protocol
+        self.state = self.host.state
+        self.state.send_id()
+
+    def testQueue(self):
+        protocol = self.protocol
+        protocol.request_job()
+        self.assertTrue(self.host.idling)
+        protocol.job_received({"job": 0})
+        self.assertFalse(self.host.idling)
+        self.assertEqual(protocol.started, [({"job": 0}, None)])
+        self.assertEqual(self.state.current, "PREFETCHING")
+        protocol.job_received({"job": 1})
+        protocol.job_received({"job": 2})
+        self.assertEqual(self.state.current, "BUSY")
+        self.assertEqual(protocol.commands, ["job"] * 3)
+        protocol.job_finished({"update": 0})
+        self.assertEqual(protocol.started[-1], ({"job": 1}, {"update": 0}))
+        self.assertEqual(protocol.commands, ["job"] * 3 + ["update", "job"])
+        protocol.job_received(b"NEED_UPDATE")
+        self.assertEqual(self.state.current, "BUSY")
+        protocol.job_finished({"update": 1})
+        self.assertEqual(len(protocol.started), 3)
+        self.assertEqual(self.state.current, "PREFETCHING")
+        self.assertFalse(self.host.idling)
+        protocol.job_finished({"update": 2})
+        self.assertTrue(self.host.idling)
+        self.assertEqual(self.state.current, "GETTING_JOB")
+        self.assertEqual(protocol.commands.count("update"), 2)
+        protocol.job_received(False)
+        self.assertEqual(self.state.current, "END")
+        self.assertEqual(protocol.commands.count("update"), 3)
+        self.assertTrue(self.host.stopped)
+
+    def testRefusalWhilePrefetching(self):
+        protocol = self.protocol
+        protocol.request_job()
+        protocol.job_received({"job": 0})
+        protocol.job_received({"job": 1})
+        self.assertEqual(self.state.current, "PREFETCHING")
+        protocol.job_received(False)
+        self.assertEqual(self.state.current, "DRAINING")
+        self.assertFalse(self.host.stopped)
+        self.assertEqual(len(protocol.started), 1)
+        protocol.job_finished({"update": 0})
+        self.assertEqual(protocol.started[-1], ({"job": 1}, {"update": 0}))
+        self.assertEqual(protocol.commands, ["job"] * 3 + ["update"])
+        protocol.job_finished({"update": 1})
+        self.assertEqual(self.state.current, "END")
+        self.assertEqual(protocol.zmq_connection.requests[-1],
+                         ("update", {"update": 1}))
+        self.assertFalse(self.host.stopped)
+        protocol.update_result_received(b'1')
+        self.assertTrue(self.host.stopped)
+
+    def testNoPrefetch(self):
+        self.host.prefetch = 0
+        protocol = self.protocol
+        protocol.request_job()
+        protocol.job_received({"job": 0})
+        self.assertEqual(self.state.current, "BUSY")
+        protocol.job_finished({"update": 0})
+        self.assertEqual(self.state.current, "GETTING_JOB")
+        self.assertEqual(protocol.commands, ["job", "job"])
+        protocol.job_received({"job": 1})
+        self.assertEqual(protocol.started[-1], ({"job": 1}, {"update": 0}))
+        self.assertEqual(protocol.commands, ["job", "job", "update"])
+
+
+class FakeMaster(object):
+    def __init__(self):
+        self.logger = logging.getLogger("FakeMaster")
+        self.nodes = {}
+        self.job_timeout = 60
+        self.job_requests = set()
+        self.job_requests_retry = None
+
+
+class TestJobRequestsRetry(unittest.TestCase):
+    def setUp(self):
+        self.speculative_execution = \
+            root.common.engine.speculative_execution
+        self.host = FakeMaster()
+        self.protocol = server.VelesProtocol(None, self.host)
+
+    def tearDown(self):
+        root.common.engine.speculative_execution = \
+            self.speculative_execution
+        retry = self.host.job_requests_retry
+        if retry is not None and retry.active():
+            retry.cancel()
+
+    def testNotSpeculative(self):
+        root.common.engine.speculative_execution = False
+        self.protocol._retryJobRequestsLater()
+        self.assertIsNone(self.host.job_requests_retry)
+
+    def testSpeculative(self):
+        root.common.engine.speculative_execution = True
+        self.protocol._retryJobRequestsLater()
+        self.assertTrue(self.host.job_requests_retry.active())
+
+
+Slave = namedtuple("Slave", "id")
+
+
+class SynchronousAggregator(server.UpdateAggregator):
+    """Applies the batches when the test fires the returned Deferred-s.
+    """
+    def __init__(self, *args, **kwargs):
+        super(SynchronousAggregator, self).__init__(*args, **kwargs)
+        self.clock = Clock()
+        self.applying = []
+
+    def _apply(self, updates):
+        deferred = Deferred()
+        self.applying.append((updates, deferred))
+        return deferred
+
+
+class TestUpdateAggregator(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = SynchronousAggregator(None, 0.5)
+        self.results = []
+
+    def submit(self, data, slave):
+        deferred = self.aggregator.submit(data, slave)
+        deferred.addCallbacks(self.results.append,
+                              lambda f: self.results.append(f.value))
+        return deferred
+
+    def testWindow(self):
+        aggregator = self.aggregator
+        self.submit([0], Slave("a"))
+        aggregator.clock.advance(0.25)
+        self.submit([1], Slave("b"))
+        self.assertEqual(aggregator.applying, [])
+        aggregator.clock.advance(0.25)
+        self.assertEqual(len(aggregator.applying), 1)
+        updates, deferred = aggregator.applying.pop()
+        self.assertEqual(updates, [([0], Slave("a")), ([1], Slave("b"))])
+        # arrives while the batch is being applied
+        self.submit([2], Slave("c"))
+        aggregator.clock.advance(1)
+        self.assertEqual(aggregator.applying, [])
+        # each update gets its own result
+        deferred.callback([True, False])
+        self.assertEqual(self.results, [True, False])
+        aggregator.clock.advance(0)
+        updates, deferred = aggregator.applying.pop()
+        self.assertEqual(updates, [([2], Slave("c"))])
+        deferred.callback([True])
+        self.assertEqual(self.results, [True, False, True])
+        self.assertEqual((aggregator.batches, aggregator.updates), (2, 3))
+        aggregator.clock.advance(1)
+        self.assertEqual(aggregator.applying, [])
+
+    def testError(self):
+        aggregator = self.aggregator
+        self.submit([0], Slave("a"))
+        self.submit([1], Slave("b"))
+        aggregator.clock.advance(0.5)
+        _, deferred = aggregator.applying.pop()
+        error = ValueError("data must be a list")
+        deferred.errback(error)
+        self.assertEqual(self.results, [error, error])
+        self.submit([2], Slave("c"))
+        aggregator.clock.advance(0.5)
+        self.assertEqual(len(aggregator.applying), 1)
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     unittest.main()
@@ -208,6 +208,28 @@ class TestNormalizers(unittest.TestCase):
         self.assertIsInstance(back, numpy.ndarray)
         self.assertTrue((orig == back).all())
 
+    def test_cached_coefficients(self):
+        for name in "mean_disp", "pointwise", "internal_mean":
+            nclass = NormalizerRegistry.normalizers[name]
+            norm = nclass()
+            arr = numpy.array([[1, 2, 3], [6, 5, 4]], dtype=numpy.float32)
+            norm.analyze(arr)
+            first = arr.copy()
+            norm.normalize(first)
+            again = arr.copy()
+            norm.normalize(again)
+            self.assertTrue((first == again).all(), name)
+            norm.analyze(arr * 3)
+            second = arr.copy()
+            norm.normalize(second)
+            self.assertGreater(numpy.abs(first - second).max(), 0.01, name)
+            state = norm.state
+            norm.reset()
+            norm.state = state
+            third = arr.copy()
+            norm.normalize(third)
+            self.assertTrue((second == third).all(), name)
+
     def test_none(self):
         nclass = NormalizerRegistry.normalizers["none"]
         nn = nclass()
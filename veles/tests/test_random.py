@@ -35,16 +35,20 @@ under the License.
 """
 
 
+import logging
 import numpy
 import os
+import unittest
 
 from veles.accelerated_units import TrivialAcceleratedUnit
 from veles.backends import NumpyDevice
 from veles.config import root
+from veles.dummy import DummyWorkflow
 from veles.memory import Array
 import veles.prng as rnd
 from veles.prng.uniform import Uniform
 from veles.tests import AcceleratedTest
+from veles.timeit2 import timeit
 
 
 class TestRandom1024(AcceleratedTest):
@@ -208,5 +212,61 @@ class TestRandom128(AcceleratedTest):
         self.assertEqual(numpy.count_nonzero(v_gpu - v_cpu), 0)
 
 
+class TestUniformNumpy(unittest.TestCase):
+    def _reference(self, states, n_rounds):
+        """Straightforward xorshift1024* on Python integers.
+        """
+        mask = (1 << 64) - 1
+        n_states = len(states)
+        output = numpy.zeros(n_states * 16 * n_rounds, dtype=numpy.uint64)
+        for i, s in enumerate(states):
+            s = [int(v) for v in s]
+            p = 0
+            for offs in range(i, len(output), n_states):
+                s0 = s[p]
+                p = (p + 1) & 15
+                s1 = s[p]
+                s1 ^= (s1 << 31) & mask
+                s1 ^= s1 >> 11
+                s0 ^= s0 >> 30
+                s[p] = s0 ^ s1
+                output[offs] = (s[p] * 1181783497276652981) & mask
+            states[i] = s
+        return output
+
+    def _uniform(self, states, nbytes):
+        u = Uniform(DummyWorkflow(), num_states=len(states),
+                    output_bytes=nbytes)
+        u.states.mem = states.copy()
+        u.initialize(NumpyDevice())
+        return u
+
+    def test_bit_identical(self):
+        n_states, n_rounds = 5, 3
+        states = rnd.get().randint(
+            0, 0x100000000, n_states * 128 // 4).astype(
+            numpy.uint32).view(numpy.uint64).reshape(n_states, 16)
+        u = self._uniform(states, n_states * 128 * n_rounds)
+        for _ in range(2):
+            reference = self._reference(states, n_rounds)
+            u.run()
+            u.output.map_read()
+            self.assertTrue((u.output.mem.view(numpy.uint64) ==
+                             reference).all())
+            u.states.map_read()
+            self.assertTrue((u.states.mem.view(numpy.uint64).reshape(
+                n_states, 16) == states).all())
+
+    def test_throughput(self):
+        for n_states in 256, 4096:
+            states = rnd.get().randint(
+                0, 0x100000000, n_states * 128 // 4).astype(
+                numpy.uint32).view(numpy.uint64).reshape(n_states, 16)
+            u = self._uniform(states, 1 << 24)
+            _, elapsed = timeit(u.run)
+            logging.info("%d states: %.1f MB/s", n_states,
+                         u.output.nbytes / elapsed / (1 << 20))
+
+
 if __name__ == "__main__":
     AcceleratedTest.main()
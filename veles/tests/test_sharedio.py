@@ -36,7 +36,7 @@ under the License.
 from multiprocessing import Process
 import unittest
 
-from veles.txzmq import SharedIO
+from veles.txzmq import SharedIO, SharedIOChannel
 from veles.pickle2 import pickle
 
 
@@ -77,6 +77,48 @@ class TestSharedIO(unittest.TestCase):
         del other2
         self.assertEqual(other.refs, 1)
 
+
+class TestSharedIOChannel(unittest.TestCase):
+    def testResize(self):
+        channel = SharedIOChannel("veles-test-channel")
+        self.assertIsNone(channel.acquire())
+        channel.commit(100000)
+        first = channel.acquire()
+        self.assertEqual(first.name, "veles-test-channel.1")
+        self.assertGreaterEqual(first.size, 100000)
+        channel.commit(200000, overflow=True)
+        self.assertEqual(channel.acquire().name, "veles-test-channel.2")
+        self.assertGreaterEqual(channel.size, 200000)
+        for _ in range(SharedIOChannel.SHRINK_AFTER - 1):
+            channel.commit(1000)
+        self.assertEqual(channel.acquire().name, "veles-test-channel.2")
+        channel.commit(1000)
+        self.assertEqual(channel.acquire().name, "veles-test-channel.3")
+        self.assertEqual(channel.size, SharedIOChannel.MIN_SIZE)
+        channel.close()
+        self.assertIsNone(channel.acquire())
+
+    def testForget(self):
+        channel = SharedIOChannel("veles-test-forget")
+        channel.commit(1000)
+        channel.io.write(TestSharedIO.DATA)
+        channel.io.seek(0)
+        other = pickle.loads(pickle.dumps(channel.io))
+        self.assertEqual(other.read(len(TestSharedIO.DATA)),
+                         TestSharedIO.DATA)
+
+        def cached():
+            return sorted(key.partition(":")[0] for key in SharedIO.CACHE
+                          if key.startswith("veles-test-forget"))
+
+        self.assertEqual(cached(), ["veles-test-forget.1"])
+        channel.commit(1000000, overflow=True)
+        # unpickling the next generation drops the previous one
+        pickle.loads(pickle.dumps(channel.io))
+        self.assertEqual(cached(), ["veles-test-forget.2"])
+        SharedIO.forget("veles-test-forget")
+        self.assertEqual(cached(), [])
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testReadWrite']
     unittest.main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Unit tests for the snapshotters.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from veles.config import root
+from veles.dummy import DummyLauncher
+from veles.memory import Array
+from veles.pickle2 import best_protocol, pickle
+from veles.snapshotter import SnapshotterToFile
+from veles.units import TrivialUnit
+from veles.workflow import Workflow
+
+
+class ArrayUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(ArrayUnit, self).__init__(workflow, **kwargs)
+        self.weights = Array(numpy.zeros(1 << 16))
+
+
+class TestAsyncSnapshotter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="veles-test-snapshotter-")
+        # the workflow holds a weak reference to its launcher
+        self.launcher = DummyLauncher()
+        self.workflow = Workflow(self.launcher)
+        self.unit = ArrayUnit(self.workflow)
+        self.snapshotter = SnapshotterToFile(
+            self.workflow, prefix="test", directory=self.directory,
+            compression="gz", asynchronous=True, max_in_flight=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load_current(self):
+        link = os.path.join(self.directory, "test_current.%d.pickle.gz" %
+                            best_protocol)
+        self.assertTrue(os.path.islink(link))
+        return SnapshotterToFile.import_(link)
+
+    def test_consistent_copy(self):
+        self.snapshotter.suffix = "first"
+        self.snapshotter.take_snapshot()
+        # the state is captured before take_snapshot() returns
+        self.unit.weights.mem[:] = 1
+        self.snapshotter.wait_snapshots()
+        self.assertEqual(self.snapshotter.in_flight, 0)
+        self.assertTrue(os.path.exists(self.snapshotter.destination))
+        self.assertFalse(os.path.exists(
+            self.snapshotter.destination + ".part"))
+        restored = self.load_current()
+        self.assertEqual(restored["ArrayUnit"].weights.mem.sum(), 0)
+        self.assertGreater(self.snapshotter.saved_time, 0)
+        self.assertGreater(self.snapshotter.stall_time, 0)
+
+    def test_in_flight_limit(self):
+        for index in range(3):
+            self.snapshotter.suffix = str(index)
+            self.unit.weights.mem[:] = index
+            self.snapshotter.take_snapshot()
+            self.assertLessEqual(self.snapshotter.in_flight, 1)
+        self.snapshotter.stop()
+        self.assertEqual(self.snapshotter.in_flight, 0)
+        for index in range(3):
+            self.assertTrue(os.path.exists(os.path.join(
+                self.directory, "test_%d.%d.pickle.gz" %
+                (index, best_protocol))))
+        restored = self.load_current()
+        self.assertEqual(restored["ArrayUnit"].weights.mem[0], 2)
+        metrics = self.snapshotter.get_metric_values()
+        self.assertIn("Snapshot stall", metrics)
+
+    def test_restore_defaults(self):
+        # as if the snapshot was taken before the asynchronous mode
+        del self.snapshotter.asynchronous
+        del self.snapshotter.max_in_flight
+        restored = pickle.loads(pickle.dumps(self.workflow, best_protocol))
+        snapshotter = restored["SnapshotterToFile"]
+        self.assertEqual(snapshotter.asynchronous,
+                         root.common.engine.async_snapshots)
+        self.assertEqual(snapshotter.max_in_flight,
+                         root.common.engine.snapshots_in_flight)
+
+
+class TestSeparateArrays(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="veles-test-snapshotter-")
+        self.launcher = DummyLauncher()
+        self.workflow = Workflow(self.launcher)
+        self.unit = ArrayUnit(self.workflow)
+        self.unit.weights.mem[:] = numpy.arange(1 << 16)
+        self.unit.same = self.unit.weights.mem
+        self.unit.small = numpy.ones(4)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_snapshotter(self, asynchronous):
+        snapshotter = SnapshotterToFile(
+            self.workflow, prefix="test", directory=self.directory,
+            compression="gz", separate_arrays=True,
+            asynchronous=asynchronous)
+        snapshotter.suffix = "arrays"
+        return snapshotter
+
+    def check(self, snapshotter):
+        self.assertTrue(os.path.isdir(snapshotter.destination))
+        self.assertEqual(sorted(os.listdir(snapshotter.destination)),
+                         ["00000.npy", "workflow.%d.pickle.gz" %
+                          best_protocol])
+        restored = SnapshotterToFile.import_(os.path.join(
+            self.directory, "test_current.%d.snapshot" % best_protocol))
+        unit = restored["ArrayUnit"]
+        self.assertIsInstance(unit.weights.mem, numpy.memmap)
+        self.assertIs(unit.same, unit.weights.mem)
+        self.assertTrue((unit.weights.mem == numpy.arange(1 << 16)).all())
+        self.assertTrue((unit.small == 1).all())
+        # copy-on-write mapping
+        unit.weights.mem[:] = -1
+        again = SnapshotterToFile.import_(snapshotter.destination, None)
+        self.assertNotIsInstance(again["ArrayUnit"].weights.mem,
+                                 numpy.memmap)
+        self.assertEqual(again["ArrayUnit"].weights.mem[-1], (1 << 16) - 1)
+
+    def test_export(self):
+        snapshotter = self.create_snapshotter(False)
+        snapshotter.export()
+        self.check(snapshotter)
+
+    def test_restore_defaults(self):
+        snapshotter = self.create_snapshotter(False)
+        del snapshotter.separate_arrays
+        del snapshotter.segment_min_size
+        restored = pickle.loads(pickle.dumps(self.workflow, best_protocol))
+        snapshotter = restored["SnapshotterToFile"]
+        self.assertEqual(snapshotter.separate_arrays,
+                         root.common.engine.snapshot_separate_arrays)
+        self.assertEqual(snapshotter.segment_min_size,
+                         root.common.engine.snapshot_segment_min_size)
+
+    def test_async(self):
+        snapshotter = self.create_snapshotter(True)
+        snapshotter.take_snapshot()
+        self.unit.weights.mem[:] = 0
+        snapshotter.wait_snapshots()
+        self.check(snapshotter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Unit tests for the timeline recording.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from veles.tests import DummyLauncher
+from veles.timeit2 import timeit
+import veles.tracing as tracing
+from veles.units import TrivialUnit
+from veles.workflow import Workflow
+
+
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.launcher = DummyLauncher()
+        self.workflow = Workflow(self.launcher)
+        self.unit = TrivialUnit(self.workflow, name="traced")
+        self.unit.link_from(self.workflow.start_point)
+        self.workflow.end_point.link_from(self.unit)
+        self.workflow.initialize()
+        self.dir = tempfile.mkdtemp(prefix="veles-test-tracing-")
+
+    def tearDown(self):
+        tracing.enabled = False
+        tracing.get().clear()
+        shutil.rmtree(self.dir)
+
+    def test_dump(self):
+        tracing.start("test")
+        self.unit.run()
+
+        def work():
+            self.unit.event("work", "begin", height=0.1)
+            self.unit.run()
+            self.unit.event("work", "end")
+
+        thread = threading.Thread(target=work, name="worker")
+        thread.start()
+        thread.join()
+        file_name = tracing.stop(os.path.join(self.dir, "timeline.json"))
+        self.assertFalse(tracing.enabled)
+        self.assertEqual(len(tracing.get()), 0)
+        with open(file_name, "r") as fin:
+            events = json.load(fin)["traceEvents"]
+        threads = {e["tid"]: e["args"]["name"] for e in events
+                   if e["name"] == "thread_name"}
+        self.assertEqual(
+            [e["args"]["name"] for e in events if e["name"] ==
+             "process_name"], ["test"])
+        spans = [e for e in events if e["ph"] == "X"]
+        self.assertEqual([s["name"] for s in spans], ["traced.run"] * 2)
+        self.assertEqual({threads[s["tid"]] for s in spans},
+                         {threading.current_thread().name, "worker"})
+        self.assertEqual(spans[0]["cat"], "TrivialUnit")
+        marks = [(e["ph"], threads[e["tid"]]) for e in events
+                 if e["name"] == "work"]
+        self.assertEqual(marks, [("B", "worker"), ("E", "worker")])
+
+    def test_ring_buffer(self):
+        timeline = tracing.Timeline(buffer_size=10)
+        for index in range(25):
+            timeline.span("span%d" % index, "test", index, 1)
+        events = [e for e in timeline.events() if e["ph"] == "X"]
+        self.assertEqual([e["name"] for e in events],
+                         ["span%d" % i for i in range(15, 25)])
+
+    def test_overhead(self):
+        count = 100000
+
+        def run():
+            for _ in range(count):
+                self.unit.run()
+
+        _, disabled = timeit(run)
+        tracing.start()
+        _, enabled = timeit(run)
+        tracing.enabled = False
+        logging.info("run() took %.2f us without the timeline and %.2f us "
+                     "with the timeline", disabled * 1000000 / count,
+                     enabled * 1000000 / count)
+        self.assertEqual(len(tracing.get()), tracing.get().buffer_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Unit tests for the lossy update codecs.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import numpy
+import unittest
+
+from veles.config import root
+from veles.pickle2 import pickle
+from veles.prng import get as get_prng
+from veles.tests import DummyLauncher
+from veles.units import TrivialUnit
+from veles.update_codecs import UpdateCodecRegistry, EncodedArray, \
+    decode_update
+from veles.workflow import Workflow
+prng = get_prng()
+
+
+def encoded_size(data):
+    return len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class UpdatingUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(UpdatingUnit, self).__init__(workflow, **kwargs)
+        self.update = None
+        self.applied = None
+
+    def generate_data_for_master(self):
+        return self.update
+
+    def apply_data_from_slave(self, data, slave):
+        self.applied = data
+
+
+class TestUpdateCodecs(unittest.TestCase):
+    def setUp(self):
+        self.grad = prng.normal(0, 0.01, (256, 256)).astype(numpy.float32)
+
+    def codec(self, name, **kwargs):
+        return UpdateCodecRegistry.update_codecs[name](**kwargs)
+
+    def test_fp16(self):
+        update = [self.grad, numpy.arange(10), "bias", None]
+        encoded = pickle.loads(pickle.dumps(self.codec("fp16").encode(
+            update)))
+        self.assertIsInstance(encoded[0], EncodedArray)
+        self.assertIs(encoded[1].__class__, numpy.ndarray)
+        self.assertEqual(encoded[2:], ["bias", None])
+        decoded = decode_update(encoded)
+        self.assertEqual(decoded[0].dtype, numpy.float32)
+        self.assertEqual(decoded[0].shape, self.grad.shape)
+        self.assertTrue(numpy.allclose(decoded[0], self.grad, rtol=1e-3,
+                                       atol=1e-7))
+        self.assertGreater(encoded_size(update) / encoded_size(encoded), 1.9)
+
+    def test_topk(self):
+        codec = self.codec("topk", ratio=0.01)
+        encoded = codec.encode({"weights": self.grad})
+        self.assertGreater(
+            encoded_size(self.grad) / encoded_size(encoded), 30)
+        decoded = decode_update(encoded)["weights"]
+        self.assertEqual(numpy.count_nonzero(decoded),
+                         int(self.grad.size * 0.01))
+        threshold = numpy.min(numpy.abs(decoded[decoded != 0]))
+        self.assertLessEqual(numpy.max(numpy.abs(self.grad[decoded == 0])),
+                             threshold)
+        # error feedback: whatever was not sent goes with the next updates
+        total = decoded.astype(numpy.float64)
+        zero = numpy.zeros_like(self.grad)
+        for _ in range(200):
+            total += decode_update(codec.encode({"weights": zero}))["weights"]
+        self.assertTrue(numpy.allclose(total, self.grad, atol=1e-6))
+
+    def test_int8(self):
+        codec = self.codec("int8")
+        encoded = codec.encode((self.grad,))
+        self.assertGreater(
+            encoded_size(self.grad) / encoded_size(encoded), 3.9)
+        scale = numpy.max(numpy.abs(self.grad)) / 127
+        decoded = decode_update(encoded)[0]
+        self.assertLessEqual(numpy.max(numpy.abs(decoded - self.grad)),
+                             scale * 1.0001)
+        # stochastic rounding is unbiased
+        mean = numpy.mean([decode_update(codec.encode((self.grad,)))[0]
+                           for _ in range(64)], axis=0)
+        self.assertLess(numpy.mean(numpy.abs(mean - self.grad)), scale / 4)
+        zero = decode_update(codec.encode([numpy.zeros(1 << 13)]))[0]
+        self.assertFalse(zero.any())
+
+    def test_workflow(self):
+        # the workflow holds a weak reference to its launcher
+        self.launcher = DummyLauncher()
+        wf = Workflow(self.launcher)
+        lossy = UpdatingUnit(wf)
+        lossy.link_from(wf.start_point)
+        exact = UpdatingUnit(wf, lossy_updates=False)
+        exact.link_from(lossy)
+        wf.end_point.link_from(exact)
+        lossy.update = exact.update = self.grad
+        saved = root.common.engine.update_codec
+        root.common.engine.update_codec = "fp16"
+        try:
+            data = wf.generate_data_for_master()
+        finally:
+            root.common.engine.update_codec = saved
+        units = list(wf.units_in_dependency_order)
+        self.assertIsInstance(data[units.index(lossy)], EncodedArray)
+        self.assertIs(data[units.index(exact)], self.grad)
+        wf.apply_data_from_slave(pickle.loads(pickle.dumps(data)), None)
+        self.assertIsInstance(lossy.applied, numpy.ndarray)
+        self.assertTrue(numpy.allclose(lossy.applied, self.grad, rtol=1e-3,
+                                       atol=1e-7))
+        self.assertTrue((exact.applied == self.grad).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
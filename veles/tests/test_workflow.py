@@ -33,20 +33,88 @@ under the License.
 """
 
 
+from collections import namedtuple
 import gc
+import logging
+import numpy
 import six
+import threading
+import time
 import unittest
 import weakref
 from zope.interface.verify import verifyObject
 from veles.snapshotter import SnapshotterBase
 
+from veles.config import root
 from veles.workflow import Workflow
-from veles.distributable import IDistributable
+from veles.distributable import IDistributable, sum_updates
+from veles.memory import Array
+from veles.mutable import Bool
+from veles.plumbing import Repeater
 from veles.units import TrivialUnit
 from veles.tests import DummyLauncher
 from veles.workflow import StartPoint
 from veles.tests import DummyWorkflow
 from veles.pickle2 import pickle
+from veles.timeit2 import timeit
+
+
+Slave = namedtuple("Slave", ("id",))
+
+
+class AccumulatingUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(AccumulatingUnit, self).__init__(
+            workflow, apply_data_from_slave_threadsafe=True, **kwargs)
+        self.weights = numpy.zeros(1 << 16)
+        self.norm = 0
+        self.applied = []
+
+    def apply_data_from_slave(self, data, slave):
+        self.weights += data
+        # some work which does not depend on the number of updates
+        self.norm = numpy.linalg.norm(numpy.sort(self.weights))
+        self.applied.append(slave)
+
+
+class CommutingUnit(AccumulatingUnit):
+    updates_commute = True
+
+
+class CountingUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(CountingUnit, self).__init__(workflow, **kwargs)
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+
+
+class LoopCounter(CountingUnit):
+    def __init__(self, workflow, **kwargs):
+        super(LoopCounter, self).__init__(workflow, **kwargs)
+        self.iterations = kwargs["iterations"]
+        self.complete = Bool(False)
+
+    def run(self):
+        super(LoopCounter, self).run()
+        self.complete <<= self.runs >= self.iterations
+
+
+class SlowInitUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(SlowInitUnit, self).__init__(workflow, **kwargs)
+        self.partially = kwargs.get("partially", False)
+        self.output = []
+        self.spans = []
+
+    def initialize(self, **kwargs):
+        start = time.time()
+        time.sleep(0.1)
+        self.output.append(self.name)
+        self.spans.append((start, time.time(), threading.current_thread()))
+        partially, self.partially = self.partially, False
+        return partially
 
 
 class Test(unittest.TestCase):
@@ -307,6 +375,237 @@ class Test(unittest.TestCase):
         self.assertTrue(w2.start_point.restored_from_snapshot)
 
 
+class TestUpdateAggregation(unittest.TestCase):
+    def setUp(self):
+        # the workflow holds a weak reference to its launcher
+        self.launcher = DummyLauncher()
+        self.workflow = Workflow(self.launcher)
+        self.commuting = CommutingUnit(self.workflow)
+        self.commuting.link_from(self.workflow.start_point)
+        self.ordered = AccumulatingUnit(self.workflow)
+        self.ordered.link_from(self.commuting)
+        self.workflow.end_point.link_from(self.ordered)
+        self.units = list(self.workflow.units_in_dependency_order)
+
+    def make_update(self, value, ordered=True):
+        data = [None] * len(self.units)
+        data[self.units.index(self.commuting)] = \
+            numpy.full_like(self.commuting.weights, value)
+        if ordered:
+            data[self.units.index(self.ordered)] = \
+                numpy.full_like(self.ordered.weights, value)
+        return data
+
+    def test_sum_updates(self):
+        a = numpy.ones(4)
+        merged = sum_updates([
+            [a, {"n": 1, "name": "x"}, None],
+            None,
+            [a * 2, {"n": 2, "name": "x"}, (1, 2)]])
+        self.assertTrue((merged[0] == 3).all())
+        self.assertTrue((a == 1).all())
+        self.assertEqual(merged[1:], [{"n": 3, "name": "x"}, (1, 2)])
+        self.assertRaises(ValueError, sum_updates, ["x", "y"])
+
+    def test_apply_data_from_slaves(self):
+        slaves = [Slave("slave%d" % i) for i in range(3)]
+        self.workflow.apply_data_from_slaves(
+            [(self.make_update(i + 1), s) for i, s in enumerate(slaves)])
+        self.assertTrue((self.commuting.weights == 6).all())
+        self.assertTrue((self.ordered.weights == 6).all())
+        self.assertEqual(self.commuting.applied, [None])
+        self.assertEqual(self.ordered.applied, slaves)
+        self.assertRaises(ValueError, self.workflow.apply_data_from_slaves,
+                          [(b'', Slave("slave"))])
+
+    def test_duplicate_updates(self):
+        self.ordered.drops_update_from = lambda slave: slave.id == "dup"
+        self.assertFalse(self.workflow.apply_data_from_slave(
+            self.make_update(1), Slave("dup")))
+        self.assertEqual(self.commuting.applied, [])
+        self.assertEqual(self.workflow.apply_data_from_slaves(
+            [(self.make_update(1), Slave("dup")),
+             (self.make_update(2), Slave("slave"))]), [False, True])
+        self.assertTrue((self.commuting.weights == 2).all())
+        self.assertEqual(self.ordered.applied, [Slave("slave")])
+
+    def test_benchmark(self):
+        for slaves in (1, 8, 32, 128):
+            updates = [(self.make_update(1, False), Slave(str(i)))
+                       for i in range(slaves)]
+
+            def one_by_one():
+                for data, slave in updates:
+                    self.workflow.apply_data_from_slave(data, slave)
+
+            _, separate = timeit(one_by_one)
+            _, batched = timeit(self.workflow.apply_data_from_slaves,
+                                updates)
+            logging.info("%d slaves: %.0f updates/s one by one, %.0f "
+                         "updates/s in a batch", slaves, slaves / separate,
+                         slaves / batched)
+        self.assertTrue((self.commuting.weights == 2 * (1 + 8 + 32 + 128))
+                        .all())
+
+
+class TestCompiledPlan(unittest.TestCase):
+    UNITS = 100
+    FAN_OUT = 4
+
+    def create_workflow(self, iterations):
+        """Creates the loop of UNITS units, each 10th of which fans out to
+        FAN_OUT parallel units.
+        """
+        workflow = Workflow(self.launcher)
+        repeater = Repeater(workflow)
+        repeater.link_from(workflow.start_point)
+        prev = [repeater]
+        units = []
+        while len(units) < self.UNITS:
+            width = self.FAN_OUT if len(units) % 10 == 9 else 1
+            layer = [CountingUnit(workflow, name="unit%d" % (len(units) + i))
+                     for i in range(width)]
+            for unit in layer:
+                unit.link_from(*prev)
+            units.extend(layer)
+            prev = layer
+        counter = LoopCounter(workflow, iterations=iterations)
+        counter.link_from(*prev)
+        repeater.link_from(counter)
+        workflow.end_point.link_from(counter)
+        workflow.end_point.gate_block = ~counter.complete
+        repeater.gate_block = counter.complete
+        return workflow, units, counter
+
+    def setUp(self):
+        self.launcher = DummyLauncher()
+
+    def run_workflow(self, compiled, iterations):
+        workflow, units, counter = self.create_workflow(iterations)
+        workflow.initialize()
+        if compiled:
+            workflow.compile_plan()
+        _, elapsed = timeit(workflow.run)
+        self.assertEqual(counter.runs, iterations)
+        for unit in units:
+            self.assertEqual(unit.runs, iterations)
+        return workflow, elapsed
+
+    def test_same_runs(self):
+        workflow, _ = self.run_workflow(True, 10)
+        for unit in workflow:
+            self.assertIsNotNone(unit.plan)
+
+    def test_discard(self):
+        workflow, units, counter = self.create_workflow(1)
+        workflow.compile_plan()
+        fan_in = units[-1]
+        self.assertEqual(len(counter.plan.predecessors), self.FAN_OUT)
+        fan_in.unlink_after()
+        self.assertIsNone(counter.plan)
+        for unit in units[-self.FAN_OUT:]:
+            self.assertIsNone(unit.plan)
+        self.assertIsNotNone(units[0].plan)
+
+    def test_relink(self):
+        workflow, units, counter = self.create_workflow(3)
+        workflow.initialize()
+        workflow.compile_plan()
+        fan_out = units[9]
+        fan_in = units[9 + self.FAN_OUT]
+        self.assertEqual(len(fan_in.plan.predecessors), self.FAN_OUT)
+        extra = CountingUnit(workflow, name="extra")
+        extra.link_from(units[8])
+        fan_out.link_from(extra)
+        extra.initialize()
+        self.assertIsNone(fan_out.plan)
+        self.assertIsNone(fan_in.plan)
+        self.assertIsNotNone(units[0].plan)
+        workflow.run()
+        self.assertEqual(counter.runs, 3)
+        self.assertEqual(extra.runs, 3)
+        for unit in units:
+            self.assertEqual(unit.runs, 3)
+
+    def test_snapshot_keeps_gates(self):
+        workflow, units, counter = self.create_workflow(1)
+        workflow.compile_plan()
+        src = units[-1]
+        counter.plan.activate(counter.plan.predecessors.index(src))
+        state = counter.__getstate__()
+        self.assertTrue(state["_links_from"][src])
+
+    def test_benchmark(self):
+        iterations = 200
+        _, dynamic = self.run_workflow(False, iterations)
+        _, compiled = self.run_workflow(True, iterations)
+        logging.info("%d units: %.0f iterations/s dynamic, %.0f iterations/s"
+                     " compiled", self.UNITS, iterations / dynamic,
+                     iterations / compiled)
+
+
+class TestConcurrentInitialize(unittest.TestCase):
+    WIDTH = 6
+
+    def setUp(self):
+        self.launcher = DummyLauncher()
+        self.workflow = workflow = Workflow(self.launcher)
+        self.parallel = [SlowInitUnit(workflow, name="unit%d" % i)
+                         for i in range(self.WIDTH)]
+        for unit in self.parallel:
+            unit.link_from(workflow.start_point)
+        self.producer = SlowInitUnit(workflow, name="producer")
+        self.consumer = SlowInitUnit(workflow, name="user",
+                                     partially=True)
+        self.consumer.link_attrs(self.producer, ("input", "output"))
+        self.producer.link_from(workflow.start_point)
+        self.consumer.link_from(workflow.start_point)
+        self.last = SlowInitUnit(workflow, name="last")
+        self.last.link_from(self.consumer, *self.parallel)
+        workflow.end_point.link_from(self.last, self.producer)
+        self.concurrent_initialize = root.common.engine.concurrent_initialize
+
+    def tearDown(self):
+        root.common.engine.concurrent_initialize = self.concurrent_initialize
+
+    def test_dependencies(self):
+        workflow = self.workflow
+        graph = workflow.initialization_dependencies(
+            list(workflow.units_in_dependency_order))
+        self.assertEqual(graph[self.consumer],
+                         {workflow.start_point, self.producer})
+        self.assertEqual(graph[self.last], {self.consumer} | set(
+            self.parallel))
+
+    def test_shared_arrays(self):
+        workflow = self.workflow
+        order = list(workflow.units_in_dependency_order)
+        first, second = sorted(self.parallel[:2], key=order.index)
+        first.output = second.input = Array()
+        graph = workflow.initialization_dependencies(order)
+        self.assertIn(first, graph[second])
+        self.assertNotIn(first, graph[self.parallel[2]])
+
+    def test_initialize(self):
+        root.common.engine.concurrent_initialize = True
+        _, elapsed = timeit(self.workflow.initialize)
+        for unit in self.workflow:
+            self.assertTrue(unit.is_initialized)
+        self.assertLess(elapsed, 0.1 * (len(self.parallel) + 4))
+        self.assertGreater(len({unit.spans[0][2] for unit in self.parallel}),
+                           1)
+        # the data link is respected
+        self.assertEqual(self.consumer.input, ["producer"])
+        self.assertGreaterEqual(self.consumer.spans[0][0],
+                                self.producer.spans[0][1])
+        # the partial initialization does not hold the dependents back
+        self.assertEqual(len(self.consumer.spans), 2)
+        self.assertLess(self.last.spans[0][0], self.consumer.spans[1][0])
+        stats = dict(self.workflow.get_unit_initialize_time_stats(True))
+        self.assertGreater(stats["user"], 0.2)
+        self.assertGreater(stats["unit0"], 0.1)
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testItarator']
     unittest.main()
@@ -54,6 +54,7 @@ from veles.external import manhole
 import veles.logger as logger
 from veles.cmdline import CommandLineArgumentsRegistry, classproperty
 from veles.compat import from_none, is_interactive
+import veles.tracing as tracing
 
 
 def errback(failure, thread_pool=None):
@@ -83,6 +84,11 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
     interrupted = False
     _manhole = None
     sigint_printed = False
+    # Toggles the timeline recording (kill -s RTMIN+1 <pid>); both SIGUSR-s
+    # are already taken
+    TIMELINE_SIGNAL = getattr(signal, "SIGRTMIN", None)
+    if TIMELINE_SIGNAL is not None:
+        TIMELINE_SIGNAL += 1
 
     def __init__(self, minthreads=2, maxthreads=1024, queue_size=2048,
                  name=None, workflow=None):
@@ -125,6 +131,9 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
             if not ThreadPool.manhole:
                 signal.signal(signal.SIGUSR1, self.sigusr1_handler)
                 signal.signal(signal.SIGUSR2, self.sigusr2_handler)
+                if ThreadPool.TIMELINE_SIGNAL is not None:
+                    signal.signal(ThreadPool.TIMELINE_SIGNAL,
+                                  self.timeline_signal_handler)
         ThreadPool.pools.append(self)
 
     def __del__(self):
@@ -530,6 +539,20 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
             self.warning("SIGUSR2 was received, unable to install the manhole "
                          "because no workflow's been registered")
 
+    def timeline_signal_handler(self, sign, frame):
+        """
+        Private method - handler for TIMELINE_SIGNAL. The interrupted thread
+        may hold the timeline locks, so the handler only schedules the toggle.
+        """
+        reactor.callFromThread(self._toggle_timeline)
+
+    def _toggle_timeline(self):
+        self.warning("%s was received, %s the timeline recording",
+                     "SIGRTMIN+1", "stopping" if tracing.enabled else
+                     "starting")
+        # writing the timeline takes a while
+        reactor.callInThread(tracing.toggle)
+
     @staticmethod
     def print_thread_stacks():
         if not hasattr(sys, "_current_frames"):
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Timeline of the unit calls and events in the Chrome trace format.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import deque
+import json
+import logging
+import os
+import threading
+import time
+
+from veles.config import root
+
+# Checked before each span is recorded, so that the disabled timeline costs
+# a single global lookup
+enabled = False
+
+
+class Timeline(object):
+    """Records the spans of the unit methods and the events of
+    :meth:`veles.logger.Logger.event` into the ring buffers of each thread and
+    writes them in the Chrome trace event format, which is opened by
+    chrome://tracing and https://ui.perfetto.dev. The timestamps are taken
+    from time.time(), so the timelines of the master and the slaves may be
+    merged (see :func:`merge`).
+    """
+    PHASES = {"begin": "B", "end": "E", "single": "i"}
+
+    def __init__(self, buffer_size=None, process_name="veles"):
+        self.buffer_size = \
+            buffer_size or root.common.trace.timeline_buffer_size
+        self.process_name = process_name
+        self._local = threading.local()
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, category, start, duration):
+        """Records the call which took duration seconds since start.
+        """
+        self._buffer().append(("X", name, category, start, duration, None))
+
+    def event(self, etype, name, category, args):
+        """Records a "begin", "end" or "single" event.
+        """
+        self._buffer().append((self.PHASES[etype], name, category,
+                               time.time(), None, args))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(b[1]) for b in self._buffers.values())
+
+    def clear(self):
+        with self._lock:
+            for _, buffer in self._buffers.values():
+                buffer.clear()
+
+    def events(self):
+        """
+        :return: The list of the recorded events in the Chrome trace format.
+        """
+        pid = os.getpid()
+        result = [{"ph": "M", "name": "process_name", "pid": pid,
+                   "args": {"name": self.process_name}}]
+        with self._lock:
+            buffers = [(tid, name, list(buffer))
+                       for tid, (name, buffer) in self._buffers.items()]
+        for tid, thread_name, records in buffers:
+            result.append({"ph": "M", "name": "thread_name", "pid": pid,
+                           "tid": tid, "args": {"name": thread_name}})
+            for phase, name, category, start, duration, args in records:
+                event = {"ph": phase, "name": name, "cat": category,
+                         "pid": pid, "tid": tid, "ts": start * 1000000}
+                if duration is not None:
+                    event["dur"] = duration * 1000000
+                if phase == "i":
+                    event["s"] = "t"
+                if args:
+                    event["args"] = args
+                result.append(event)
+        return result
+
+    def dump(self, file_name):
+        """Writes the recorded events to file_name as JSON.
+
+        :return: The number of the written events.
+        """
+        events = self.events()
+        with open(file_name, "w") as fout:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fout,
+                      default=repr)
+        return len(events)
+
+    def _buffer(self):
+        try:
+            return self._local.buffer
+        except AttributeError:
+            thread = threading.current_thread()
+            buffer = self._local.buffer = deque(maxlen=self.buffer_size)
+            with self._lock:
+                self._buffers[thread.ident] = thread.name, buffer
+            return buffer
+
+
+__timeline__ = None
+__timeline_lock__ = threading.Lock()
+__toggle_lock__ = threading.Lock()
+
+
+def get():
+    """
+    :return: The timeline of this process.
+    """
+    global __timeline__
+    with __timeline_lock__:
+        if __timeline__ is None:
+            __timeline__ = Timeline()
+        return __timeline__
+
+
+def start(process_name=None):
+    """Starts recording the timeline.
+    """
+    global enabled
+    timeline = get()
+    if process_name is not None:
+        timeline.process_name = process_name
+    enabled = True
+    logging.getLogger("Timeline").info("Started recording the timeline")
+
+
+def stop(file_name=None):
+    """Stops recording the timeline and writes it to file_name
+    (root.common.trace.timeline_file by default).
+
+    :return: The name of the written file.
+    """
+    global enabled
+    enabled = False
+    if file_name is None:
+        file_name = root.common.trace.timeline_file % os.getpid()
+    timeline = get()
+    count = timeline.dump(file_name)
+    timeline.clear()
+    logging.getLogger("Timeline").info(
+        "Wrote %d timeline events to %s", count, file_name)
+    return file_name
+
+
+def toggle():
+    """Starts recording the timeline if it is stopped; otherwise, stops and
+    writes it.
+    """
+    with __toggle_lock__:
+        if enabled:
+            stop()
+        else:
+            start()
+
+
+def merge(file_names, output):
+    """Merges the timelines of several processes into one file.
+    """
+    events = []
+    for file_name in file_names:
+        with open(file_name, "r") as fin:
+            events.extend(json.load(fin)["traceEvents"])
+    with open(output, "w") as fout:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fout)
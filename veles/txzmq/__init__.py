@@ -38,4 +38,5 @@ under the License.
 
 
 from veles.txzmq.connection import ZmqConnection, ZmqEndpoint
-from veles.txzmq.sharedio import SharedIO
+from veles.txzmq.sharedio import SharedIO, SharedIOChannel
+from veles.txzmq.compression import AdaptiveCompression
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Online selection of the pickles compression for each network link.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from __future__ import division
+import time
+
+from twisted.internet import threads
+
+from veles.logger import Logger
+from veles.pickle2 import pickle, best_protocol
+from veles.timeit2 import timeit
+from veles.txzmq.connection import ZmqConnection
+
+
+class SampleFile(object):
+    """Collects the first "size" bytes written to it and then interrupts the
+    writer with :class:`SampleFile.Full`, so that the rest of the object is
+    not pickled in vain.
+    """
+
+    class Full(Exception):
+        pass
+
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray()
+
+    def write(self, data):
+        data = memoryview(data)
+        if data.ndim != 1 or data.itemsize != 1:
+            data = data.cast("B")
+        self.data += data[:self.size - len(self.data)]
+        if len(self.data) >= self.size:
+            raise SampleFile.Full()
+
+
+class AdaptiveCompression(Logger):
+    """
+    Chooses the pickles compression of a single link. The compression ratio
+    and the encoding/decoding speed of each codec are estimated by
+    compressing a sample of the outgoing pickles every PROBE_INTERVAL
+    seconds. The link bandwidth is estimated from the time ZeroMQ takes to
+    write big messages. The chosen codec minimizes the expected time per
+    pickled byte; encoding overlaps with the transfer, decoding does not.
+
+    Pass an instance as "pickles_compression" to
+    :meth:`veles.txzmq.connection.ZmqConnection.send`.
+    """
+
+    CODECS = (None, "snappy", "gzip", "xz")
+    PROBE_INTERVAL = 60
+    PROBE_SIZE = 1 << 18
+    MIN_PROBE_SIZE = 1 << 12
+    MIN_MEASURED_SIZE = 1 << 20
+    SMOOTHING = 0.3
+
+    def __init__(self, initial=None, **kwargs):
+        super(AdaptiveCompression, self).__init__(**kwargs)
+        self.codec = initial
+        self.bandwidth = None
+        self.ratios = {}
+        self.speeds = {}
+        self.raw_size = 0
+        self.size = 0
+        self._last_probe_time = 0
+        self._measuring = False
+
+    def __repr__(self):
+        return "%s(codec=%s, ratio=%.2f, bandwidth=%s)" % (
+            self.__class__.__name__, self.codec, self.ratio, self.bandwidth)
+
+    @property
+    def ratio(self):
+        """The achieved compression ratio (sent size / pickled size).
+        """
+        return self.size / self.raw_size if self.raw_size > 0 else 1.0
+
+    def choose(self, message):
+        if time.time() - self._last_probe_time >= \
+                AdaptiveCompression.PROBE_INTERVAL:
+            self.probe(message)
+        if self.bandwidth is not None and self.ratios:
+            codec = min(self.ratios, key=self.cost)
+            if codec != self.codec:
+                self.debug("Switched compression %s -> %s", self.codec, codec)
+                self.codec = codec
+        return self.codec
+
+    def cost(self, codec):
+        """Estimates the time in seconds to transfer a single pickled byte.
+        """
+        encode, decode = self.speeds[codec]
+        return max(self.ratios[codec] / self.bandwidth, 1 / encode) + \
+            1 / decode
+
+    def probe(self, message):
+        self._last_probe_time = time.time()
+        sample = SampleFile(AdaptiveCompression.PROBE_SIZE)
+        try:
+            pickle.dump(message, sample, protocol=best_protocol)
+        except SampleFile.Full:
+            pass
+        sample = bytes(sample.data)
+        if len(sample) < AdaptiveCompression.MIN_PROBE_SIZE:
+            return
+        self.ratios[None] = 1.0
+        self.speeds[None] = (float("inf"), float("inf"))
+        for codec in AdaptiveCompression.CODECS[1:]:
+            code = ZmqConnection.CODECS[codec][0]
+            compressed, encode_time = timeit(
+                ZmqConnection.compress, code, sample)
+            _, decode_time = timeit(ZmqConnection.decompress, code, compressed)
+            self.ratios[codec] = len(compressed) / len(sample)
+            self.speeds[codec] = (len(sample) / max(encode_time, 1e-9),
+                                  len(sample) / max(decode_time, 1e-9))
+        self.debug("Probed the compression: %s", {
+            codec: "%.2f" % ratio for codec, ratio in self.ratios.items()})
+
+    def sent(self, raw_size, size, start_time, tracker):
+        """Accounts the message which was sent with the current codec.
+        """
+        self.raw_size += raw_size
+        self.size += size
+        if size < AdaptiveCompression.MIN_MEASURED_SIZE or tracker is None or \
+                self._measuring:
+            return
+        self._measuring = True
+        codec = self.codec
+        threads.deferToThread(tracker.wait).addBoth(
+            lambda _: self._measured(
+                codec, raw_size, size, time.time() - start_time))
+
+    def _measured(self, codec, raw_size, size, elapsed):
+        self._measuring = False
+        sample = size / max(elapsed, 1e-9)
+        encode_speed = self.speeds.get(codec, (float("inf"),))[0]
+        if elapsed <= 1.2 * raw_size / encode_speed:
+            # encoding was the bottleneck, the link is at least that fast
+            self.bandwidth = max(self.bandwidth or 0, sample)
+        elif self.bandwidth is None:
+            self.bandwidth = sample
+        else:
+            self.bandwidth += AdaptiveCompression.SMOOTHING * (
+                sample - self.bandwidth)
@@ -44,6 +44,7 @@ import os
 import time
 from tempfile import mkstemp
 
+import numpy
 import six
 from six.moves import cPickle as pickle
 import snappy
@@ -124,7 +125,14 @@ class ZmqConnection(Logger):
     """
 
     class IOOverflow(Exception):
-        pass
+        """The pickles did not fit into the shared memory and were sent
+        through the socket.
+        """
+        @property
+        def size(self):
+            """The size of the pickles which were sent.
+            """
+            return self.args[0] if self.args else 0
 
     socketType = None
     allowLoopbackMulticast = False
@@ -138,7 +146,10 @@ class ZmqConnection(Logger):
     tcpKeepaliveInterval = 0
 
     PICKLE_START = b'vpb'
+    PICKLE_OOB_START = b'vpo'
     PICKLE_END = b'vpe'
+    # Arrays smaller than this are pickled inline in the out-of-band mode
+    OOB_MIN_SIZE = 1 << 16
     CODECS = {None: b'\x00', "": b'\x00', "gzip": b'\x01', "snappy": b'\x02',
               "xz": b'\x03'}
 
@@ -162,6 +173,8 @@ class ZmqConnection(Logger):
         self.read_scheduled = None
         self.shutted_down = False
         self.pickles_compression = "snappy"
+        self.pickles_out_of_band = False
+        self._adaptive_compression = None
         self._last_read_time = 0.0
 
         self.fd = self.socket.get(constants.FD)
@@ -233,10 +246,21 @@ class ZmqConnection(Logger):
 
     @pickles_compression.setter
     def pickles_compression(self, value):
-        if value not in (None, "", "gzip", "snappy", "xz"):
+        if value not in ZmqConnection.CODECS and value != "adaptive":
             raise ValueError()
         self._pickles_compression = value
 
+    @property
+    def adaptive_compression(self):
+        """The codec selector which "adaptive" pickles_compression uses.
+        """
+        if self._adaptive_compression is None:
+            # compression imports this module (R0401)
+            from veles.txzmq.compression import AdaptiveCompression
+            self._adaptive_compression = AdaptiveCompression(
+                logger=self.logger)
+        return self._adaptive_compression
+
     def connectionLost(self, reason):
         """
         Called when the connection was lost.
@@ -258,9 +282,21 @@ class ZmqConnection(Logger):
         or raising exception (in case of no more messages available).
         """
         while True:
-            part = self.socket.recv(constants.NOBLOCK)
-            if part.startswith(ZmqConnection.PICKLE_START):
+            if unpickler.expects_buffers:
+                # keep the array frames as they are, without copying
+                part = self.socket.recv(constants.NOBLOCK, copy=False)
+                if len(part) != len(ZmqConnection.PICKLE_END) or \
+                        part.bytes != ZmqConnection.PICKLE_END:
+                    unpickler.consume(part)
+                    continue
+                part = part.bytes
+            else:
+                part = self.socket.recv(constants.NOBLOCK)
+            if part.startswith(ZmqConnection.PICKLE_START) or \
+                    part.startswith(ZmqConnection.PICKLE_OOB_START):
                 self.messageHeaderReceived(self.recv_parts)
+                unpickler.out_of_band = part.startswith(
+                    ZmqConnection.PICKLE_OOB_START)
                 unpickler.active = True
                 unpickler.codec = part[len(ZmqConnection.PICKLE_START)]
                 continue
@@ -285,6 +321,7 @@ class ZmqConnection(Logger):
             self._data = []
             self._active = False
             self._decompressor = None
+            self.out_of_band = False
 
         @property
         def active(self):
@@ -294,10 +331,21 @@ class ZmqConnection(Logger):
         def active(self, value):
             self._active = value
             if not value:
-                buffer = self.merge_chunks()
-                self._object = pickle.loads(buffer if six.PY3 else str(buffer))
+                if self.out_of_band:
+                    self._object = self.load_out_of_band()
+                else:
+                    buffer = self.merge_chunks()
+                    self._object = pickle.loads(
+                        buffer if six.PY3 else str(buffer))
             self._data = []
 
+        @property
+        def expects_buffers(self):
+            """The header of an out-of-band pickle has been received, so the
+            next frames are the raw array buffers.
+            """
+            return self.active and self.out_of_band and len(self._data) > 0
+
         @property
         def codec(self):
             return self._codec
@@ -335,10 +383,39 @@ class ZmqConnection(Logger):
             return buffer
 
         def consume(self, data):
+            if self.out_of_band:
+                # the header and each buffer are compressed separately
+                self._data.append(data)
+                return
             if self.codec > 0:
                 data = self._decompressor.decompress(data)
             self._data.append(data)
 
+        def load_out_of_band(self):
+            """Rebuilds the object from the pickled header and the array
+            frames. Uncompressed arrays are views of the received ZeroMQ
+            frames; the decompressed ones are written to bytearray-s, so that
+            all of them are writable like the arrays pickled in-band.
+            """
+            header = self._data[0]
+            buffers = self._data[1:]
+            if self.codec > 0:
+                header = ZmqConnection.decompress(self.codec, header)
+            unpickler = pickle.Unpickler(six.BytesIO(header))
+
+            def persistent_load(pid):
+                index, dtype, shape = pid
+                data = buffers[index]
+                if self.codec > 0:
+                    data = bytearray(
+                        ZmqConnection.decompress(self.codec, data))
+                else:
+                    data = data.buffer
+                return numpy.frombuffer(data, dtype).reshape(shape)
+
+            unpickler.persistent_load = persistent_load
+            return unpickler.load()
+
     def doRead(self):
         """
         Some data is available for reading on ZeroMQ descriptor.
@@ -407,10 +484,22 @@ class ZmqConnection(Logger):
         an instance of bytes, it will be sent as-is, otherwise, it will be\
         pickled and optionally compressed. Object must not be a string.
         :param pickles_compression: the compression to apply to pickled\
-        objects. Supported values are None or "", "gzip", "snappy" and "xz".
+        objects. Supported values are None or "", "gzip", "snappy", "xz" and\
+        "adaptive" (the connection's :attr:`adaptive_compression` chooses).
         :type pickles_compression: str
         :param io: a SharedIO object where to put pickles into instead of the\
         socket. Can be None.
+        :param out_of_band: send big contiguous numpy arrays as separate\
+        frames instead of pickling them (ignored if io is used). Each frame\
+        owns a copy of its array, so the arrays may be changed as soon as\
+        the call returns.
+        :type out_of_band: bool
+
+        pickles_compression may also be an object with choose(message) and\
+        sent(raw_size, size, start_time, tracker) methods, such as\
+        :class:`veles.txzmq.compression.AdaptiveCompression`. It picks the\
+        codec for the pickles and is notified about the sent sizes; the\
+        tracker reports when ZeroMQ has written the whole message.
         """
         if self.shutted_down:
             return
@@ -418,27 +507,51 @@ class ZmqConnection(Logger):
         pickles_size = 0
         io = kwargs.get("io")
         io_overflow = False
+        out_of_band = kwargs.get("out_of_band", False)
+        selector = None
+        if pickles_compression == "adaptive":
+            pickles_compression = self.adaptive_compression
+        if not isinstance(pickles_compression, (six.string_types,
+                                                type(None))):
+            selector = pickles_compression
+            pickles_compression = None
+            stats = {"raw": 0, "tracker": None, "start": time.time()}
+        else:
+            stats = None
 
         def send_part(msg, last):
             flag = constants.SNDMORE if not last else 0
             if isinstance(msg, bytes):
-                self.socket.send(msg, constants.NOBLOCK | flag)
+                if stats is not None and last:
+                    stats["tracker"] = self.socket.send(
+                        msg, constants.NOBLOCK | flag, copy=False,
+                        track=True)
+                else:
+                    self.socket.send(msg, constants.NOBLOCK | flag)
                 return 0
             if isinstance(msg, str):
                 raise ValueError("All strings must be encoded into bytes")
-            return self._send_pickled(msg, last, pickles_compression,
-                                      io if not io_overflow else None)
+            compression = pickles_compression
+            if selector is not None:
+                compression = selector.choose(msg)
+            return self._send_pickled(msg, last, compression,
+                                      io if not io_overflow else None,
+                                      out_of_band, stats)
 
         for i, m in enumerate(message):
             try:
                 pickles_size += send_part(m, i == len(message) - 1)
-            except ZmqConnection.IOOverflow:
+            except ZmqConnection.IOOverflow as e:
+                pickles_size += e.size
                 io_overflow = True
 
+        if selector is not None:
+            selector.sent(stats["raw"], pickles_size, stats["start"],
+                          stats["tracker"])
         if self.read_scheduled is None:
             self.read_scheduled = reactor.callLater(0, self.doRead)
         if io_overflow:
-            raise ZmqConnection.IOOverflow()
+            raise ZmqConnection.IOOverflow(pickles_size)
         return pickles_size
 
     class SocketFile(object):
@@ -484,6 +597,7 @@ class ZmqConnection(Logger):
         def __init__(self, socket, codec):
             self._codec = codec if six.PY3 else ord(codec)
             self._socketobj = ZmqConnection.SocketFile(socket)
+            self._raw_size = 0
             if self.codec == 0:
                 self._compressor = self._socketobj
             elif self.codec == 1:
@@ -501,6 +615,10 @@ class ZmqConnection(Logger):
         def size(self):
             return self._socketobj.size
 
+        @property
+        def raw_size(self):
+            return self._raw_size
+
         @property
         def codec(self):
             return self._codec
@@ -510,12 +628,98 @@ class ZmqConnection(Logger):
             return "wb"
 
         def write(self, data):
+            self._raw_size += len(data)
             self._compressor.write(data)
 
         def flush(self):
-            self._compressor.flush()
+            if isinstance(self._compressor, gzip.GzipFile):
+                # writes the trailer before the end marker, not on collection
+                self._compressor.close()
+            else:
+                self._compressor.flush()
 
-    def _send_pickled(self, message, last, compression, io):
+    class OutOfBandPickler(pickle.Pickler):
+        """Replaces big C-contiguous numpy arrays with persistent ids and
+        collects them to be sent as separate frames.
+        """
+        def __init__(self, file, protocol):
+            super(ZmqConnection.OutOfBandPickler, self).__init__(
+                file, protocol)
+            self.buffers = []
+
+        def persistent_id(self, obj):
+            if type(obj) not in (numpy.ndarray, numpy.memmap) or \
+                    obj.nbytes < ZmqConnection.OOB_MIN_SIZE or \
+                    obj.dtype.hasobject or obj.dtype.fields is not None or \
+                    not obj.flags.c_contiguous:
+                return None
+            self.buffers.append(obj)
+            return len(self.buffers) - 1, obj.dtype.str, obj.shape
+
+    @staticmethod
+    def compress(codec, data):
+        if codec == 1:
+            # the same level as gzip.GzipFile uses
+            compressor = zlib.compressobj(
+                9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return compressor.compress(data) + compressor.flush()
+        if codec == 2:
+            return snappy.compress(data)
+        if codec == 3:
+            return lzma.compress(data, lzma.FORMAT_XZ)
+        raise ValueError("Unknown compression type")
+
+    @staticmethod
+    def decompress(codec, data):
+        if not isinstance(data, bytes):
+            data = data.buffer
+        if codec == 1:
+            return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        if codec == 2:
+            return snappy.uncompress(data)
+        if codec == 3:
+            return lzma.decompress(data)
+        raise ValueError("Unknown compression type")
+
+    def _send_end_marker(self, last, stats):
+        flags = constants.NOBLOCK | (constants.SNDMORE if not last else 0)
+        if stats is None or not last:
+            self.socket.send(ZmqConnection.PICKLE_END, flags)
+            return
+        stats["tracker"] = self.socket.send(
+            ZmqConnection.PICKLE_END, flags, copy=False, track=True)
+
+    def _send_out_of_band(self, message, last, codec, stats):
+        header = six.BytesIO()
+        pickler = ZmqConnection.OutOfBandPickler(header, best_protocol)
+        pickler.dump(message)
+        header = header.getvalue()
+        if stats is not None:
+            stats["raw"] += len(header) + sum(
+                arr.nbytes for arr in pickler.buffers)
+        codec = codec[0] if six.PY3 else ord(codec)
+        if codec > 0:
+            header = ZmqConnection.compress(codec, header)
+        self.socket.send(ZmqConnection.PICKLE_OOB_START + six.int2byte(codec),
+                         constants.NOBLOCK | constants.SNDMORE)
+        self.socket.send(header, constants.NOBLOCK | constants.SNDMORE)
+        size = len(header)
+        for arr in pickler.buffers:
+            data = memoryview(arr.reshape(-1).view(numpy.uint8))
+            if codec > 0:
+                data = ZmqConnection.compress(codec, data)
+            else:
+                # ZeroMQ sends the frame after send() returns, while the
+                # caller is free to overwrite the array, e.g. in the next job
+                data = data.tobytes()
+            size += len(data)
+            self.socket.send(
+                data, constants.NOBLOCK | constants.SNDMORE, copy=False)
+        self._send_end_marker(last, stats)
+        return size
+
+    def _send_pickled(self, message, last, compression, io, out_of_band=False,
+                      stats=None):
         if self.shutted_down:
             return
 
@@ -531,9 +735,7 @@ class ZmqConnection(Logger):
             pickle.dump(message, file, protocol=best_protocol)
 
         def send_pickle_end_marker():
-            self.socket.send(
-                ZmqConnection.PICKLE_END,
-                constants.NOBLOCK | (constants.SNDMORE if not last else 0))
+            self._send_end_marker(last, stats)
 
         def send_to_socket():
             send_pickle_beg_marker(codec)
@@ -541,9 +743,13 @@ class ZmqConnection(Logger):
             dump(pickler)
             pickler.flush()
             send_pickle_end_marker()
+            if stats is not None:
+                stats["raw"] += pickler.raw_size
             return pickler.size
 
         if io is None:
+            if out_of_band:
+                return self._send_out_of_band(message, last, codec, stats)
             return send_to_socket()
         else:
             try:
@@ -558,8 +764,7 @@ class ZmqConnection(Logger):
                 send_pickle_end_marker()
                 return new_pos - initial_pos
             except ValueError:
-                send_to_socket()
-                raise ZmqConnection.IOOverflow()
+                raise ZmqConnection.IOOverflow(send_to_socket())
 
     def messageReceived(self, message):
         """
@@ -85,9 +85,29 @@ class SharedIO(object):
             self.__init_file_methods()
         else:
             self.__init__(name, size)
+            # the previous generation of the same channel is not needed
+            family = SharedIO.family(name)
+            if family:
+                SharedIO.forget(family)
             SharedIO.CACHE["%s:%d" % (name, size)] = self
         self.seek(state["pos"])
 
+    @staticmethod
+    def family(name):
+        """Returns the name of the :class:`SharedIOChannel` which created
+        the segment with the specified name or an empty string.
+        """
+        return name.rpartition(".")[0]
+
+    @staticmethod
+    def forget(family):
+        """Drops the cached segments which belong to the specified
+        :class:`SharedIOChannel`.
+        """
+        for key in list(SharedIO.CACHE):
+            if SharedIO.family(key.rpartition(":")[0]) == family:
+                del SharedIO.CACHE[key]
+
     @property
     def name(self):
         return self.shmem.name
@@ -103,3 +123,66 @@ class SharedIO(object):
     def __init_file_methods(self):
         for name in ("read", "readline", "write", "tell", "close", "seek"):
             setattr(self, name, getattr(self.file, name))
+
+
+class SharedIOChannel(object):
+    """
+    Holds the :class:`SharedIO` which carries pickles in one direction between
+    two processes on the same host. The segment is recreated bigger after
+    an overflow and smaller after it stays underused for SHRINK_AFTER
+    messages in a row. Each segment has a new name, so the other side never
+    maps a segment which is being resized.
+    """
+
+    RESERVE = 0.05
+    SHRINK_RATIO = 0.5
+    SHRINK_AFTER = 8
+    MIN_SIZE = 1 << 16
+
+    def __init__(self, family):
+        self.family = family
+        self.io = None
+        self._generation = 0
+        self._underused = 0
+
+    @property
+    def size(self):
+        return self.io.size if self.io is not None else 0
+
+    def acquire(self):
+        """
+        Returns the :class:`SharedIO` to write the next message to or None.
+        """
+        if self.io is not None:
+            self.io.seek(0)
+        return self.io
+
+    def commit(self, size, overflow=False):
+        """
+        Adjusts the segment after the message with pickles of the specified
+        size was sent.
+        """
+        if overflow or self.io is None:
+            self._allocate(size)
+            return
+        if size < self.io.size * SharedIOChannel.SHRINK_RATIO:
+            self._underused += 1
+            if self._underused >= SharedIOChannel.SHRINK_AFTER:
+                self._allocate(size)
+        else:
+            self._underused = 0
+
+    def close(self):
+        self.io = None
+        self._underused = 0
+
+    def _allocate(self, size):
+        size = max(SharedIOChannel.MIN_SIZE,
+                   int(size * (1.0 + SharedIOChannel.RESERVE)))
+        if size == self.size:
+            self._underused = 0
+            return
+        # unlink the old segment before the new one is created
+        self.close()
+        self._generation += 1
+        self.io = SharedIO("%s.%d" % (self.family, self._generation), size)
@@ -35,6 +35,7 @@ under the License.
 """
 
 import threading
+import time
 import uuid
 import weakref
 import sys
@@ -52,6 +53,7 @@ from veles.mutable import Bool, LinkableAttribute
 from veles.prng.random_generator import RandomGenerator
 import veles.thread_pool as thread_pool
 from veles.timeit2 import timeit
+import veles.tracing as tracing
 from veles.unit_registry import UnitRegistry
 from veles.verified import Verified
 
@@ -104,6 +106,52 @@ class RunAfterStopError(UnitException):
     pass
 
 
+class ExecutionPlan(object):
+    """The precompiled control flow of a single unit: the sorted successors,
+    each with the index of the unit among its predecessors, and the activation
+    flags of the unit's own predecessors. See :meth:`Unit.compile_plan`.
+    """
+    __slots__ = ("successors", "fan_out", "predecessors", "flags", "pending")
+
+    def __init__(self, unit):
+        self.successors = tuple(
+            (dst, ExecutionPlan._index(dst.links_from_sorted, unit))
+            for dst in unit.links_to_sorted)
+        self.fan_out = len(self.successors) > 1
+        self.predecessors = tuple(unit.links_from_sorted)
+        self.flags = [unit.links_from.get(
+            src, unit.links_from.get(weakref.ref(src), False))
+            for src in self.predecessors]
+        self.pending = self.flags.count(False)
+
+    def activate(self, index):
+        """Sets the activation flag of the predecessor with the specified
+        index.
+
+        Returns:
+            True if all the predecessors have been activated; the flags are
+            reset then. Otherwise, False.
+        """
+        flags = self.flags
+        if not flags[index]:
+            flags[index] = True
+            self.pending -= 1
+        if self.pending > 0:
+            return False
+        self.reset()
+        return True
+
+    def reset(self):
+        self.flags[:] = [False] * len(self.flags)
+        self.pending = len(self.flags)
+
+    @staticmethod
+    def _index(units, unit):
+        for index, other in enumerate(units):
+            if other is unit:
+                return index
+
+
 @six.add_metaclass(UnitRegistry)
 class Unit(Distributable, Verified):
     hide_from_registry = True
@@ -112,6 +160,8 @@ class Unit(Distributable, Verified):
     Attributes:
         _links_from: dictionary of units it depends on.
         _links_to: dictionary of dependent units.
+        _data_links_from: ids of the units which link_attrs() took
+                          attributes from.
         _pool: the unique ThreadPool instance.
         _pool_lock_: the lock for getting/setting _pool.
         timers: performance timers for run().
@@ -133,6 +183,7 @@ class Unit(Distributable, Verified):
         self._id = str(uuid.uuid4())
         self._links_from = {}
         self._links_to = {}
+        self._data_links_from = set()
         super(Unit, self).__init__(**kwargs)
         validate_kwargs(self, **kwargs)
         self.verify_interface(IUnit)
@@ -167,7 +218,8 @@ class Unit(Distributable, Verified):
         def wrap_to_measure_time(name):
             func = getattr(self, name, None)
             if func is not None:
-                setattr(self, name, self._measure_time(func, Unit.timers))
+                setattr(self, name,
+                        self._measure_time(func, Unit.timers, name))
 
         # Important: these 4 decorator applications must stand before
         # super(...).init_unpickled since it will call
@@ -179,12 +231,16 @@ class Unit(Distributable, Verified):
         super(Unit, self).init_unpickled()
         self._gate_lock_ = threading.Lock()
         self._run_lock_ = threading.Lock()
+        self._plan_ = None
+        if not hasattr(self, "_data_links_from"):
+            # restored from an older snapshot
+            self._data_links_from = set()
         self._is_initialized = False
         self._stopped_ = False
         if hasattr(self, "run"):
             self.run = self._check_run_conditions(self.run)
             self.run = self._track_call(self.run, "run_was_called")
-            self.run = self._measure_time(self.run, Unit.timers)
+            self.run = self._measure_time(self.run, Unit.timers, "run")
         if hasattr(self, "initialize"):
             self.initialize = self._ensure_reproducible_rg(self.initialize)
             self.initialize = self._retry_call(
@@ -236,6 +292,11 @@ class Unit(Distributable, Verified):
             for name in "_links_from", "_links_to":
                 state[name] = {u: v for u, v in getattr(self, name).items()
                                if not isinstance(u, weakref.ReferenceType)}
+            if self._plan_ is not None:
+                # the activation flags are tracked by the plan
+                flags = dict(zip(self._plan_.predecessors, self._plan_.flags))
+                state["_links_from"] = {u: flags.get(u, v) for u, v in
+                                        state["_links_from"].items()}
         return state
 
     def __repr__(self):
@@ -277,6 +338,14 @@ class Unit(Distributable, Verified):
     def links_to_sorted(self):
         return Unit._sorted_links(self.links_to)
 
+    @property
+    def plan(self):
+        """
+        :return: The compiled :class:`ExecutionPlan` or None if the control
+        flow is dynamic. See compile_plan().
+        """
+        return self._plan_
+
     @property
     def gate_block(self):
         return self._gate_block
@@ -487,6 +556,10 @@ class Unit(Distributable, Verified):
         """
         if self.stopped and not isinstance(self, Container):
             return
+        plan = self._plan_
+        if plan is not None:
+            self._run_dependent_planned(plan)
+            return
         links = self.links_to_sorted
         # We must create a copy of gate_block-s because they can change
         # while the loop is working
@@ -504,6 +577,46 @@ class Unit(Distributable, Verified):
                     self.thread_pool.start()
                 self.thread_pool.callInThread(dst._check_gate_and_run, self)
 
+    def _run_dependent_planned(self, plan):
+        successors = plan.successors
+        gate_blocks = [bool(dst.gate_block) for dst, _ in successors]
+        for (dst, index), gate_block in zip(successors, gate_blocks):
+            if gate_block or dst.gate_block:
+                continue
+            if root.common.trace.run:
+                self.debug("%s -> %s (planned) @%s", self, dst,
+                           threading.current_thread().name)
+            if not plan.fan_out:
+                dst._check_gate_and_run(self, index)
+            else:
+                if not self.thread_pool.started:
+                    self.thread_pool.start()
+                self.thread_pool.callInThread(
+                    dst._check_gate_and_run, self, index)
+
+    def compile_plan(self):
+        """Precomputes the sorted successors and the predecessor indices, so
+        that run_dependent() and the gate checks do not sort and walk the
+        link dictionaries on every step. Only the units with several
+        predecessors take the gate lock then. The plan is discarded as soon
+        as any link of the unit or of its successors changes.
+        """
+        self._plan_ = ExecutionPlan(self)
+        return self._plan_
+
+    def discard_plan(self):
+        """Returns to the dynamic control flow. The successors' indices of
+        this unit are stored in the plans of its predecessors, so they are
+        discarded, too. So are the plans of its successors: this unit
+        notifies them without the index from now on, and they must not mix
+        the dynamic gate with the compiled activation flags.
+        """
+        self._plan_ = None
+        for links in self.links_from, self.links_to:
+            for other in self._iter_links(links):
+                if other is not None:
+                    other._plan_ = None
+
     def dependent_units(self, with_open_gate=False):
         yield self
         walk = []
@@ -545,10 +658,13 @@ class Unit(Distributable, Verified):
     def close_gate(self):
         with self._gate_lock_:
             self._close_gate()
+            if self._plan_ is not None:
+                self._plan_.reset()
 
     def close_upstream(self):
         for other in self._iter_links(self.links_to):
             self._set_links_value(other.links_from, self, False)
+            other.discard_plan()
         return self
 
     def link_from(self, *args):
@@ -556,6 +672,7 @@ class Unit(Distributable, Verified):
         """
         with self._gate_lock_:
             for src in args:
+                src.discard_plan()
                 self.links_from[src] = False
                 if self._find_reference_cycle():
                     del self.links_from[src]
@@ -565,11 +682,13 @@ class Unit(Distributable, Verified):
                 else:
                     with src._gate_lock_:
                         src.links_to[weakref.ref(self)] = False
+        self.discard_plan()
         return self
 
     def unlink_from(self, *args):
         """Unlinks self from src.
         """
+        self.discard_plan()
         with self._gate_lock_:
             for src in args:
                 with src._gate_lock_:
@@ -588,6 +707,7 @@ class Unit(Distributable, Verified):
         """
         Detaches all previous units from this one.
         """
+        self.discard_plan()
         with self._gate_lock_:
             for src in self._iter_links(self.links_from):
                 with src._gate_lock_:
@@ -601,6 +721,7 @@ class Unit(Distributable, Verified):
         """
         with self._gate_lock_:
             for dst in self._iter_links(self.links_to):
+                dst.discard_plan()
                 with dst._gate_lock_:
                     self._del_link(dst.links_from, self)
             self.links_to.clear()
@@ -774,16 +895,25 @@ class Unit(Distributable, Verified):
             self.error("Unable to link %s.%s to %s.%s",
                        other, yours, self, mine)
             raise from_none(e)
+        if isinstance(other, Unit):
+            self._data_links_from.add(other.id)
         if Unit.is_immutable(attr):
             LinkableAttribute(self, mine, (other, yours), two_way=two_way)
         else:
             setattr(self, mine, attr)
 
-    def _check_gate_and_run(self, src):
-        """Check gate state and run if it is open.
+    def _check_gate_and_run(self, src, index=None):
+        """Check gate state and run if it is open. index is the position of
+        src among the predecessors in the compiled plan.
         """
-        if not self.open_gate(src):  # gate has priority over skip
-            return
+        plan = self._plan_
+        if plan is None or index is None:
+            if not self.open_gate(src):  # gate has priority over skip
+                return
+        elif not self.ignores_gate and len(plan.flags) > 1:
+            with self._gate_lock_:
+                if not plan.activate(index):
+                    return
         if self.thread_pool.failure is not None:
             # something went wrong in the thread pool
             return
@@ -802,11 +932,15 @@ class Unit(Distributable, Verified):
                 self._run_lock_.release()
         self.run_dependent()
 
-    def _measure_time(self, fn, storage):
+    def _measure_time(self, fn, storage, method=None):
         def wrapped_measure_time(*args, **kwargs):
             res, delta = timeit(fn, *args, **kwargs)
             if self.id in storage:
                 storage[self.id] += delta
+            if tracing.enabled:
+                end = time.time()
+                tracing.get().span("%s.%s" % (self.name, method), category,
+                                   end - delta, delta)
             if self.timings:
                 self.debug("%s took %.6f sec", fn.__name__, delta)
             return res
@@ -814,6 +948,8 @@ class Unit(Distributable, Verified):
         name = getattr(fn, '__name__',
                        getattr(fn, 'func', wrapped_measure_time).__name__)
         wrapped_measure_time.__name__ = name + '_measure_time'
+        method = method or name
+        category = self.__class__.__name__
         return wrapped_measure_time
 
     def _check_run_conditions(self, fn):
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Oct 18, 2026
+
+Lossy codecs which shrink the float arrays in the slave updates.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import namedtuple
+import numpy
+from six import add_metaclass
+
+from veles.mapped_object_registry import MappedObjectsRegistry
+import veles.prng as prng
+
+
+class EncodedArray(namedtuple(
+        "EncodedArrayTuple", ["codec", "shape", "dtype", "payload"])):
+    """
+    Replaces a numpy array in the update sent to the master.
+    """
+
+
+class UpdateCodecRegistry(MappedObjectsRegistry):
+    mapping = "update_codecs"
+
+
+@add_metaclass(UpdateCodecRegistry)
+class UpdateCodec(object):
+    """
+    Base class of the lossy update codecs. Floating point arrays with at least
+    min_size elements are encoded, everything else passes through as is.
+    Lists, tuples and dicts are walked recursively; the path to each array is
+    the key for the codecs which keep state between the updates.
+    """
+
+    def __init__(self, min_size=1 << 12, **kwargs):
+        super(UpdateCodec, self).__init__()
+        self.min_size = min_size
+
+    def encode(self, data, path=()):
+        if isinstance(data, numpy.ndarray):
+            if data.dtype.kind != "f" or data.size < self.min_size:
+                return data
+            return EncodedArray(self.MAPPING, data.shape, data.dtype.str,
+                                self.encode_array(data, path))
+        if isinstance(data, list):
+            return [self.encode(d, path + (i,)) for i, d in enumerate(data)]
+        if isinstance(data, tuple) and not isinstance(data, EncodedArray):
+            items = (self.encode(d, path + (i,)) for i, d in enumerate(data))
+            if hasattr(data, "_fields"):
+                return type(data)(*items)
+            return tuple(items)
+        if isinstance(data, dict):
+            return {k: self.encode(v, path + (k,)) for k, v in data.items()}
+        return data
+
+    def encode_array(self, arr, path):
+        raise NotImplementedError()
+
+    @staticmethod
+    def decode_array(payload, shape, dtype):
+        raise NotImplementedError()
+
+
+def decode_update(data):
+    """
+    Restores the arrays which were encoded by :class:`UpdateCodec`. Runs on
+    the master, so it does not depend on the local configuration.
+    """
+    if isinstance(data, EncodedArray):
+        codec = UpdateCodecRegistry.update_codecs[data.codec]
+        return codec.decode_array(data.payload, data.shape,
+                                  numpy.dtype(data.dtype))
+    if isinstance(data, list):
+        return [decode_update(d) for d in data]
+    if isinstance(data, tuple):
+        items = (decode_update(d) for d in data)
+        if hasattr(data, "_fields"):
+            return type(data)(*items)
+        return tuple(items)
+    if isinstance(data, dict):
+        return {k: decode_update(v) for k, v in data.items()}
+    return data
+
+
+class Float16Codec(UpdateCodec):
+    """
+    Rounds the values to half precision.
+    """
+    MAPPING = "fp16"
+
+    def encode_array(self, arr, path):
+        return arr.astype(numpy.float16)
+
+    @staticmethod
+    def decode_array(payload, shape, dtype):
+        return payload.astype(dtype).reshape(shape)
+
+
+class TopKCodec(UpdateCodec):
+    """
+    Sends only the ratio of the values with the largest magnitudes. The
+    values which were not sent are added to the next update of the same
+    array (error feedback), so nothing is lost in the long run.
+    """
+    MAPPING = "topk"
+
+    def __init__(self, ratio=0.01, **kwargs):
+        super(TopKCodec, self).__init__(**kwargs)
+        if not 0 < ratio <= 1:
+            raise ValueError("ratio must be in (0, 1] (got %s)" % ratio)
+        self.ratio = ratio
+        self.residuals = {}
+
+    def encode_array(self, arr, path):
+        flat = arr.ravel()
+        residual = self.residuals.get(path)
+        if residual is not None and residual.shape == flat.shape:
+            flat = flat + residual
+        else:
+            flat = flat.copy()
+        k = max(1, int(flat.size * self.ratio))
+        indices = numpy.argpartition(numpy.abs(flat), flat.size - k)[-k:]
+        indices = indices.astype(
+            numpy.uint32 if flat.size <= numpy.iinfo(numpy.uint32).max
+            else numpy.uint64)
+        values = flat[indices]
+        flat[indices] = 0
+        self.residuals[path] = flat
+        return indices, values
+
+    @staticmethod
+    def decode_array(payload, shape, dtype):
+        indices, values = payload
+        arr = numpy.zeros(int(numpy.prod(shape)), dtype=dtype)
+        arr[indices] = values
+        return arr.reshape(shape)
+
+
+class StochasticInt8Codec(UpdateCodec):
+    """
+    Scales the values to [-127, 127] and rounds them up or down randomly with
+    the probabilities which make the result unbiased.
+    """
+    MAPPING = "int8"
+
+    def encode_array(self, arr, path):
+        scale = float(numpy.max(numpy.abs(arr))) / 127
+        if scale == 0:
+            return scale, numpy.zeros(arr.size, dtype=numpy.int8)
+        scaled = arr.ravel() / scale
+        scaled += prng.get("update_codecs").random_sample(scaled.size)
+        numpy.floor(scaled, out=scaled)
+        numpy.clip(scaled, -127, 127, out=scaled)
+        return scale, scaled.astype(numpy.int8)
+
+    @staticmethod
+    def decode_array(payload, shape, dtype):
+        scale, values = payload
+        return (values.astype(dtype) * dtype.type(scale)).reshape(shape)
@@ -46,6 +46,7 @@ import weakref
 import numpy
 import os
 import six
+from six.moves import queue
 import sys
 import tarfile
 import tempfile
@@ -60,13 +61,17 @@ from veles.distributable import IDistributable
 from veles.error import VelesException
 from veles.mutable import LinkableAttribute
 from veles.json_encoders import NumpyJSONEncoder
+from veles.memory import Array
 from veles.result_provider import IResultProvider
 from veles.units import Unit, IUnit, Container
+from veles.update_codecs import UpdateCodecRegistry, decode_update
 from veles.plumbing import StartPoint, EndPoint, Repeater
+from veles.prng.random_generator import RandomGenerator
 from veles.external.prettytable import PrettyTable
 from veles.external.progressbar import ProgressBar, Percentage, Bar
 import veles.external.pydot as pydot
 from veles.timeit2 import timeit
+import veles.tracing as tracing
 
 
 class MultiMap(OrderedDict, defaultdict):
@@ -96,6 +101,7 @@ class Workflow(Container):
         _run_time: the total time workflow has been running for.
         _method_time: Workflow's method timings measured by method_timed
                       decorator. Used mainly to profile master-slave.
+        _initialize_time_: the time each unit's initialize() took.
     """
     hide_from_registry_all = True
     json_encoder = NumpyJSONEncoder
@@ -131,6 +137,9 @@ class Workflow(Container):
         self._sync_event_.set()
         self._run_time_ = 0
         self._method_time_ = {"run": 0}
+        self._initialize_time_ = {}
+        self._initialize_real_time_ = 0
+        self._update_codec_ = None
         del Unit.timers[self.id]
         units = self._units
         self._units = MultiMap()
@@ -313,7 +322,14 @@ class Workflow(Container):
         self.info("Initializing units in %s...", self.name)
         progress.start()
         units_in_dependency_order = list(self.units_in_dependency_order)
-        iqueue = list(units_in_dependency_order)
+        self._initialize_time_ = {}
+        started = time.time()
+        concurrently = self._initializes_concurrently(kwargs.get("device"))
+        if concurrently:
+            iqueue = self._initialize_concurrently(
+                units_in_dependency_order, progress, maxlen, kwargs)
+        else:
+            iqueue = list(units_in_dependency_order)
         while len(iqueue) > 0:
             unit = iqueue.pop(0)
             # Early abort in case of KeyboardInterrupt
@@ -321,20 +337,11 @@ class Workflow(Container):
                 break
             progress.widgets[-1] = unit.name + ' ' * (maxlen - len(unit.name))
             progress.update()
-            if not self.is_standalone:
-                unit.verify_interface(IDistributable)
-            try:
-                partially = unit.initialize(**kwargs)
-            except:
-                self.error("Unit \"%s\" failed to initialize", unit.name)
-                raise
-            if partially:
+            if self._initialize_unit(unit, kwargs):
                 iqueue.append(unit)
             else:
-                if self.restored_from_snapshot and not unit._remembers_gates:
-                    unit.close_gate()
-                    unit.close_upstream()
                 progress.inc()
+        self._initialize_real_time_ = time.time() - started
         progress.widgets[-1] = fin_text + ' ' * (maxlen - len(fin_text))
         progress.finish()
         initialized_units_number = len(units_in_dependency_order)
@@ -343,6 +350,159 @@ class Workflow(Container):
                          units_number - initialized_units_number,
                          set(self) - set(units_in_dependency_order))
         self._restored_from_snapshot_ = None
+        if root.common.engine.compiled_plan:
+            self.compile_plan()
+        if concurrently:
+            self.print_initialize_stats()
+
+    def _initialize_unit(self, unit, kwargs):
+        """Initializes a single unit and measures the time it took.
+
+        Returns:
+            True if the unit was initialized partially and must be retried
+            after the rest; otherwise, False.
+        """
+        if not self.is_standalone:
+            unit.verify_interface(IDistributable)
+        try:
+            partially, delta = timeit(unit.initialize, **kwargs)
+        except:
+            self.error("Unit \"%s\" failed to initialize", unit.name)
+            raise
+        self._initialize_time_[unit] = \
+            self._initialize_time_.get(unit, 0) + delta
+        if tracing.enabled:
+            tracing.get().span("%s.initialize" % unit.name,
+                               unit.__class__.__name__, time.time() - delta,
+                               delta)
+        if not partially and self.restored_from_snapshot and \
+                not unit._remembers_gates:
+            unit.close_gate()
+            unit.close_upstream()
+        return partially
+
+    def _initializes_concurrently(self, device):
+        if not root.common.engine.concurrent_initialize or not self.is_main:
+            # The nested workflows would block the pool threads
+            return False
+        pool = self.thread_pool
+        if device is not None and not device.is_attached(pool):
+            if pool.started:
+                # The running threads would miss the device context
+                self.debug("The thread pool is already running, the units "
+                           "are initialized one by one")
+                return False
+            device.thread_pool_attach(pool)
+        if not pool.started:
+            pool.start()
+        return True
+
+    def initialization_dependencies(self, units):
+        """Builds the dependency graph of the initialization from the
+        sequential order: each unit waits for the preceding units which it is
+        linked from, either by control or by link_attrs(), for the previous
+        holder of each of its Array-s (the attributes assigned directly, e.g.
+        unit.input = other.output) and for the previous user of each of its
+        random generators (so that the random numbers are drawn in the same
+        order). Containers are barriers. Any other object which is shared by
+        a direct assignment is not tracked; such units must be linked.
+
+        Arguments:
+            units: the units in the sequential initialization order.
+
+        Returns:
+            dict unit -> set of the units it waits for.
+        """
+        order = {unit: index for index, unit in enumerate(units)}
+        ids = {unit.id: unit for unit in units}
+        last_user = {}
+        barrier = None
+        graph = {}
+        for index, unit in enumerate(units):
+            if isinstance(unit, Container):
+                graph[unit] = set(units[:index])
+                barrier = unit
+                continue
+            deps = set(unit.links_from_sorted)
+            deps.update(ids.get(uid) for uid in unit._data_links_from)
+            for value in unit.__dict__.values():
+                if isinstance(value, (Array, RandomGenerator)):
+                    deps.add(last_user.get(id(value)))
+                    last_user[id(value)] = unit
+            deps.add(barrier)
+            graph[unit] = {dep for dep in deps
+                           if dep in order and order[dep] < index}
+        return graph
+
+    def _initialize_concurrently(self, units, progress, maxlen, kwargs):
+        """Initializes the independent units on the thread pool (see
+        initialization_dependencies()). The units are considered initialized
+        for their dependents even if they ask to be retried, same as in the
+        sequential order.
+
+        Returns:
+            The list of the partially initialized units to retry.
+        """
+        graph = self.initialization_dependencies(units)
+        dependents = defaultdict(list)
+        for unit in units:
+            for dep in graph[unit]:
+                dependents[dep].append(unit)
+        waits = {unit: len(graph[unit]) for unit in units}
+        results = queue.Queue()
+
+        def initialize(unit):
+            try:
+                results.put((unit, self._initialize_unit(unit, kwargs), None))
+            except Exception as e:
+                results.put((unit, None, e))
+
+        retry = []
+        error = None
+        in_flight = 0
+        ready = [unit for unit in units if waits[unit] == 0]
+        while ready or in_flight:
+            if error is None and not self.thread_pool.joined:
+                for unit in ready:
+                    self.thread_pool.callInThread(initialize, unit)
+                in_flight += len(ready)
+            ready = []
+            try:
+                unit, partially, exc = results.get(timeout=1)
+            except queue.Empty:
+                if self.thread_pool.joined:
+                    # Early abort in case of KeyboardInterrupt
+                    break
+                continue
+            in_flight -= 1
+            if exc is not None:
+                error = error or exc
+                continue
+            if partially:
+                retry.append(unit)
+            else:
+                progress.inc()
+            progress.widgets[-1] = unit.name + ' ' * (maxlen - len(unit.name))
+            progress.update()
+            for dst in dependents[unit]:
+                waits[dst] -= 1
+                if waits[dst] == 0:
+                    ready.append(dst)
+        if error is not None:
+            raise error
+        # Keep the sequential order of the retries
+        return sorted(retry, key=units.index)
+
+    def compile_plan(self):
+        """Compiles the control flow plans of this workflow and of all its
+        units (see :meth:`veles.units.Unit.compile_plan`). The units fall
+        back to the dynamic control flow if the links change afterwards.
+        """
+        plan = super(Workflow, self).compile_plan()
+        for unit in self:
+            unit.compile_plan()
+        self.debug("Compiled the control flow of %d units", len(self))
+        return plan
 
     def run(self):
         """Starts executing the workflow. This function is synchronous
@@ -449,16 +609,35 @@ class Workflow(Container):
         wrapped.__name__ = name + '_method_timed'
         return wrapped
 
+    @property
+    def update_codec(self):
+        """The lossy codec of the updates sent to the master or None.
+        """
+        name = root.common.engine.update_codec
+        if not name:
+            return None
+        if self._update_codec_ is None or \
+                self._update_codec_.MAPPING != name:
+            self._update_codec_ = UpdateCodecRegistry.update_codecs[name](
+                min_size=root.common.engine.update_codec_min_size,
+                ratio=root.common.engine.update_topk_ratio)
+        return self._update_codec_
+
     @run_timed
     @method_timed
     def generate_data_for_master(self):
         data = []
         self.debug("Generating the update for master...")
         self.event("generate_data", "begin")
-        for unit in self.units_in_dependency_order:
+        codec = self.update_codec
+        for index, unit in enumerate(self.units_in_dependency_order):
             if not unit.negotiates_on_connect:
                 try:
-                    data.append(unit.generate_data_for_master())
+                    update = unit.generate_data_for_master()
+                    if codec is not None and getattr(
+                            unit, "lossy_updates", True):
+                        update = codec.encode(update, (index,))
+                    data.append(update)
                 except:
                     self.error("Unit %s failed to generate data for master",
                                unit)
@@ -530,12 +709,15 @@ class Workflow(Container):
         if not isinstance(data, list):
             raise ValueError("data must be a list")
         sid = slave.id if slave is not None else "self"
+        if self._drops_update_from(slave):
+            self.info("Ignored the duplicate update from slave %s", sid)
+            return False
         self.debug("Applying the update from slave %s", sid)
         self.event("apply_data", "begin", slave=sid)
         for i, unit in enumerate(self.units_in_dependency_order):
             if data[i] is not None and not unit.negotiates_on_connect:
                 try:
-                    unit.apply_data_from_slave(data[i], slave)
+                    unit.apply_data_from_slave(decode_update(data[i]), slave)
                 except:
                     self.error("Unit %s failed to apply data from slave", unit)
                     raise
@@ -543,6 +725,58 @@ class Workflow(Container):
         self.debug("Done with applying the update from slave %s", sid)
         return True
 
+    @run_timed
+    @method_timed
+    def apply_data_from_slaves(self, updates):
+        """Applies several updates at once. The units which updates commute
+        receive a single merged update, the rest get them one by one in the
+        original order.
+
+        Parameters:
+            updates: the list of (data, slave) tuples.
+
+        Returns:
+            The list of the results of :meth:`apply_data_from_slave` for
+            each update: False if it was dropped as a duplicate,
+            otherwise True.
+        """
+        for data, _ in updates:
+            if not isinstance(data, list):
+                raise ValueError("data must be a list")
+        with self._data_lock_:
+            applied = [not self._drops_update_from(slave)
+                       for _, slave in updates]
+            updates = [update for update, ok in zip(updates, applied) if ok]
+            sids = [slave.id if slave is not None else "self"
+                    for _, slave in updates]
+            self.debug("Applying %d updates from slaves %s", len(updates),
+                       sids)
+            self.event("apply_data", "begin", slaves=sids)
+            for i, unit in enumerate(self.units_in_dependency_order):
+                if unit.negotiates_on_connect:
+                    continue
+                unit_updates = [(decode_update(data[i]), slave)
+                                for data, slave in updates
+                                if data[i] is not None]
+                if len(unit_updates) == 0:
+                    continue
+                try:
+                    if len(unit_updates) > 1 and \
+                            getattr(unit, "updates_commute", False):
+                        unit.apply_data_from_slave(
+                            unit.merge_data_from_slaves(
+                                [u for u, _ in unit_updates]), None)
+                        continue
+                    for update, slave in unit_updates:
+                        unit.apply_data_from_slave(update, slave)
+                except:
+                    self.error("Unit %s failed to apply data from slaves",
+                               unit)
+                    raise
+        self.event("apply_data", "end", slaves=sids)
+        self.debug("Done with applying %d updates", len(updates))
+        return applied
+
     @run_timed
     @method_timed
     def drop_slave(self, slave):
@@ -571,6 +805,13 @@ class Workflow(Container):
     run_timed = staticmethod(run_timed)
     method_timed = staticmethod(method_timed)
 
+    def _drops_update_from(self, slave):
+        if slave is None:
+            return False
+        # every unit must see the update to forget it
+        return any([unit.drops_update_from(slave) for unit in self
+                    if not unit.negotiates_on_connect])
+
     def generate_initial_data_for_master(self):
         data = []
         self.debug("Generating the initial data for master...")
@@ -781,6 +1022,44 @@ class Workflow(Container):
             timers[uid] += value
         return sorted(timers.items(), key=lambda x: x[1], reverse=True)
 
+    def get_unit_initialize_time_stats(self, by_name=False):
+        """
+        Returns an iterable of tuples of length 2. First element is the unit
+        identifier, second is the time initialize() took.
+        :param by_name: If True, use unit name as identifier; otherwise, \
+            unit class name.
+        """
+        timers = defaultdict(int)
+        for unit, value in self._initialize_time_.items():
+            timers[unit.__class__.__name__ if not by_name else unit.name] += \
+                value
+        return sorted(timers.items(), key=lambda x: x[1], reverse=True)
+
+    def print_initialize_stats(self, by_name=False, top_number=5):
+        """Outputs the time statistics of the last initialize().
+        """
+        stats = self.get_unit_initialize_time_stats(by_name)
+        time_all = sum(s[1] for s in stats)
+        if time_all <= 0:
+            return
+        table = PrettyTable("#", "%", "time", "unit")
+        table.align["unit"] = "l"
+        top_time = 0
+        for i in range(1, min(top_number, len(stats)) + 1):
+            top_time += stats[i - 1][1]
+            table.add_row(i, int(stats[i - 1][1] * 100 / time_all),
+                          datetime.timedelta(seconds=stats[i - 1][1]),
+                          stats[i - 1][0])
+        table.add_row(u"Σ", int(top_time * 100 / time_all),
+                      datetime.timedelta(seconds=top_time),
+                      "Top %d" % top_number)
+        self.info(u"Unit initialization time statistics top:\n%s", table)
+        table = PrettyTable("units", "real", u"η,%")
+        table.add_row(datetime.timedelta(seconds=time_all),
+                      datetime.timedelta(seconds=self._initialize_real_time_),
+                      int(time_all * 100 / (self._initialize_real_time_ or 1)))
+        self.info(u"Total initialization time:\n%s", table)
+
     def print_stats(self, by_name=False, top_number=5):
         """Outputs various time statistics gathered with run_timed and
         method_timed.